@@ -38,6 +38,8 @@ Copy-Item -Path "./godot_viewer" -Destination "./io_export_webgo/godot_viewer" -
 
 # Clean-up unnecessary (and zip-destroying) stuff from the copied godot project
 Remove-Item "./io_export_webgo/godot_app" -Recurse -Force
+Remove-Item "./io_export_webgo/export_cache" -Recurse -Force
+Remove-Item "./io_export_webgo/workspaces" -Recurse -Force
 Remove-Item "./io_export_webgo/__pycache__" -Recurse -Force
 Remove-Item "./io_export_webgo/godot_viewer/.godot" -Recurse -Force
 
@@ -39,9 +39,13 @@ cp -r "./godot_viewer" "./io_export_webgo/godot_viewer"
 
 # Clean-up unnecessary (and zip-destroying) stuff from the copied godot project
 # PS> Remove-Item "./io_export_webgo/godot_app" -Recurse -Force
+# PS> Remove-Item "./io_export_webgo/export_cache" -Recurse -Force
+# PS> Remove-Item "./io_export_webgo/workspaces" -Recurse -Force
 # PS> Remove-Item "./io_export_webgo/__pycache__" -Recurse -Force
 # PS> Remove-Item "./io_export_webgo/godot_viewer/.godot" -Recurse -Force
 rm -rf "./io_export_webgo/godot_app"
+rm -rf "./io_export_webgo/export_cache"
+rm -rf "./io_export_webgo/workspaces"
 rm -rf "./io_export_webgo/__pycache__"
 rm -rf "./io_export_webgo/godot_viewer/.godot"
 
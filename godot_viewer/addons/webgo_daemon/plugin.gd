@@ -0,0 +1,163 @@
+@tool
+extends EditorPlugin
+
+# Keeps a headless Godot editor running to export packs on request of the
+# Blender add-on. Only active if the editor was started with
+#   godot --headless --editor --path <project> -- --webgo-daemon-port=<port>
+# Requests and replies are single-line JSON objects over a local TCP connection:
+#   {"cmd": "ping"}
+#   {"cmd": "export_pack", "target": "<abs path>/index.pck", "reimport": ["res://model/model.glb"]}
+#   {"cmd": "quit"}
+
+const PORT_ARG = "--webgo-daemon-port="
+
+# Not part of the exported pack (same as the exclude_filter of the Web export preset)
+const EXCLUDED_DIRS = ["res://.godot", "res://export", "res://addons"]
+const EXCLUDED_FILES = ["export_presets.cfg", ".gitignore", ".gitattributes"]
+
+# Generated by the editor but needed at runtime
+const EXTRA_FILES = ["res://.godot/global_script_class_cache.cfg", "res://.godot/uid_cache.bin"]
+
+var server : TCPServer = null
+var peers = []    # StreamPeerTCP connections
+var buffers = []  # PackedByteArray of not yet handled input per connection
+
+
+func _enter_tree():
+	var port = 0
+	for arg in OS.get_cmdline_user_args():
+		if arg.begins_with(PORT_ARG):
+			port = int(arg.substr(PORT_ARG.length()))
+	if port == 0:
+		# Regular editor session or one-shot export: do nothing
+		set_process(false)
+		return
+
+	server = TCPServer.new()
+	var err = server.listen(port, "127.0.0.1")
+	if err != OK:
+		printerr("webgo daemon: cannot listen on port ", port, " (error ", err, ")")
+		get_tree().quit(1)
+		return
+	print("webgo daemon: listening on port ", port)
+	set_process(true)
+
+
+func _exit_tree():
+	if server:
+		server.stop()
+		server = null
+
+
+func _process(_delta):
+	if server == null:
+		return
+	while server.is_connection_available():
+		peers.append(server.take_connection())
+		buffers.append(PackedByteArray())
+
+	for i in range(peers.size() - 1, -1, -1):
+		var conn : StreamPeerTCP = peers[i]
+		conn.poll()
+		if conn.get_status() != StreamPeerTCP.STATUS_CONNECTED:
+			peers.remove_at(i)
+			buffers.remove_at(i)
+			continue
+		var available = conn.get_available_bytes()
+		if available > 0:
+			buffers[i].append_array(conn.get_data(available)[1])
+		var idx = buffers[i].find(10) # "\n"
+		while idx >= 0:
+			var line = buffers[i].slice(0, idx).get_string_from_utf8()
+			buffers[i] = buffers[i].slice(idx + 1)
+			var reply = handle_request(line)
+			conn.put_data((JSON.stringify(reply) + "\n").to_utf8_buffer())
+			idx = buffers[i].find(10)
+
+
+func handle_request(line : String) -> Dictionary:
+	var request = JSON.parse_string(line)
+	if typeof(request) != TYPE_DICTIONARY:
+		return {"ok": false, "error": "malformed request"}
+	var reply = {"ok": true, "id": request.get("id", 0)}
+	match request.get("cmd", ""):
+		"ping":
+			reply["version"] = Engine.get_version_info()["string"]
+		"export_pack":
+			var start = Time.get_ticks_msec()
+			var err = export_pack(request.get("target", ""), request.get("reimport", ["res://model/model.glb"]))
+			if err != "":
+				reply["ok"] = false
+				reply["error"] = err
+			reply["msec"] = Time.get_ticks_msec() - start
+		"quit":
+			get_tree().quit()
+		_:
+			reply["ok"] = false
+			reply["error"] = "unknown command '" + str(request.get("cmd", "")) + "'"
+	return reply
+
+
+# Reimport the given (changed) source files and write all resources of the project into a pack
+# at target. Returns an error message or "" on success.
+func export_pack(target : String, reimport : Array) -> String:
+	if target == "":
+		return "no target given"
+
+	var to_reimport = PackedStringArray()
+	for path in reimport:
+		if FileAccess.file_exists(path):
+			to_reimport.append(path)
+	if to_reimport.size() > 0:
+		EditorInterface.get_resource_filesystem().reimport_files(to_reimport)
+
+	var files = PackedStringArray()
+	collect_files("res://", files)
+	for path in EXTRA_FILES:
+		if FileAccess.file_exists(path):
+			files.append(path)
+
+	var packer = PCKPacker.new()
+	var err = packer.pck_start(target)
+	if err != OK:
+		return "cannot create '" + target + "' (error " + str(err) + ")"
+	for path in files:
+		err = packer.add_file(path, ProjectSettings.globalize_path(path))
+		if err != OK:
+			return "cannot add '" + path + "' (error " + str(err) + ")"
+	err = packer.flush()
+	if err != OK:
+		return "cannot write '" + target + "' (error " + str(err) + ")"
+	return ""
+
+
+# Recursively collect what an "all_resources" export would put into the pack: imported resources
+# (instead of their sources) together with their .import files, and all other files as they are.
+func collect_files(dir_path : String, files : PackedStringArray):
+	if dir_path.trim_suffix("/") in EXCLUDED_DIRS:
+		return
+	var dir = DirAccess.open(dir_path)
+	if dir == null:
+		return
+	for file in dir.get_files():
+		var path = dir_path.path_join(file)
+		if file in EXCLUDED_FILES:
+			continue
+		if file.get_extension() == "import":
+			add_imported_files(path, files)
+		elif FileAccess.file_exists(path + ".import"):
+			continue # the imported resource is added together with the .import file
+		else:
+			files.append(path)
+	for sub_dir in dir.get_directories():
+		collect_files(dir_path.path_join(sub_dir), files)
+
+
+func add_imported_files(import_path : String, files : PackedStringArray):
+	files.append(import_path)
+	var cfg = ConfigFile.new()
+	if cfg.load(import_path) != OK:
+		return
+	for dest in cfg.get_value("deps", "dest_files", []):
+		if FileAccess.file_exists(dest):
+			files.append(dest)
@@ -0,0 +1,19 @@
+@tool
+extends EditorPlugin
+
+# Registers the glTF extension importing instanced meshes (see
+# res://gltf_gpu_instancing.gd) while the editor imports the exported model.
+# The extension script itself is not part of this add-on directory, which is
+# excluded from exported packs, as the viewer needs it for draft exports, too.
+
+var extension : GLTFDocumentExtension = null
+
+
+func _enter_tree():
+	extension = preload("res://gltf_gpu_instancing.gd").new()
+	GLTFDocument.register_gltf_document_extension(extension)
+
+
+func _exit_tree():
+	GLTFDocument.unregister_gltf_document_extension(extension)
+	extension = null
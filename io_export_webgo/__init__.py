@@ -16,15 +16,43 @@ import stat
 import subprocess
 import platform
 import shutil
+import filecmp
 import traceback
 import random
-from urllib.request import urlretrieve
+import time
+import atexit
+import threading
+import signal
+import json
+import webbrowser
+import urllib.request
+import urllib.parse
+
+from . import export_cache
+from . import godot_daemon
+from . import export_report
+from . import compression
+from . import bundle_sync
+from . import workspaces
+from . import mesh_optimize
+from . import textures
+from . import html_shell
+from . import pwa
+from . import deploy
+from . import shared_runtime
+from . import pck
+from . import size_budget
+from . import incremental_gltf
+from . import instancing
+from . import toolchain
+from . import scene_stats
 
 # ExportHelper is a helper class, defines filename and
 # invoke() function which calls the file selector.
 from bpy_extras.io_utils import ExportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty, FloatProperty
 from bpy.types import Operator, AddonPreferences
+from bpy.app.handlers import persistent
 
 bl_info = {
     "name": "Export to Web (powered by Godot)",
@@ -44,6 +72,8 @@ the_readable_name_of_the_addon = "Export to Web (powered by Godot)"
 the_unique_name_of_the_download_button = "io_export_webgo.download_godot"
 the_required_godot_version = "4.2.1-stable"
 
+the_unique_name_of_the_clear_cache_button = "io_export_webgo.clear_export_cache"
+
 
 #######################################################################################################
 
@@ -59,6 +89,8 @@ def draw_godot_download_settings(parent):
     godot_icon = pcoll["the_godot_icon"]        
     layout.operator(the_unique_name_of_the_download_button, icon_value=godot_icon.icon_id)
     layout.prop(parent, "godot_path")
+    layout.prop(parent, "godot_mirror_url")
+    layout.prop(parent, "artifact_cache_dir")
 
 def report_error(header: str, msg: str):
     ShowMessageBox(msg, header, 'ERROR')
@@ -93,181 +125,1277 @@ def get_batch_extension():
     return batch_extension
 
 current_server_proc : subprocess.Popen = None
+# Directory and port served by current_server_proc
+current_server_root = None
+current_server_port = None
 
-def do_export_web(context, filepath, open_browser):
-    print("running do_export_web...")
-    if not is_godot4_present(context):
-        # Godot is not downloaded. Open the Blender Add-on preferences with this
-        # Add-On's settings expanded.
-        bpy.ops.screen.userpref_show()
-        bpy.context.preferences.active_section = 'ADDONS'
-        bpy.data.window_managers["WinMan"].addon_search = the_readable_name_of_the_addon
-        bpy.data.window_managers["WinMan"].addon_support = {'COMMUNITY'}
-        bpy.ops.preferences.addon_show(module=the_unique_name_of_the_addon)
-        report_error("ERROR Godot not present", "Godot 4 or higher is not available. Try 'Download Godot' or set the 'Godot App' path in Edit>Preferences>Add-Ons>'Export to Web (powered by Godot)'!")
-        return {'CANCELLED'}
+def notify_server(port):
+    '''Tell a running live-reload web server that the export it serves changed. Returns the number of viewers it reloads or None if it did not answer.'''
+    try:
+        request = urllib.request.Request("http://localhost:" + port + "/__webgo/notify", data=b"", method="POST")
+        with urllib.request.urlopen(request, timeout=2) as response:
+            return json.loads(response.read()).get("clients", 0)
+    except Exception:
+        traceback.print_exc()
+        return None
+
+def get_export_cache():
+    return export_cache.ExportCache(os.path.join(get_path(), "export_cache"))
+
+def get_texture_cache():
+    '''Processed textures, kept next to the cached packs so clearing the export cache clears them too (see textures.py).'''
+    return textures.TextureCache(os.path.join(get_path(), "export_cache", "textures"))
+
+def get_gltf_base_store():
+    '''The last glTF export of each scene, updated by incremental exports (see incremental_gltf.py).'''
+    return incremental_gltf.BaseStore(os.path.join(get_path(), "export_cache", "gltf"))
+
+def get_workspace_pool():
+    '''Private copies of the Godot viewer project for concurrent exports (see workspaces.py).'''
+    return workspaces.WorkspacePool(os.path.join(get_path(), "workspaces"), os.path.join(get_path(), "godot_viewer"))
+
+# The workspace of the Godot export daemon. Leased as long as the daemon runs.
+current_daemon_workspace : workspaces.Workspace = None
+
+def get_daemon_workspace():
+    '''Return the workspace of the Godot export daemon, leasing one if necessary. Brought up to date on each call.'''
+    global current_daemon_workspace
+    if current_daemon_workspace:
+        get_workspace_pool().update(current_daemon_workspace)
+    else:
+        current_daemon_workspace = get_workspace_pool().acquire()
+    return current_daemon_workspace
+
+# The optional long-lived headless Godot editor exporting packs (see godot_daemon.py)
+current_godot_daemon : godot_daemon.GodotDaemon = None
+
+def get_godot_daemon(p_godot_app, p_godot_project, godot_version=None):
+    '''Return the Godot export daemon for the given Godot app and project. Replaces a daemon started with a different app or project.'''
+    global current_godot_daemon
+    if current_godot_daemon and (current_godot_daemon.p_godot_app != p_godot_app or current_godot_daemon.p_godot_project != p_godot_project):
+        stop_godot_daemon()
+    if not current_godot_daemon:
+        current_godot_daemon = godot_daemon.GodotDaemon(p_godot_app, p_godot_project, godot_version)
+    if godot_version:
+        current_godot_daemon.godot_version = godot_version
+    return current_godot_daemon
+
+def stop_godot_daemon():
+    global current_godot_daemon, current_daemon_workspace
+    if current_godot_daemon:
+        try:
+            current_godot_daemon.stop()
+        except Exception:
+            traceback.print_exc()
+        current_godot_daemon = None
+    if current_daemon_workspace:
+        current_daemon_workspace.release()
+        current_daemon_workspace = None
+
+# Do not leave a headless Godot running when Blender quits
+atexit.register(stop_godot_daemon)
+
+# Object types whose changes an incremental glTF export can apply (see incremental_gltf.py)
+incremental_object_types = ('MESH', 'EMPTY')
+
+class ChangeTracker:
+    """Objects changed since the last glTF export, collected from depsgraph updates. Objects whose geometry
+    changed are re-exported by an incremental export, objects that were only moved get new transforms.
+    Changes to anything else the export depends on (materials, images, lights, animations, ...), loading a
+    .blend file and undo/redo require a full export."""
+
+    def __init__(self):
+        self.start(None)
+
+    def start(self, scene_id):
+        '''Start tracking changes to the scene exported with the given incremental_gltf.scene_id.'''
+        self.scene_id = scene_id
+        self.transformed = set()
+        self.reshaped = set()
+        self.full_reason = None
+
+    def invalidate(self, reason):
+        if not self.full_reason:
+            self.full_reason = reason
+
+    def update(self, depsgraph):
+        '''Record the changes of a depsgraph update. Returns a description of the first change affecting
+        the export or None (e.g. for selection changes).'''
+        changed = None
+        for update in depsgraph.updates:
+            datablock = update.id
+            if isinstance(datablock, bpy.types.Object):
+                if update.is_updated_geometry:
+                    self.reshaped.add(datablock.name)
+                elif update.is_updated_transform:
+                    self.transformed.add(datablock.name)
+                else:
+                    continue
+                changed = changed or "object '" + datablock.name + "' changed"
+            elif isinstance(datablock, (bpy.types.Material, bpy.types.Image, bpy.types.Texture, bpy.types.NodeTree, bpy.types.World,
+                                        bpy.types.Light, bpy.types.Camera, bpy.types.Armature, bpy.types.Action, bpy.types.Key)):
+                reason = datablock.bl_rna.name.lower() + " '" + datablock.name + "' changed"
+                self.invalidate(reason)
+                changed = changed or reason
+        return changed
+
+change_tracker = ChangeTracker()
+
+@persistent
+def on_depsgraph_update(scene, depsgraph):
+    changed = change_tracker.update(depsgraph)
+    if changed and current_watcher and not current_watcher.exporting:
+        if bpy.context.preferences.addons[the_unique_name_of_the_addon].preferences.watch_scene_changes:
+            current_watcher.schedule(changed)
+
+@persistent
+def on_load_post(*args):
+    change_tracker.invalidate("a .blend file was loaded")
+    # the watched export belongs to the previous file
+    stop_watching()
+
+@persistent
+def on_undo_redo(*args):
+    change_tracker.invalidate("undo or redo")
+
+class ExportCancelled(Exception):
+    pass
+
+class ExportError(Exception):
+    '''An error ending an export. Raised by export stages, reported on the main thread.'''
+    def __init__(self, header, msg):
+        super().__init__(msg)
+        self.header = header
+        self.msg = msg
+
+
+def external_dependencies():
+    '''Return the absolute paths of the files outside of the .blend file the glTF export reads (images that are not
+    packed, linked libraries), None if some of them are not single existing files.'''
+    p_files = set()
+    for library in bpy.data.libraries:
+        if not library.packed_file:
+            p_files.add(bpy.path.abspath(library.filepath))
+    for image in bpy.data.images:
+        if image.packed_file or image.source in {'GENERATED', 'VIEWER'}:
+            continue
+        if image.source != 'FILE':
+            # image sequences, movies and UDIM tiles read more than the file at their path
+            return None
+        p_files.add(bpy.path.abspath(image.filepath, library=image.library))
+    p_files = sorted(os.path.normpath(p) for p in p_files)
+    if not all(os.path.isfile(p) for p in p_files):
+        return None
+    return p_files
+
+
+# The model file of a draft export, loaded by the viewer at runtime
+draft_model_file_name = "model.glb"
+
+# Mesh settings of an export (see mesh_optimize.py and the ExportWeb options)
+default_mesh_settings = {
+    "quantize": True,
+    "tangents": True,
+    "lods": True,
+    "shadow_meshes": True,
+    "optimize_order": False,
+    "instancing": False,
+}
 
-    # assemble target files and paths used for export and for opening the exported web application locally
-    p_blender_exe = bpy.app.binary_path
-    p_target_dir = filepath[:filepath.rindex(".")]
-    p_target_pck = os.path.join(p_target_dir, "index.pck")
-    p_target_servebat = "unknown"
-    p_servebat_contents = ""
-    p_servepy_filename = ""
-    running_on_windows = False
-    match platform.system():
-        case "Windows":
-            running_on_windows = True
-            p_servepy_filename = "serve_blend.py"
-            p_target_servepy = os.path.join(p_target_dir, p_servepy_filename)
-            p_target_servebat = p_target_dir + ".bat"
-            # no shebang on windows
-            p_servebat_contents += '"' + p_blender_exe + '" --background --python "' + p_target_servepy + '" -- --root "' + p_target_dir + '" --port ' + get_next_free_port()
-        case "Linux":
-            p_servepy_filename = "serve_bash.py"
-            p_target_servepy = os.path.join(p_target_dir, p_servepy_filename)
-            p_target_servebat = p_target_dir + ".bash"
-            p_servebat_contents = "#!/bin/bash\n" # should do on most *nixes
-            p_servebat_contents += 'python3 ' + p_target_servepy + ' --root "' + p_target_dir + '" --port ' + get_next_free_port()
-        case "Darwin": # (open-sourced base part of macOS)
-            p_servepy_filename = "serve_blend.py"
-            p_target_servepy = os.path.join(p_target_dir, p_servepy_filename)
-            p_target_servebat = p_target_dir + ".command"
-            p_servebat_contents = "#!/bin/bash\n" # will do on macOS
-            p_servebat_contents += '"' + p_blender_exe + '" --background --python "' + p_target_servepy + '" -- --root "' + p_target_dir + '" --port ' + get_next_free_port()
-    if p_target_servebat == "unknown":
-        report_error(header = "ERROR Exporting to Web", msg = "Unknown platform '" + platform.system() +"'")
-        return {'CANCELLED'}
 
-    # Kill any previously started web serving process. It might block the directory we want to write to.
-    global current_server_proc
-    if current_server_proc and current_server_proc.poll() == None:
-        # Kill the previous (server) process (depends on platform)
+class WebExportJob:
+    """State of a single web export, split into stages. Stages calling into bpy run on the main thread,
+    all others are allowed to run in a worker thread (see ExportWeb.modal). do_export_web runs all
+    stages synchronously.
+
+    A previous export is updated in place: each file is written to a temporary file and renamed over
+    the old one, which is kept as a backup until the new export succeeded. A failed or cancelled export
+    restores the backups and removes the files it created.
+
+    viewer_dir is the Godot viewer project to export with. By default a workspace (a private copy of the
+    viewer project shipped with the add-on) is leased for the job, so concurrent exports do not interfere.
+    mesh_settings overrides entries of default_mesh_settings. texture_profile is one of textures.profiles.
+
+    A draft export skips building the Godot pack for the model: the target gets a viewer pack with a
+    placeholder model (built once and then taken from the export cache) and the exported model.glb, which
+    the viewer downloads and loads at runtime. viewer_args are passed to the viewer as command line
+    arguments (OS.get_cmdline_user_args) through the index.html.
+
+    With pwa, the target gets a service worker keeping the engine files in the browser's cache storage
+    and a web app manifest (see pwa.py).
+
+    With deploy, a copy of the export with content-hashed file names for hosting with long cache
+    lifetimes is written next to the target (see deploy.py)."""
+
+    def __init__(self, context, filepath, open_browser, viewer_dir=None, mesh_settings=None, texture_profile="NONE", draft=False, viewer_args=None, pwa=False, deploy=False):
+        self.filepath = filepath
+        self.open_browser = open_browser
+        self.viewer_dir = viewer_dir
+        self.mesh_settings = dict(default_mesh_settings, **(mesh_settings or {}))
+        self.texture_profile = texture_profile
+        self.draft = draft
+        self.pwa = pwa
+        self.deploy = deploy
+        self.viewer_args = list(viewer_args or [])
+        if draft:
+            self.viewer_args.append("--webgo-model=" + draft_model_file_name)
+        self.workspace : workspaces.Workspace = None
+
+        # retrieve path to Godot and other settings from this Add-on's preferences
+        preferences = context.preferences
+        addon_prefs = preferences.addons[the_unique_name_of_the_addon].preferences
+        self.p_godot_app = addon_prefs.godot_path
+        self.use_export_cache = addon_prefs.use_export_cache
+        self.use_godot_daemon = addon_prefs.use_godot_daemon
+        self.use_precompression = addon_prefs.use_precompression
+        self.keep_server_running = addon_prefs.keep_server_running
+        self.export_layout = addon_prefs.export_layout
+        self.use_incremental_gltf = addon_prefs.use_export_cache and addon_prefs.use_incremental_gltf
+        self.budget_action = addon_prefs.budget_action
+        # in bytes, 0: no limit
+        self.budgets = {key: int(getattr(addon_prefs, "budget_" + key + "_mb") * 1024 * 1024) for key in size_budget.budget_labels}
+        self.godot_version = None
+        # how the pack is going to be built (see export_cache.build_modes), set by prepare
+        self.godot_mode = None
+
+        # bpy state needed by stages running in worker threads
+        self.p_blend_file = bpy.data.filepath
+        self.blend_is_dirty = bpy.data.is_dirty
+        self.scene_key_settings = (bpy.app.version_string, bl_info["version"], context.scene.name, sorted(self.mesh_settings.items()), self.texture_profile)
+        self.p_scene_dependencies = external_dependencies() if self.p_blend_file and not self.blend_is_dirty else None
+
+        # progress and cancellation
+        self.stages = [
+            ("Stopping previous web server", self.stage_stop_server, False),
+            ("Compressing web template", self.stage_precompress_template, True),
+            ("Updating web template files", self.stage_sync_template, True),
+            ("Looking up export cache", self.stage_lookup_scene, True),
+            ("Exporting glTF", self.stage_export_gltf, False),
+            ("Optimizing textures", self.stage_optimize_textures, True),
+            ("Optimizing meshes", self.stage_optimize_meshes, True),
+            ("Computing scene bounds", self.stage_scene_stats, True),
+            ("Looking up export cache", self.stage_lookup_pack, True),
+            ("Building Godot pack", self.stage_build_pack, True),
+            ("Installing model", self.stage_install_model, True),
+            ("Writing index.html", self.stage_write_html, True),
+            ("Writing service worker", self.stage_write_pwa, True),
+            ("Compressing web export", self.stage_compress_bundle, True),
+            ("Checking size budgets", self.stage_check_budgets, True),
+            ("Writing deploy build", self.stage_write_deploy, True),
+            ("Removing backups of previous export", self.stage_remove_backups, True),
+            ("Starting web server", self.stage_start_server, False),
+        ]
+        self.stage_index = 0
+        self.stage_name = ""
+        self.status = ""  # e.g. the last line of Godot's output
+        self.worker : threading.Thread = None
+        self.cancelled = False
+        self.error : ExportError = None
+        self.warnings = []
+        self.godot_proc : subprocess.Popen = None
+        self.godot_daemon : godot_daemon.GodotDaemon = None
+
+        # Rollback information: (backup path, original path) of files of a previous export replaced
+        # by this export, files created by this export and whether the target directory was created
+        self.backups = []
+        self.created_files = []
+        self.created_target_dir = False
+
+        # export cache state
+        self.cache = None
+        self.scene_key = None
+        self.pack_key = None
+        self.cache_meta = None
+        self.glb_seconds = 0.0
+        self.godot_seconds = 0.0
+        self.skipped = "Godot pack"
+        self.saved_seconds = 0.0
+        # bounds and counts of the model passed to the viewer (see scene_stats.py), None if unknown
+        self.scene_stats = None
+        # a cached pack differing only in scripts (see ExportCache.patch)
+        self.base_key = None
+        self.patch_files = None
+        self.patch_key = None
+        self.p_patch_project_dir = None
+        self.patched = None
+
+        # per-stage timings and sizes, written to export_report.json
+        self.report = export_report.ExportReport(
+            addon_version = ".".join(str(v) for v in bl_info["version"]),
+            blender_version = bpy.app.version_string,
+            target = filepath,
+        )
+
+    def prepare(self):
+        '''Check prerequisites and assemble all paths. Must run on the main thread. Returns False if the export cannot start.'''
+        self.godot_version = get_godot_version(self.p_godot_app)
+        self.report["godot_version"] = self.godot_version
+        self.godot_mode = "daemon" if self.use_godot_daemon else "one-shot"
+        if not is_godot4_version(self.godot_version):
+            # Godot is not downloaded. Open the Blender Add-on preferences with this
+            # Add-On's settings expanded.
+            if not bpy.app.background:
+                bpy.ops.screen.userpref_show()
+                bpy.context.preferences.active_section = 'ADDONS'
+                bpy.data.window_managers["WinMan"].addon_search = the_readable_name_of_the_addon
+                bpy.data.window_managers["WinMan"].addon_support = {'COMMUNITY'}
+                bpy.ops.preferences.addon_show(module=the_unique_name_of_the_addon)
+            report_error("ERROR Godot not present", "Godot 4 or higher is not available. Try 'Download Godot' or set the 'Godot App' path in Edit>Preferences>Add-Ons>'Export to Web (powered by Godot)'!")
+            return False
+
+        # assemble target files and paths used for export and for opening the exported web application locally
+        filepath = self.filepath
+        p_blender_exe = bpy.app.binary_path
+        self.p_target_dir = filepath[:filepath.rindex(".")]
+        self.p_target_pck = os.path.join(self.p_target_dir, "index.pck")
+        # the pack is written here and then renamed to p_target_pck, so a running server never serves a half-written pack
+        self.p_target_pck_tmp = os.path.join(self.p_target_dir, "index" + bundle_sync.tmp_suffix + ".pck")
+        self.p_target_glb = os.path.join(self.p_target_dir, draft_model_file_name)
+        self.p_target_glb_tmp = os.path.join(self.p_target_dir, "model" + bundle_sync.tmp_suffix + ".glb")
+        # With the shared engine runtime, the local server serves the output directory containing the
+        # bundle and the runtime, and the viewer is opened at the bundle's sub-path
+        self.shared_runtime = self.export_layout == 'SHARED'
+        self.runtime_version = None
+        if self.shared_runtime:
+            p_serve_root = os.path.dirname(os.path.abspath(self.p_target_dir))
+            self.url_path = "/" + urllib.parse.quote(os.path.basename(self.p_target_dir)) + "/"
+            serve_args = '--root "' + p_serve_root + '" --open "' + self.url_path + '"'
+        else:
+            self.url_path = "/"
+            serve_args = '--root "' + self.p_target_dir + '"'
+        # Keep a server started by a previous export to the same target running. It reloads the open viewer.
+        self.reuse_server = bool(self.keep_server_running and current_server_proc and current_server_proc.poll() == None and current_server_root == os.path.abspath(self.p_target_dir))
+        self.port = current_server_port if self.reuse_server else get_next_free_port()
+        serve_args += ' --cache --live-reload --port ' + self.port
+        self.p_target_servebat = "unknown"
+        self.p_servebat_contents = ""
+        p_servepy_filename = ""
+        self.running_on_windows = False
+        match platform.system():
+            case "Windows":
+                self.running_on_windows = True
+                p_servepy_filename = "serve_blend.py"
+                p_target_servepy = os.path.join(self.p_target_dir, p_servepy_filename)
+                self.p_target_servebat = self.p_target_dir + ".bat"
+                # no shebang on windows
+                self.p_servebat_contents += '"' + p_blender_exe + '" --background --python "' + p_target_servepy + '" -- ' + serve_args
+            case "Linux":
+                p_servepy_filename = "serve_bash.py"
+                p_target_servepy = os.path.join(self.p_target_dir, p_servepy_filename)
+                self.p_target_servebat = self.p_target_dir + ".bash"
+                self.p_servebat_contents = "#!/bin/bash\n" # should do on most *nixes
+                self.p_servebat_contents += 'python3 ' + p_target_servepy + ' ' + serve_args
+            case "Darwin": # (open-sourced base part of macOS)
+                p_servepy_filename = "serve_blend.py"
+                p_target_servepy = os.path.join(self.p_target_dir, p_servepy_filename)
+                self.p_target_servebat = self.p_target_dir + ".command"
+                self.p_servebat_contents = "#!/bin/bash\n" # will do on macOS
+                self.p_servebat_contents += '"' + p_blender_exe + '" --background --python "' + p_target_servepy + '" -- ' + serve_args
+        if self.p_target_servebat == "unknown":
+            report_error(header = "ERROR Exporting to Web", msg = "Unknown platform '" + platform.system() +"'")
+            return False
+
+        # assemble paths relative to this addon
+        p_addon = get_path()
+        p_viewer = self.viewer_dir
+        if not p_viewer:
+            try:
+                if self.use_godot_daemon:
+                    # the daemon keeps its workspace's project open
+                    p_viewer = get_daemon_workspace().p_dir
+                else:
+                    self.workspace = get_workspace_pool().acquire()
+                    p_viewer = self.workspace.p_dir
+            except Exception:
+                traceback.print_exc()
+                report_error(header = "ERROR Exporting to Web", msg = "Cannot create a workspace for the Godot project in '" + os.path.join(p_addon, "workspaces") + "'")
+                return False
+        self.p_viewer_glb = os.path.join(p_viewer, "model", "model.glb")
+        # A draft's model is not imported by Godot but goes right into the target directory
+        self.p_glb_scene = self.p_target_glb_tmp if self.draft else self.p_viewer_glb
+        self.p_godot_project = os.path.join(p_viewer, "project.godot")
+        self.p_godot_project_dir = os.path.dirname(self.p_godot_project)
+        # The web template is only read, workspaces do not need a copy of it
+        self.p_viewer_template_dir = os.path.join(p_addon, "godot_viewer")
+        self.p_web_export_dir = os.path.join(self.p_viewer_template_dir, "export", "web")
+        self.p_src_servepy = os.path.join(p_addon, p_servepy_filename)
+
+        # The draft pack does not depend on the scene and is always cached, so drafts never run Godot twice
+        self.cache = get_export_cache() if self.use_export_cache or self.draft else None
+        return True
+
+    # Stage driver
+
+    def run_stage(self, func):
         try:
-            if running_on_windows:
-                subprocess.call(['taskkill', '/F', '/T', '/PID', str(current_server_proc.pid)])
-            else: 
-                current_server_proc.kill()
-            current_server_proc.wait(5)
+            if self.cancelled:
+                raise ExportCancelled()
+            with self.report.timed(func.__name__[len("stage_"):]):
+                func()
+        except ExportCancelled:
+            self.cancelled = True
+        except ExportError as e:
+            self.error = e
+        except Exception as e:
+            traceback.print_exc()
+            self.error = ExportError("ERROR Exporting to Web", str(e))
+
+    def step(self):
+        '''Advance the export by starting the next stage if the current one is done. Main thread stages
+        run right away, all others in a worker thread. Returns False when there is nothing left to do.'''
+        if self.worker is not None:
+            if self.worker.is_alive():
+                return True
+            self.worker = None
+        if self.error or self.cancelled or self.stage_index >= len(self.stages):
+            return False
+        self.stage_name, func, threaded = self.stages[self.stage_index]
+        self.stage_index += 1
+        self.status = ""
+        print("Exporting to Web: " + self.stage_name)
+        if threaded:
+            self.worker = threading.Thread(target=self.run_stage, args=(func,), daemon=True)
+            self.worker.start()
+        else:
+            self.run_stage(func)
+        return True
+
+    def run(self):
+        '''Run all stages synchronously.'''
+        while self.step():
+            if self.worker:
+                self.worker.join()
+        return self.finish()
+
+    def progress_text(self):
+        text = "Exporting to Web [" + str(self.stage_index) + "/" + str(len(self.stages)) + "]: " + self.stage_name
+        if self.cancelled:
+            text = "Cancelling export to Web..."
+        elif self.status:
+            text += " - " + self.status[:120]
+        return text
+
+    def cancel(self):
+        '''Request cancellation. Kills a running Godot. Callable from the main thread while a worker runs.'''
+        self.cancelled = True
+        proc = self.godot_proc
+        if proc and proc.poll() == None:
+            try:
+                if self.running_on_windows:
+                    subprocess.call(['taskkill', '/F', '/T', '/PID', str(proc.pid)])
+                else:
+                    proc.kill()
+            except Exception:
+                traceback.print_exc()
+        if self.godot_daemon:
+            self.godot_daemon.abort()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise ExportCancelled()
+
+    def warn(self, msg):
+        print("WARNING Exporting to Web: " + msg)
+        self.warnings.append(msg)
+
+    def finish(self):
+        '''Report the outcome. Must run on the main thread after the last stage. Rolls back
+        the target directory if the export failed or was cancelled.'''
+        if self.workspace:
+            self.workspace.release()
+            self.workspace = None
+        for msg in self.warnings:
+            ShowMessageBox(msg, "WARNING Exporting to Web", 'ERROR')
+        self.report["warnings"] = self.warnings
+        if self.error or self.cancelled:
+            self.report.finish("ERROR" if self.error else "CANCELLED")
+            self.report.append_to_log()
+            self.rollback()
+            if self.error:
+                report_error(header = self.error.header, msg = self.error.msg)
+            else:
+                print("Export to Web cancelled")
+            return {'CANCELLED'}
+        self.report.finish("FINISHED")
+        self.report.append_to_log()
+        try:
+            print("Export report written to '" + self.report.write(self.p_target_dir) + "'")
         except Exception:
             traceback.print_exc()
-            report_error(header = "WARNING Exporting to Web", msg = "Could not kill previos web server process")
+            report_error(header = "WARNING Exporting to Web", msg = "Cannot write export report to '" + self.p_target_dir + "'")
+        return {'FINISHED'}
 
-    # retrieve path to Godot from this Add-on's preferences
-    preferences = context.preferences
-    addon_prefs = preferences.addons[the_unique_name_of_the_addon].preferences
-    p_godot_app = addon_prefs.godot_path
-   
-    # assemble paths relative to this addon
-    p_addon = get_path()
-    p_glb_scene = os.path.join(p_addon, "godot_viewer", "model", "model.glb")
-    p_godot_project = os.path.join(p_addon, "godot_viewer", "project.godot")
-    p_web_export_dir = os.path.join(p_addon, "godot_viewer", "export", "web")
-    p_src_servepy = os.path.join(p_addon, p_servepy_filename)
-
-    # Remove anything exisiting with the name
-    # e.g. a directory with the given name
-    if os.path.isdir(p_target_dir):
+    def rollback(self):
+        '''Undo the changes of a failed or cancelled export, restoring the previous export (if any).'''
+        for p_file in self.created_files + [self.p_target_pck_tmp, self.p_target_glb_tmp]:
+            try:
+                if os.path.lexists(p_file):
+                    os.remove(p_file)
+                compression.remove_compressed(p_file)
+            except Exception:
+                traceback.print_exc()
+        for p_backup, p_original in self.backups:
+            try:
+                os.replace(p_backup, p_original)
+                # compressed siblings of the new version would be newer than the restored file
+                compression.remove_compressed(p_original)
+            except Exception:
+                traceback.print_exc()
+                report_error(header = "ERROR Exporting to Web", msg = "Cannot restore previous export '" + p_original + "' from '" + p_backup + "'")
+        self.backups = []
+        self.created_files = []
+        if self.created_target_dir:
+            shutil.rmtree(self.p_target_dir, ignore_errors=True)
+
+    # Stages
+
+    def stage_stop_server(self):
+        # Kill any previously started web serving process. It might block the directory we want to write to.
+        if self.reuse_server:
+            return
+        self.kill_server()
+
+    def kill_server(self):
+        if current_server_proc and current_server_proc.poll() == None:
+            # Kill the previous (server) process (depends on platform)
+            try:
+                if self.running_on_windows:
+                    subprocess.call(['taskkill', '/F', '/T', '/PID', str(current_server_proc.pid)])
+                else: 
+                    # kill the whole process group: the shell, bash and the python server
+                    os.killpg(current_server_proc.pid, signal.SIGKILL)
+                current_server_proc.wait(5)
+            except Exception:
+                traceback.print_exc()
+                self.warn("Could not kill previos web server process")
+
+    def backup_file(self, p_file):
+        '''Keep the version of a previous export of a file about to be replaced, so a rollback can restore it.'''
+        p_backup = p_file + ".webgo-backup"
+        if os.path.lexists(p_backup):
+            os.remove(p_backup)
         try:
-            shutil.rmtree(p_target_dir)
+            os.link(p_file, p_backup)
+        except OSError:
+            shutil.copy2(p_file, p_backup)
+        self.backups.append((p_backup, p_file))
+
+    def install_file(self, p_tmp, p_file):
+        '''Atomically replace p_file with the completely written p_tmp, keeping a backup for rollbacks.'''
+        existed = os.path.lexists(p_file)
+        bundle_sync.install_file(p_tmp, p_file, self.backup_file)
+        if not existed:
+            self.created_files.append(p_file)
+
+    def stage_sync_template(self):
+        # Update the target directory in place instead of removing and copying it: the engine files
+        # never change between exports and are skipped (or hard-linked to the template). Only changed
+        # files are written, each through a temporary file and an atomic rename.
+        if not os.path.isdir(self.p_target_dir):
+            try:
+                os.makedirs(self.p_target_dir)
+            except Exception:
+                traceback.print_exc()
+                raise ExportError("ERROR Exporting to Web", "Cannot create directory '" + self.p_target_dir + "'")
+            self.created_target_dir = True
+
+        # The template's pack is a placeholder, the real one is written by stage_build_pack. The
+        # index.html is written by stage_write_html. Compressed siblings written by
+        # stage_precompress_template are copied along (if enabled).
+        exclude = ["index.pck", "index.pck.*", "index.html", "index.html.*"]
+        if not self.use_precompression:
+            exclude += ["*.gz", "*.br"]
+        try:
+            if self.shared_runtime:
+                # The engine files go to the runtime directory shared by all bundles next to this one
+                with self.report.timed("sync_template/runtime"):
+                    self.runtime_version = shared_runtime.runtime_version(self.p_web_export_dir)
+                    p_runtime_dir = shared_runtime.runtime_path(self.p_target_dir, self.runtime_version)
+                    stats = shared_runtime.install_runtime(self.p_web_export_dir, p_runtime_dir, self.use_precompression, self.check_cancelled)
+                # left over from a self-contained export to the same target
+                for p_file in shared_runtime.bundle_files(self.p_target_dir):
+                    self.backup_file(p_file)
+                    os.remove(p_file)
+                print("Shared engine runtime '" + p_runtime_dir + "': " + str(stats["skipped"]) + " unchanged, " + str(stats["linked"]) + " linked, " + str(stats["copied"]) + " copied")
+                self.report["runtime"] = {"layout": self.export_layout, "version": self.runtime_version, "dir": p_runtime_dir}
+            else:
+                with self.report.timed("sync_template/sync"):
+                    stats = bundle_sync.sync_tree(self.p_web_export_dir, self.p_target_dir, exclude=exclude, no_link=["*.html"], backup=self.backup_file, on_created=self.created_files.append, check_cancelled=self.check_cancelled)
+                print("Web template files: " + str(stats["skipped"]) + " unchanged, " + str(stats["linked"]) + " linked, " + str(stats["copied"]) + " copied")
+            self.report["template_sync"] = stats
+            self.report["template_files"] = export_report.file_sizes(self.p_web_export_dir)
+        except ExportCancelled:
+            raise
         except Exception:
             traceback.print_exc()
-            report_error(header = "ERROR Exporting to Web", msg = "Cannot remove existing directory '" + p_target_dir +"'. Did you manually start '" + p_target_servebat + "'? If so, close that process before exporting.")
-            return {'CANCELLED'}
-    # or a file with the exact name
-    if os.path.isfile(filepath):
+            raise ExportError("ERROR Exporting to Web", "Cannot copy contents from '" + self.p_web_export_dir +"' to '" + self.p_target_dir +"'. Did you manually start '" + self.p_target_servebat + "'? If so, close that process before exporting.")
+        self.check_cancelled()
+
+        # Copy the serve.py script necessary to locally display the web contents
+        p_target_servepy = os.path.join(self.p_target_dir, os.path.basename(self.p_src_servepy))
         try:
-            os.remove(filepath)
+            existed = os.path.lexists(p_target_servepy)
+            bundle_sync.sync_file(self.p_src_servepy, p_target_servepy, backup=self.backup_file)
+            if not existed:
+                self.created_files.append(p_target_servepy)
         except Exception:
             traceback.print_exc()
-            report_error(header = "ERROR Exporting to Web", msg = "Cannot remove existing file '" + filepath +"'")
-    # or the starter batch file
-    if os.path.isfile(p_target_servebat):
+            raise ExportError("ERROR Exporting to Web", "Cannot copy '" + self.p_src_servepy +"' to '" + self.p_target_dir +"'")
+
+        # Create the batch file to call serve.py and make the batch file executable
         try:
-            os.remove(p_target_servebat)
+            p_tmp = bundle_sync.tmp_path(self.p_target_servebat)
+            f = open(p_tmp, "w")
+            f.write(self.p_servebat_contents)
+            f.close()
+            st = os.stat(p_tmp)
+            os.chmod(p_tmp, st.st_mode | stat.S_IXGRP | stat.S_IXUSR | stat.S_IXOTH)
+            self.install_file(p_tmp, self.p_target_servebat)
         except Exception:
             traceback.print_exc()
-            report_error(header = "ERROR Exporting to Web", msg = "Cannot remove existing file '" + p_target_servebat +"'")
-    
-    # Copy the original viewer's web export to the target directory
-    try:
-        shutil.copytree(p_web_export_dir, p_target_dir)
-    except Exception:
-        traceback.print_exc()
-        report_error(header = "ERROR Exporting to Web", msg = "Cannot copy contents from '" + p_web_export_dir +"' to '" + p_target_dir +"'")
-        return {'CANCELLED'}
+            raise ExportError("ERROR Exporting to Web", "Cannot create '" + self.p_target_servebat + "'")
 
-    # Copy the serve.py script necessary to locally display the web contents
-    try:
-        shutil.copy2(p_src_servepy, p_target_dir)
-    except Exception:
-        traceback.print_exc()
-        report_error(header = "ERROR Exporting to Web", msg = "Cannot copy '" + p_src_servepy +"' to '" + p_target_dir +"'")
-        return {'CANCELLED'}
-    
-    # Create the batch file to call serve.py and make the batch file executable
-    try:
-        f = open(p_target_servebat, "w")
-        f.write(p_servebat_contents)
-        f.close()
-        st = os.stat(p_target_servebat)
-        os.chmod(p_target_servebat, st.st_mode | stat.S_IXGRP | stat.S_IXUSR | stat.S_IXOTH)
-    except Exception:
-        traceback.print_exc()
-        report_error(header = "ERROR Exporting to Web", msg = "Cannot create '" + p_target_servebat + "'")
-        return {'CANCELLED'}
+    def stage_precompress_template(self):
+        # Compress the engine files of the template once (with maximum compression). As they
+        # never change, later exports just copy the compressed siblings along with them.
+        if not self.use_precompression:
+            return
+        try:
+            compression.compress_dir(self.p_web_export_dir, compression.brotli_quality_max)
+        except Exception:
+            traceback.print_exc()
+            print("Cannot write compressed files to the web template '" + self.p_web_export_dir + "'. They will be compressed in the export instead.")
+
+    def stage_lookup_scene(self):
+        # Look up the export cache. If the .blend file is saved and unchanged since saving, its contents
+        # identify the glTF export and a previously built pack can be reused without even exporting the glTF.
+        # The key covers the files the .blend file refers to, the Godot version and the viewer project as well.
+        if self.draft:
+            return
+        if self.cache and self.p_blend_file and not self.blend_is_dirty and self.p_scene_dependencies is not None:
+            try:
+                # the workspace's model files are those of the previous export
+                p_model_files = [os.path.join(self.p_godot_project_dir, *p_private.split("/")) for p_private in workspaces.private_files]
+                project_digest = export_cache.hash_viewer_project(self.p_godot_project_dir, p_exclude_files=p_model_files).hexdigest()
+                self.scene_key = export_cache.compute_scene_key(self.p_blend_file, self.p_scene_dependencies, self.godot_version, project_digest, self.godot_mode, *self.scene_key_settings)
+                self.pack_key = self.cache.lookup_scene(self.scene_key)
+                self.cache_meta = self.cache.lookup(self.pack_key)
+            except Exception:
+                traceback.print_exc()
+                self.scene_key = None
 
-    # Export blender contents to gltf and run godot to overwrite the .pck web contents
-    bpy.ops.export_scene.gltf(filepath=p_glb_scene)
-    godot_args = [
-        p_godot_app,
-        p_godot_project,
-        "--export-pack",
-        "Web",
-        p_target_pck,
-        "--headless"
-    ]
-    print(godot_args)
-    subprocess.run(godot_args)
-
-    # If "Open in Browser" export option is set (default), start the generated p_target_servebat script
-    if open_browser:
-        # Open the bat/bash/command file in its own console/terminal window (depends on platform)
+    def stage_export_gltf(self):
+        if self.cache_meta:
+            return
+        # Export blender contents to gltf
+        t_start = time.monotonic()
+        scene = bpy.context.scene
+        gltf_scene_id = incremental_gltf.scene_id(self.p_blend_file, scene.name, bpy.app.version_string, bl_info["version"])
+        object_names = sorted(obj.name for obj in scene.objects)
+        exported = None
+        if self.use_incremental_gltf:
+            try:
+                exported = self.export_gltf_incremental(scene, gltf_scene_id, object_names)
+            except incremental_gltf.NotIncremental as e:
+                print("Exporting the whole scene to glTF: " + str(e))
+            except Exception:
+                traceback.print_exc()
+                self.warn("Incremental glTF export failed. Exporting the whole scene")
+        if exported is None:
+            bpy.ops.export_scene.gltf(filepath=self.p_glb_scene)
+            exported = {"mode": "full"}
+        self.glb_seconds = time.monotonic() - t_start
+        # Changes made by the glTF exporter itself (e.g. frame changes) are not changes of the scene
+        change_tracker.start(gltf_scene_id)
+        if self.use_incremental_gltf:
+            try:
+                get_gltf_base_store().store(gltf_scene_id, self.p_glb_scene, objects=object_names)
+            except Exception:
+                traceback.print_exc()
+                change_tracker.invalidate("the previous glTF export could not be stored")
+        exported["seconds"] = round(self.glb_seconds, 4)
+        self.report["gltf_export"] = exported
+        self.report["glb_bytes"] = export_report.file_size(self.p_glb_scene)
+
+    def export_gltf_incremental(self, scene, gltf_scene_id, object_names):
+        '''Update the glTF export of the previous export of the scene with the objects changed since then (see
+        incremental_gltf.py). Must run on the main thread. Raises incremental_gltf.NotIncremental if the scene
+        has to be exported in full.'''
+        tracker = change_tracker
+        if tracker.scene_id != gltf_scene_id:
+            raise incremental_gltf.NotIncremental("no previous export of the scene in this session")
+        if tracker.full_reason:
+            raise incremental_gltf.NotIncremental(tracker.full_reason)
+        p_base, state = get_gltf_base_store().lookup(gltf_scene_id)
+        if not p_base:
+            raise incremental_gltf.NotIncremental("the previous export of the scene is not stored")
+        if state.get("objects") != object_names:
+            raise incremental_gltf.NotIncremental("objects were added, removed or renamed")
+        reshaped = sorted(tracker.reshaped)
+        changed = sorted(tracker.transformed | tracker.reshaped)
+        for name in changed:
+            obj = scene.objects[name]
+            if obj.type not in incremental_object_types:
+                raise incremental_gltf.NotIncremental("object '" + name + "' is a " + obj.type.lower())
+            if obj.parent and (obj.parent_type != 'OBJECT' or obj.parent.type not in incremental_object_types):
+                raise incremental_gltf.NotIncremental("object '" + name + "' has a " + obj.parent_type.lower() + " parent")
+            if obj.animation_data and obj.animation_data.action:
+                raise incremental_gltf.NotIncremental("object '" + name + "' is animated")
+
+        gltf, bin_chunk = mesh_optimize.read_glb(p_base)
+        if reshaped:
+            # The glTF exporter only exports selected objects or whole collections
+            p_part = os.path.splitext(self.p_glb_scene)[0] + ".part.glb"
+            view_layer = bpy.context.view_layer
+            selected = [obj for obj in view_layer.objects if obj.select_get()]
+            active = view_layer.objects.active
+            try:
+                for obj in selected:
+                    obj.select_set(False)
+                for name in reshaped:
+                    scene.objects[name].select_set(True)
+                bpy.ops.export_scene.gltf(filepath=p_part, use_selection=True)
+                part, part_bin = mesh_optimize.read_glb(p_part)
+            finally:
+                for name in reshaped:
+                    scene.objects[name].select_set(False)
+                for obj in selected:
+                    obj.select_set(True)
+                view_layer.objects.active = active
+                if os.path.exists(p_part):
+                    os.remove(p_part)
+            bin_chunk = incremental_gltf.splice_meshes(gltf, bin_chunk, part, part_bin, reshaped)
+        for name in changed:
+            location, rotation, scale = scene.objects[name].matrix_local.decompose()
+            incremental_gltf.set_node_transform(gltf, name, incremental_gltf.node_trs(location, rotation, scale))
+        mesh_optimize.write_glb(self.p_glb_scene, gltf, bin_chunk)
+        print("Incremental glTF export: " + str(len(changed) - len(reshaped)) + " objects moved, " + str(len(reshaped)) + " objects re-exported")
+        return {"mode": "incremental", "transformed": [name for name in changed if name not in tracker.reshaped], "reexported": reshaped}
+
+    def stage_optimize_textures(self):
+        if self.cache_meta:
+            return
+        if self.texture_profile != "NONE" and not textures.backend():
+            self.warn("Cannot scale textures without an image library. Only duplicate textures are removed")
+        cache = get_texture_cache() if self.use_export_cache else None
+        t_start = time.monotonic()
+        images = textures.optimize_glb(self.p_glb_scene, self.texture_profile, cache=cache, check_cancelled=self.check_cancelled)
+        if cache:
+            cache.prune()
+        for image in images:
+            text = "Texture '" + image["name"] + "': " + str(image["source_bytes"]) + " -> " + str(image["bytes"]) + " bytes"
+            if image["width"]:
+                text += ", " + str(image["width"]) + "x" + str(image["height"]) + " px"
+            if "duplicate_of" in image:
+                text += ", duplicate of '" + image["duplicate_of"] + "'"
+            elif image["cached"]:
+                text += " (cached)"
+            print(text)
+        self.report["textures"] = images
+        self.report["texture_profile"] = self.texture_profile
+        self.report["texture_seconds"] = round(time.monotonic() - t_start, 4)
+
+    def stage_optimize_meshes(self):
+        if self.cache_meta:
+            return
+        # Godot's import settings of the model (part of the pack's cache key)
+        if not self.draft:
+            mesh_optimize.set_import_params(self.p_glb_scene + ".import", mesh_optimize.import_params(self.mesh_settings))
+        if self.mesh_settings["instancing"]:
+            report = instancing.instance_glb(self.p_glb_scene)
+            print(instancing.format_report(report))
+            self.report["instancing"] = report
+        if self.mesh_settings["optimize_order"]:
+            if mesh_optimize.numpy is None:
+                self.warn("Cannot optimize the mesh order without NumPy")
+            else:
+                self.report["optimized_primitives"] = mesh_optimize.optimize_glb(self.p_glb_scene)
+        try:
+            gltf, _ = mesh_optimize.read_glb(self.p_glb_scene)
+            meshes = mesh_optimize.mesh_stats(gltf, self.mesh_settings)
+        except Exception:
+            traceback.print_exc()
+            return
+        for mesh in meshes:
+            print("Mesh '" + mesh["name"] + "': " + str(mesh["vertices"]) + " vertices, " + str(mesh["triangles"]) + " triangles, " + str(mesh["glb_bytes"]) + " bytes in glTF, about " + str(mesh["imported_bytes"]) + " bytes imported")
+        self.report["meshes"] = meshes
+        self.report["mesh_settings"] = self.mesh_settings
+
+    def stage_scene_stats(self):
+        if self.cache_meta:
+            # The glTF export was skipped: the stats were stored with the pack built from the same glb
+            self.scene_stats = self.cache_meta.get("scene_stats")
+        else:
+            if scene_stats.numpy is None:
+                self.warn("Cannot compute the scene bounds without NumPy. The viewer computes them on startup")
+                return
+            t_start = time.monotonic()
+            try:
+                self.scene_stats = scene_stats.compute_glb(self.p_glb_scene)
+            except Exception:
+                traceback.print_exc()
+                self.warn("Cannot compute the scene bounds. The viewer computes them on startup")
+                return
+            self.scene_stats["seconds"] = round(time.monotonic() - t_start, 4)
+        if self.scene_stats:
+            print(scene_stats.format_stats(self.scene_stats))
+            self.report["scene"] = self.scene_stats
+
+    def stage_lookup_pack(self):
+        if self.draft:
+            self.lookup_draft_pack()
+            return
+        if self.cache_meta:
+            self.skipped = "glTF export and Godot pack"
+            self.saved_seconds = self.cache_meta.get("glb_seconds", 0.0) + self.cache_meta.get("godot_seconds", 0.0)
+            return
+        if self.cache:
+            try:
+                self.pack_key = export_cache.compute_pack_key(self.p_glb_scene, self.p_godot_project_dir, self.godot_version, self.godot_mode)
+                self.cache_meta = self.cache.lookup(self.pack_key)
+                if not self.cache_meta:
+                    self.lookup_patchable_pack(self.p_glb_scene, self.p_godot_project_dir)
+            except Exception:
+                traceback.print_exc()
+                self.pack_key = None
+        self.skipped = "Godot pack"
+        self.saved_seconds = self.cache_meta.get("godot_seconds", 0.0) if self.cache_meta else 0.0
+
+    def lookup_draft_pack(self):
+        # The draft pack is built from the viewer project as shipped with the add-on, including its
+        # placeholder model. Its key only changes with the add-on's viewer project and the Godot version.
+        p_placeholder_glb = os.path.join(self.p_viewer_template_dir, "model", "model.glb")
+        self.pack_key = export_cache.compute_pack_key(p_placeholder_glb, self.p_viewer_template_dir, self.godot_version, self.godot_mode)
+        self.cache_meta = self.cache.lookup(self.pack_key)
+        self.skipped = "Godot pack"
+        self.saved_seconds = self.cache_meta.get("godot_seconds", 0.0) if self.cache_meta else 0.0
+        if not self.cache_meta:
+            try:
+                self.lookup_patchable_pack(p_placeholder_glb, self.p_viewer_template_dir)
+            except Exception:
+                traceback.print_exc()
+            # Put the placeholder model back into the workspace for building the draft pack
+            for p_private in workspaces.private_files:
+                p_dst = os.path.join(self.p_godot_project_dir, p_private)
+                shutil.copy2(os.path.join(self.p_viewer_template_dir, p_private), bundle_sync.tmp_path(p_dst))
+                os.replace(bundle_sync.tmp_path(p_dst), p_dst)
+
+    def lookup_patchable_pack(self, p_glb, p_project_dir):
+        '''Look for a cached pack built from the same model and project files except for scripts.'''
+        self.patch_files = export_cache.patchable_files(p_project_dir)
+        self.base_key = export_cache.compute_base_key(p_glb, p_project_dir, self.godot_version, self.godot_mode, self.patch_files)
+        self.patch_key = self.cache.lookup_base(self.base_key)
+        self.p_patch_project_dir = p_project_dir
+
+    def stage_build_pack(self):
+        cache = self.cache
+        if self.cache_meta:
+            # Cache hit: copy the cached pack instead of running Godot
+            try:
+                cache.restore(self.pack_key, self.p_target_pck_tmp)
+                if self.scene_key:
+                    cache.store_scene(self.scene_key, self.pack_key)
+            except Exception:
+                traceback.print_exc()
+                if self.skipped != "Godot pack":
+                    # The glTF export was skipped, too, and cannot be run from here
+                    raise ExportError("ERROR Exporting to Web", "Cannot copy cached pack to '" + self.p_target_pck + "'. Clear the export cache and try again.")
+                self.warn("Cannot copy cached pack to '" + self.p_target_pck + "'. Running Godot instead.")
+                self.cache_meta = None
+
+        if not self.cache_meta and self.patch_key:
+            # Only scripts changed since a cached pack was built: patch that pack instead of running Godot
+            try:
+                self.patched = cache.patch(self.patch_key, self.p_patch_project_dir, self.patch_files, self.p_target_pck_tmp)
+            except Exception:
+                traceback.print_exc()
+                self.patched = None
+            if self.patched is not None:
+                print("Patched cached pack " + self.patch_key[:12] + ": " + (", ".join(self.patched) or "no files changed"))
+                self.report["patched_files"] = self.patched
+                # what a later hit on the patched pack saves
+                self.godot_seconds = cache.lookup(self.patch_key).get("godot_seconds", 0.0)
+
+        if not self.cache_meta:
+            if self.patched is None:
+                godot_returncode = self.run_godot()
+                if godot_returncode != 0 or not os.path.isfile(self.p_target_pck_tmp):
+                    raise ExportError("ERROR Exporting to Web", "Godot failed to export '" + self.p_target_pck + "' (exit code " + str(godot_returncode) + "). See the console output for details.")
+            if cache and self.pack_key and self.patched is None and self.report.get("godot_mode") != self.godot_mode:
+                # The daemon failed and a one-shot export built the pack, which the key does not stand for
+                print("Not storing the pack in the export cache, it was built by a " + self.report.get("godot_mode", "") + " export instead of the " + self.godot_mode + " export its key stands for")
+            elif cache and self.pack_key:
+                try:
+                    cache.store(self.pack_key, self.p_target_pck_tmp, scene_key=self.scene_key, base_key=self.base_key, patchable_files=self.patch_files, glb_seconds=self.glb_seconds, godot_seconds=self.godot_seconds, godot_version=self.godot_version, godot_mode=self.godot_mode, scene_stats=None if self.draft else self.scene_stats)
+                except Exception:
+                    traceback.print_exc()
+                    self.warn("Cannot store exported pack in the export cache")
+
+        self.install_file(self.p_target_pck_tmp, self.p_target_pck)
+        self.report["pck_bytes"] = export_report.file_size(self.p_target_pck)
         try:
-            if running_on_windows:
-                current_server_proc = subprocess.Popen(p_target_servebat, creationflags=subprocess.CREATE_NEW_CONSOLE)
+            contents = pck.Pack.read(self.p_target_pck).contents()
+            print("Pack contents: " + pck.format_contents(contents))
+            self.report["pack_contents"] = contents
+        except Exception:
+            traceback.print_exc()
+        if cache:
+            stats = cache.record(bool(self.cache_meta), self.saved_seconds)
+            print(export_cache.format_report(bool(self.cache_meta), self.pack_key, self.saved_seconds, stats, self.skipped, self.patched))
+            self.report["cache"] = {"hit": bool(self.cache_meta), "key": self.pack_key, "skipped": self.skipped if self.cache_meta else None, "saved_seconds": round(self.saved_seconds, 4)}
+
+    def stage_install_model(self):
+        if self.draft:
+            self.install_file(self.p_target_glb_tmp, self.p_target_glb)
+            self.report["draft"] = True
+        elif os.path.lexists(self.p_target_glb):
+            # Left over from a draft export to the same target
+            self.backup_file(self.p_target_glb)
+            os.remove(self.p_target_glb)
+            compression.remove_compressed(self.p_target_glb)
+
+    def stage_write_html(self):
+        # The template's index.html tells the engine loader the size of the template's pack (for
+        # the loading progress bar). Write it with the size of the actual pack and the viewer's arguments.
+        p_html = os.path.join(self.p_target_dir, "index.html")
+        p_template_html = os.path.join(self.p_web_export_dir, "index.html")
+        try:
+            with open(p_template_html, "r", encoding="utf-8", newline="") as f:
+                html = f.read()
+            config = html_shell.read_config(html)
+            file_sizes = dict(config.get("fileSizes", {}))
+            file_sizes["index.pck"] = os.path.getsize(self.p_target_pck)
+            config["fileSizes"] = file_sizes
+            viewer_args = list(self.viewer_args)
+            if self.scene_stats and self.scene_stats["aabb"]:
+                # spares the viewer computing the bounds on startup
+                viewer_args.append(scene_stats.viewer_arg(self.scene_stats))
+            if viewer_args:
+                config["args"] = ["--"] + viewer_args
+            if self.pwa:
+                # the engine loader registers the service worker once the engine started
+                config["serviceWorker"] = pwa.service_worker_file_name
+                html = pwa.add_manifest_link(html)
+            if self.shared_runtime:
+                runtime_url = shared_runtime.runtime_url(self.runtime_version)
+                config = shared_runtime.rewrite_config(config, runtime_url)
+                html = shared_runtime.rewrite_references(html, runtime_url)
+            p_tmp = bundle_sync.tmp_path(p_html)
+            with open(p_tmp, "w", encoding="utf-8", newline="") as f:
+                f.write(html_shell.replace_config(html, config))
+            if os.path.isfile(p_html) and filecmp.cmp(p_tmp, p_html, shallow=False):
+                os.remove(p_tmp)
             else:
-                current_server_proc = subprocess.Popen(p_target_servebat, shell=True)
+                self.install_file(p_tmp, p_html)
         except Exception:
             traceback.print_exc()
-            report_error(header = "WARNING Exporting to Web", msg = "Could not start web server/browser to display export. Try starting '" + p_target_servebat + "' manually.")
+            raise ExportError("ERROR Exporting to Web", "Cannot write '" + p_html + "'")
+
+    def stage_write_pwa(self):
+        if not self.pwa:
+            # Left over from a PWA export to the same target. A service worker installed by it keeps
+            # fetching index.html and the pack from the network, so it does no harm.
+            for name in pwa.pwa_files:
+                p_file = os.path.join(self.p_target_dir, name)
+                if os.path.lexists(p_file):
+                    self.backup_file(p_file)
+                    os.remove(p_file)
+                    compression.remove_compressed(p_file)
+            return
 
+        def write(p_file, text):
+            p_tmp = bundle_sync.tmp_path(p_file)
+            with open(p_tmp, "w", encoding="utf-8", newline="\n") as f:
+                f.write(text)
+            if os.path.isfile(p_file) and filecmp.cmp(p_tmp, p_file, shallow=False):
+                # unchanged: browsers keep the installed service worker
+                os.remove(p_tmp)
+            else:
+                self.install_file(p_tmp, p_file)
 
-    return {'FINISHED'}
+        try:
+            name = os.path.basename(self.p_target_dir)
+            runtime_url = shared_runtime.runtime_url(self.runtime_version) if self.shared_runtime else ""
+            version = pwa.write_files(self.p_web_export_dir, self.p_target_dir, name, write, runtime_url)
+        except Exception:
+            traceback.print_exc()
+            raise ExportError("ERROR Exporting to Web", "Cannot write the service worker to '" + self.p_target_dir + "'")
+        self.report["pwa"] = {"engine_version": version}
+
+    def run_godot(self):
+        '''Run godot to overwrite the .pck web contents. Prefer the warm export daemon if enabled,
+        fall back to a one-shot Godot run if the daemon is not available. Returns Godot's exit code.'''
+        godot_returncode = None
+        t_start = time.monotonic()
+        if self.use_godot_daemon:
+            try:
+                self.godot_daemon = get_godot_daemon(self.p_godot_app, self.p_godot_project, self.godot_version)
+                self.status = "waiting for Godot export daemon"
+                self.godot_daemon.export_pack(self.p_target_pck_tmp)
+                godot_returncode = 0
+                self.report["godot_mode"] = "daemon"
+            except Exception:
+                self.check_cancelled()
+                traceback.print_exc()
+                self.warn("Godot export daemon failed. Falling back to a one-shot Godot export.")
+                t_start = time.monotonic()
+            finally:
+                self.godot_daemon = None
+        if godot_returncode is None:
+            godot_args = [
+                self.p_godot_app,
+                self.p_godot_project,
+                "--export-pack",
+                "Web",
+                self.p_target_pck_tmp,
+                "--headless"
+            ]
+            print(godot_args)
+            # Stream Godot's output to the console and the progress display
+            self.godot_proc = subprocess.Popen(godot_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace")
+            for line in self.godot_proc.stdout:
+                line = line.rstrip()
+                print(line)
+                if line:
+                    self.status = line
+            godot_returncode = self.godot_proc.wait()
+            self.report["godot_mode"] = "one-shot"
+            self.check_cancelled()
+        self.godot_seconds = time.monotonic() - t_start
+        self.report["godot_exit_code"] = godot_returncode
+        return godot_returncode
+
+    def stage_compress_bundle(self):
+        # Write .gz/.br siblings for the served files that changed (the pck, ...). The
+        # serve scripts pick the best variant according to the browser's Accept-Encoding.
+        if not self.use_precompression:
+            return
+        # The report is rewritten after this stage, a compressed sibling would be stale
+        infos = compression.compress_dir(self.p_target_dir, exclude=[export_report.report_file_name])
+        self.report["compression"] = infos
+        print(compression.format_ratios(infos))
+
+    def stage_check_budgets(self):
+        # Attribute the size of the model to objects, meshes, materials, images and animations. Runs
+        # before the backups are removed, so an export failing its budgets restores the previous one.
+        if self.budget_action == 'OFF':
+            return
+        model = None
+        if self.skipped == "glTF export and Godot pack":
+            # The glTF export was skipped, the workspace may hold the model of another scene
+            print("Size analysis: the glTF export was taken from the export cache, only the bundle is analyzed")
+        else:
+            try:
+                model = size_budget.analyze_glb(self.p_target_glb if self.draft else self.p_glb_scene)
+            except Exception:
+                traceback.print_exc()
+                self.warn("Cannot analyze the size of the exported model")
+        bundle = size_budget.analyze_bundle(self.p_target_dir)
+        print(size_budget.format_analysis(model, bundle))
+        messages = size_budget.check_budgets(model, bundle, self.budgets)
+        self.report["sizes"] = {"model": model, "bundle": bundle, "exceeded": messages}
+        if messages and self.budget_action == 'FAIL':
+            raise ExportError("ERROR Size Budget Exceeded", "\n".join(messages))
+        for msg in messages:
+            self.warn(msg)
+
+    def stage_write_deploy(self):
+        # Written from the finished bundle, after the budget checks: a failed export leaves the previous
+        # deploy build untouched
+        if not self.deploy:
+            return
+        p_deploy_dir = deploy.deploy_path(self.p_target_dir)
+        try:
+            manifest = deploy.write_deploy(self.p_target_dir, self.use_precompression)
+        except Exception:
+            traceback.print_exc()
+            raise ExportError("ERROR Exporting to Web", "Cannot write the deploy build to '" + p_deploy_dir + "'")
+        self.report["deploy"] = {"dir": p_deploy_dir, "files": {entry["source"]: entry["path"] for entry in manifest["files"]}}
+        print("Deploy build with content-hashed file names: " + p_deploy_dir)
 
-def is_godot4_present(context):
-    '''Check if the godot app file exists. If so, call it with the --version parameter and check if it outputs "4" as the first digit.'''
-    preferences = context.preferences
-    addon_prefs = preferences.addons[the_unique_name_of_the_addon].preferences
-    p_godot_app = addon_prefs.godot_path
+    def stage_remove_backups(self):
+        for p_backup, p_original in self.backups:
+            try:
+                os.remove(p_backup)
+            except Exception:
+                traceback.print_exc()
+                self.warn("Cannot remove backup of previous export '" + p_backup + "'")
+        self.backups = []
+
+    def stage_start_server(self):
+        # If "Open in Browser" export option is set (default), start the generated p_target_servebat script
+        global current_server_proc, current_server_root, current_server_port
+        if self.reuse_server:
+            # The server kept running: let it reload the open viewer(s). Open a browser
+            # only if there is none (e.g. the user closed the tab).
+            clients = notify_server(self.port)
+            if clients is not None:
+                if clients == 0 and self.open_browser:
+                    webbrowser.open("http://localhost:" + self.port + self.url_path)
+                return
+            self.warn("The running web server did not answer. Restarting it.")
+            self.kill_server()
+        if self.open_browser:
+            # Open the bat/bash/command file in its own console/terminal window (depends on platform)
+            try:
+                if self.running_on_windows:
+                    current_server_proc = subprocess.Popen(self.p_target_servebat, creationflags=subprocess.CREATE_NEW_CONSOLE)
+                else:
+                    current_server_proc = subprocess.Popen(self.p_target_servebat, shell=True, start_new_session=True)
+                current_server_root = os.path.abspath(self.p_target_dir)
+                current_server_port = self.port
+            except Exception:
+                traceback.print_exc()
+                self.warn("Could not start web server/browser to display export. Try starting '" + self.p_target_servebat + "' manually.")
+
+
+# The export currently run by the ExportWeb operator (one at a time)
+current_export_job : WebExportJob = None
+
+def do_export_web(context, filepath, open_browser, mesh_settings=None, texture_profile="NONE", draft=False, pwa=False, deploy=False):
+    '''Export synchronously, blocking until done. The ExportWeb operator runs the same stages without blocking the UI.'''
+    print("running do_export_web...")
+    job = WebExportJob(context, filepath, open_browser, mesh_settings=mesh_settings, texture_profile=texture_profile, draft=draft, pwa=pwa, deploy=deploy)
+    if not job.prepare():
+        return {'CANCELLED'}
+    return job.run()
+
+the_unique_name_of_the_stop_watching_button = "io_export_webgo.stop_watching"
+
+class ExportWatcher:
+    """Repeats an export ("Watch and Re-export") whenever the .blend file is saved or, if enabled in the
+    preferences, the scene changes. Bursts of changes are coalesced: the export starts once nothing changed
+    for the watch delay. A change during a running re-export cancels it, so the next one starts with the
+    latest state instead of queuing behind an outdated one. Re-exports keep the web server running, which
+    reloads the open browser tab (see notify_server)."""
+
+    tick_interval = 0.1
+
+    def __init__(self, filepath, mesh_settings, texture_profile, draft, pwa, deploy):
+        self.filepath = filepath
+        self.mesh_settings = mesh_settings
+        self.texture_profile = texture_profile
+        self.draft = draft
+        self.pwa = pwa
+        self.deploy = deploy
+        self.job : WebExportJob = None
+        # time.monotonic() at which to start the next export
+        self.due = None
+        # set while a stage runs on the main thread: the glTF exporter's own scene changes are no edits
+        self.exporting = False
+
+    def start(self):
+        bpy.app.timers.register(self.tick, first_interval=self.tick_interval)
+        print("Watching for changes to re-export to '" + self.filepath + "'")
+
+    def stop(self):
+        global current_export_job
+        if bpy.app.timers.is_registered(self.tick):
+            bpy.app.timers.unregister(self.tick)
+        if self.job:
+            self.job.cancel()
+            if self.job.worker:
+                self.job.worker.join()
+            self.job.finish()
+            self.job = None
+            current_export_job = None
+        print("Stopped watching for changes to re-export to '" + self.filepath + "'")
+
+    def schedule(self, reason):
+        addon_prefs = bpy.context.preferences.addons[the_unique_name_of_the_addon].preferences
+        if self.due is None:
+            print("Re-exporting to Web in " + str(round(addon_prefs.watch_delay, 1)) + " s: " + reason)
+        self.due = time.monotonic() + addon_prefs.watch_delay
+        if self.job and not self.job.cancelled:
+            print("Cancelling the outdated re-export to Web")
+            self.job.cancel()
+
+    def tick(self):
+        global current_export_job
+        if self.job:
+            self.exporting = True
+            try:
+                running = self.job.step()
+            finally:
+                self.exporting = False
+            if running:
+                return self.tick_interval
+            job = self.job
+            self.job = None
+            current_export_job = None
+            job.finish()
+        # A manual export runs: try again later
+        if self.due is not None and time.monotonic() >= self.due and not current_export_job:
+            self.due = None
+            self.start_job()
+        return self.tick_interval
+
+    def start_job(self):
+        global current_export_job
+        p_target_dir = os.path.abspath(self.filepath[:self.filepath.rindex(".")])
+        # Open a browser only if no server is left to reload one
+        serving = bool(current_server_proc and current_server_proc.poll() == None and current_server_root == p_target_dir)
+        job = WebExportJob(bpy.context, self.filepath, not serving, mesh_settings=self.mesh_settings, texture_profile=self.texture_profile, draft=self.draft, pwa=self.pwa, deploy=self.deploy)
+        job.keep_server_running = True
+        if job.prepare():
+            self.job = job
+            current_export_job = job
+
+# Set while the "Watch and Re-export" option of the last export is active
+current_watcher : ExportWatcher = None
+
+def stop_watching():
+    global current_watcher
+    if current_watcher:
+        current_watcher.stop()
+        current_watcher = None
+
+@persistent
+def on_save_post(*args):
+    if current_watcher:
+        current_watcher.schedule("the .blend file was saved")
+
+def get_version_probes_path():
+    return os.path.join(get_path(), "godot_app", "version_probes.json")
+
+def get_godot_version(p_godot_app):
+    '''Call the godot app with the --version parameter and return its output, e.g. "4.2.1.stable.official.b09f793f5". Return None if there is no such app.
+    The output is cached until the app file changes (see toolchain.probe_version).'''
     if not p_godot_app:
-        return False
+        return None
     if not os.path.isfile(p_godot_app):
-        return False
-    godot_args = [
-        p_godot_app,
-        "--version"
-    ]
-    result = subprocess.run(godot_args, capture_output = True, text = True)
-    if len(result.stdout) < 2 or int(result.stdout[0]) < 4:
+        return None
+    # A running export daemon already knows the version of its Godot app
+    if current_godot_daemon and current_godot_daemon.p_godot_app == p_godot_app and current_godot_daemon.godot_version and current_godot_daemon.is_running():
+        return current_godot_daemon.godot_version
+    p_probes = get_version_probes_path()
+    try:
+        os.makedirs(os.path.dirname(p_probes), exist_ok=True)
+    except OSError:
+        # e.g. a read-only add-on directory: probe without the file
+        p_probes = None
+    return toolchain.probe_version(p_godot_app, p_probes)
+
+def is_godot4_version(godot_version):
+    '''Check if the given output of godot --version has "4" or higher as the first digit.'''
+    if not godot_version or len(godot_version) < 2 or not godot_version[0].isdigit() or int(godot_version[0]) < 4:
         return False
     return True
 
+def is_godot4_present(context):
+    '''Check if the godot app file exists. If so, call it with the --version parameter and check if it outputs "4" as the first digit.'''
+    preferences = context.preferences
+    addon_prefs = preferences.addons[the_unique_name_of_the_addon].preferences
+    return is_godot4_version(get_godot_version(addon_prefs.godot_path))
+
 
 
 #######################################################################################################
 
 def ShowMessageBox(message = "", title = "Message Box", icon = 'INFO'):
+    if bpy.app.background:
+        # no UI, e.g. in a batch export worker. Callers print the message, too.
+        return
 
     def draw(self, context):
         self.layout.label(text=message)
@@ -283,6 +1411,10 @@ class DownloadGodotOperator(bpy.types.Operator):
     bl_idname = the_unique_name_of_the_download_button
     bl_label = "Download Godot"
 
+    # Download and unpacking run in a worker thread, the modal handler shows the progress. Esc cancels.
+    worker : threading.Thread = None
+    timer = None
+
     def execute(self, context):
         # Platform-specific info.
         # Windows:
@@ -297,81 +1429,118 @@ class DownloadGodotOperator(bpy.types.Operator):
         #    platform.system(): "Darwin"
         #    Download-URL:      https://github.com/godotengine/godot-builds/releases/download/4.1.3-stable/Godot_v4.1.3-stable_macos.universal.zip
         #    Executable:        Godot.app (Folder)   OR   Godot.app/Contents/MacOS/Godot (Executable)
-        godot_version = the_required_godot_version
-        godot_platform = "unknown"
-        godot_app = "unknown"
-        match platform.system():
-            case "Windows":
-                godot_platform = "win64.exe"
-                godot_app = "Godot_v" + godot_version + "_" + godot_platform
-            case "Linux":
-                godot_platform = "linux.x86_64"
-                godot_app = "Godot_v" + godot_version + "_" + godot_platform
-            case "Darwin":
-                godot_platform = "macos.universal"
-                godot_app = "Godot.app/Contents/MacOS/Godot"
-        if godot_platform == "unknown":
-            report_error(header = "ERROR Downloading Godot", msg = "Unknown platform '" + platform.system() +"'")
+        # (see toolchain.platforms)
+        system = platform.system()
+        if system not in toolchain.platforms:
+            report_error(header = "ERROR Downloading Godot", msg = "Unknown platform '" + system +"'")
             return {'CANCELLED'}
 
-        # Construct necessery paths
-        file_name = "Godot_v" + godot_version + "_" + godot_platform + ".zip"
-        download_url = "https://github.com/godotengine/godot-builds/releases/download/" + godot_version + "/" + file_name
-        p_addon = get_path()
-        p_local_dir_path = os.path.join(p_addon, "godot_app")
-        p_local_zip_path = os.path.join(p_local_dir_path, file_name)
-        p_local_app_path = os.path.join(p_local_dir_path, godot_app)
-        
-        # Check if local dir 'godot_app' exists and create if not
-        if not os.path.isdir(p_local_dir_path):
-            try:
-                os.makedirs(p_local_dir_path)
-            except Exception:
-                traceback.print_exc()
-                report_error(header = "ERROR Downloading Godot", msg = "Cannot create directory'" + p_local_dir_path +"'")
-                return {'CANCELLED'}
+        addon_prefs = context.preferences.addons[the_unique_name_of_the_addon].preferences
+        self.godot_version = the_required_godot_version
+        self.file_name = toolchain.archive_name(self.godot_version, system)
+        self.godot_app = toolchain.app_path(self.godot_version, system)
+        self.p_local_dir_path = os.path.join(get_path(), "godot_app")
+        if addon_prefs.artifact_cache_dir:
+            self.p_cache_dir = bpy.path.abspath(addon_prefs.artifact_cache_dir)
+        else:
+            self.p_cache_dir = os.path.join(self.p_local_dir_path, "downloads")
+        self.mirrors = [addon_prefs.godot_mirror_url] if addon_prefs.godot_mirror_url else []
+        self.cancel_event = threading.Event()
+        self.status = "Downloading Godot"
+        self.fraction = 0.0
+        self.p_local_app_path = None
+        self.error = None
+
+        if bpy.app.background or not context.window:
+            # No UI to keep responsive
+            self.download_and_install()
+            return self.end(context)
+        self.worker = threading.Thread(target=self.download_and_install, daemon=True)
+        self.worker.start()
+        wm = context.window_manager
+        wm.progress_begin(0, 100)
+        self.timer = wm.event_timer_add(0.1, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
 
-        # Download Godot from official GitHub repo
-        print("Downloading Godot from '", download_url, "' to '", p_local_zip_path, "'")
-        try:
-            urlretrieve(download_url, p_local_zip_path)
-        except Exception:
-            traceback.print_exc()
-            report_error(header = "ERROR Downloading Godot", msg = "Cannot download Godot from '" + download_url +"'")
-            return {'CANCELLED'}
+    def on_progress(self, done, total):
+        # Called by the worker thread
+        if total:
+            self.fraction = done / total
+            self.status = "Downloading Godot: " + format(done / 1048576, ".1f") + " of " + format(total / 1048576, ".1f") + " MB (Esc to cancel)"
+        else:
+            self.status = "Downloading Godot: " + format(done / 1048576, ".1f") + " MB (Esc to cancel)"
 
-        # Unzip the download
+    def download_and_install(self):
         try:
-            shutil.unpack_archive(p_local_zip_path, p_local_dir_path)
-        except Exception:
+            # From the artifact cache, a mirror or GitHub, verified by the release's SHA-512 checksums
+            p_local_zip_path = toolchain.fetch_artifact(self.godot_version, self.file_name, self.p_cache_dir, self.mirrors, self.on_progress, self.cancel_event)
+            self.status = "Unpacking Godot"
+            self.p_local_app_path = toolchain.install(p_local_zip_path, self.p_local_dir_path, self.godot_app, self.cancel_event)
+        except toolchain.DownloadCancelled:
+            pass
+        except Exception as e:
             traceback.print_exc()
-            report_error(header = "ERROR Downloading Godot", msg = "Cannot unzip downloaded Godot at '" + p_local_zip_path +"'")
+            self.error = str(e)
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            # A partial download is kept and resumed by the next attempt
+            self.cancel_event.set()
+            return {'RUNNING_MODAL'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        if self.worker.is_alive():
+            context.window_manager.progress_update(int(100 * self.fraction))
+            context.workspace.status_text_set(self.status)
+            return {'PASS_THROUGH'}
+        return self.end(context)
+
+    def end(self, context):
+        if self.timer:
+            wm = context.window_manager
+            wm.event_timer_remove(self.timer)
+            wm.progress_end()
+            context.workspace.status_text_set(None)
+        if self.error:
+            report_error(header = "ERROR Downloading Godot", msg = self.error)
             return {'CANCELLED'}
-
-        # Make the unzipped godot app executable
-        try:
-            st = os.stat(p_local_app_path)
-            os.chmod(p_local_app_path, st.st_mode | stat.S_IXGRP | stat.S_IXUSR | stat.S_IXOTH)
-        except Exception:
-            traceback.print_exc()
-            report_error(header = "ERROR Downloading Godot", msg = "Cannot set execution flag on downloaded Godot app  '" + p_local_app_path +"'")
+        if not self.p_local_app_path:
+            self.report({'WARNING'}, "Download of Godot cancelled")
             return {'CANCELLED'}
 
-        # Delete the zip file
-        try:
-            os.remove(p_local_zip_path)
-        except Exception:
-            traceback.print_exc()
-            report_error(header = "Warning", msg = "Cannot remove Godot zip file after extracting it '" + p_local_zip_path +"'")
-
         # Set the path to downloaded Godot in this Add-On's preferences
-        preferences = context.preferences
-        addon_prefs = preferences.addons[the_unique_name_of_the_addon].preferences
-        addon_prefs.godot_path = p_local_app_path
+        addon_prefs = context.preferences.addons[the_unique_name_of_the_addon].preferences
+        addon_prefs.godot_path = self.p_local_app_path
+        self.report({'INFO'}, "Godot installed at " + self.p_local_app_path)
+        return {'FINISHED'}
+
+
+class ClearExportCacheOperator(bpy.types.Operator):
+    """Remove all Godot packs cached by previous exports. The next export of each scene will run the glTF export and Godot again"""
+    bl_idname = the_unique_name_of_the_clear_cache_button
+    bl_label = "Clear Export Cache"
 
+    def execute(self, context):
+        get_export_cache().clear()
         return {'FINISHED'}
 
 
+class StopWatchingOperator(bpy.types.Operator):
+    """Stop re-exporting to Web on changes (see the Watch and Re-export option). Cancels a running re-export"""
+    bl_idname = the_unique_name_of_the_stop_watching_button
+    bl_label = "Stop Watching Web Export"
+
+    def execute(self, context):
+        stop_watching()
+        return {'FINISHED'}
+
+
+def update_use_godot_daemon(self, context):
+    if not self.use_godot_daemon:
+        stop_godot_daemon()
+
+
 class ExportWebPreferences(AddonPreferences):
     # this must match the add-on name, use '__package__'
     # when defining this in a submodule of a python package.
@@ -382,6 +1551,98 @@ class ExportWebPreferences(AddonPreferences):
         description="Valid file path to the local Godot 4 Application/Executable. If you already downloaded Godot 4 without MONO, specify your local installation here. Ohterwise, use the 'Download Godot' button above to download an appropriate Godot version and set the path automatically",
         subtype='FILE_PATH',
     )
+    godot_mirror_url: StringProperty(
+        name="Download Mirror",
+        description="Base URL of a mirror of the Godot release downloads, tried before GitHub (laid out like GitHub: <URL>/<version>/<file>), e.g. a machine serving its download cache with 'toolchain.py serve'. Empty: download from GitHub",
+        default="",
+    )
+    artifact_cache_dir: StringProperty(
+        name="Download Cache",
+        description="Directory keeping the downloaded Godot archives, verified by their SHA-512 checksums, e.g. a network drive shared by several machines. Empty: the 'godot_app/downloads' folder of the add-on",
+        subtype='DIR_PATH',
+        default="",
+    )
+    use_export_cache: BoolProperty(
+        name="Use Export Cache",
+        description="Reuse previously built Godot packs if neither the exported scene nor the Godot viewer project changed. Skips the Godot run (and the glTF export if the .blend file is saved and unchanged)",
+        default=True,
+    )
+    use_incremental_gltf: BoolProperty(
+        name="Incremental glTF Export",
+        description="Keep the last glTF export of each scene. When only some objects were moved or their geometry changed since, update that export instead of exporting the whole scene again. Objects that changed in other ways, such as their materials or animations, still cause a full export",
+        default=True,
+    )
+    use_godot_daemon: BoolProperty(
+        name="Keep Godot Running",
+        description="Start a headless Godot once and keep it running in the background to export packs. Saves the Godot start-up and project import time on each export. Falls back to starting Godot for each export if the background Godot fails",
+        default=False,
+        update=update_use_godot_daemon,
+    )
+    use_precompression: BoolProperty(
+        name="Precompress Web Files",
+        description="Write gzip (and brotli, if available) compressed copies of the engine and pack files. The local web server sends them to browsers accepting these encodings, which reduces download size and time",
+        default=True,
+    )
+    export_layout: EnumProperty(
+        name="Export Layout",
+        description="Where the engine files (index.wasm, index.js, ...) of an export go",
+        items=[
+            ('COPY', "Self-contained", "Each exported folder holds its own copy of the engine files (hard-linked to the add-on's files where possible)"),
+            ('SHARED', "Shared Engine Runtime", "The engine files are written once per engine version to a 'webgo_runtime' folder next to the exported folders, which only hold their index.html and pack. Serve the parent folder to view them"),
+        ],
+        default='COPY',
+    )
+    keep_server_running: BoolProperty(
+        name="Keep Web Server Running",
+        description="When exporting to the same location again, keep the local web server running and reload the open browser tab instead of starting a new server and opening a new tab",
+        default=True,
+    )
+    watch_scene_changes: BoolProperty(
+        name="Re-export on Scene Changes",
+        description="With 'Watch and Re-export', export again after any change to the scene. Otherwise only saving the .blend file starts a re-export",
+        default=True,
+    )
+    watch_delay: FloatProperty(
+        name="Watch Delay (s)",
+        description="With 'Watch and Re-export', start exporting once nothing changed for this many seconds, so a burst of edits leads to a single export",
+        default=1.0,
+        min=0.1,
+        max=60.0,
+    )
+    budget_action: EnumProperty(
+        name="Size Budgets",
+        description="What to do if an export exceeds one of the size budgets below. The export report lists the sizes of the exported objects, meshes, materials, images, animations and web files in any case but 'Off'",
+        items=[
+            ('OFF', "Off", "Do not analyze the export size"),
+            ('WARN', "Warn", "Report exceeded budgets as warnings"),
+            ('FAIL', "Fail Export", "Fail the export and keep the previous one if a budget is exceeded"),
+        ],
+        default='WARN',
+    )
+    budget_download_mb: FloatProperty(
+        name="Download (MB)",
+        description="Maximum size of all files the browser downloads, after compression. 0: no limit",
+        default=0.0,
+        min=0.0,
+    )
+    budget_model_mb: FloatProperty(
+        name="Model (MB)",
+        description="Maximum size of the exported glTF model. 0: no limit",
+        default=0.0,
+        min=0.0,
+    )
+    budget_textures_mb: FloatProperty(
+        name="Textures (MB)",
+        description="Maximum size of all exported textures. 0: no limit",
+        default=0.0,
+        min=0.0,
+    )
+    budget_object_mb: FloatProperty(
+        name="Object (MB)",
+        description="Maximum size of a single object (its mesh, textures and animation). 0: no limit",
+        default=0.0,
+        min=0.0,
+    )
     number: IntProperty(
         name="Example Number",
         default=4,
@@ -394,6 +1655,29 @@ class ExportWebPreferences(AddonPreferences):
     def draw(self, context):
         layout = self.layout
         draw_godot_download_settings(self)
+        row = layout.row()
+        row.prop(self, "use_export_cache")
+        row.operator(the_unique_name_of_the_clear_cache_button)
+        row = layout.row()
+        row.enabled = self.use_export_cache
+        row.prop(self, "use_incremental_gltf")
+        layout.prop(self, "use_godot_daemon")
+        layout.prop(self, "use_precompression")
+        layout.prop(self, "export_layout")
+        layout.prop(self, "keep_server_running")
+        row = layout.row()
+        row.prop(self, "watch_scene_changes")
+        row.prop(self, "watch_delay")
+        box = layout.box()
+        box.prop(self, "budget_action")
+        col = box.column()
+        col.enabled = self.budget_action != 'OFF'
+        row = col.row()
+        row.prop(self, "budget_download_mb")
+        row.prop(self, "budget_model_mb")
+        row = col.row()
+        row.prop(self, "budget_textures_mb")
+        row.prop(self, "budget_object_mb")
 
         #layout.label(text="Download Godot v4 or higher (WIHTOUT mono)")
         #layout.label(text="from godotengine.org/download,")
@@ -415,7 +1699,7 @@ class ExportWebPreferences(AddonPreferences):
 #######################################################################################################
 
 class ExportWeb(Operator, ExportHelper):
-    """This appears in the tooltip of the operator and in the generated docs"""
+    """Export the scene to a web application displayable in web browsers. Press Esc to cancel a running export"""
     bl_idname = "export_scene.web"  # important since its how bpy.ops.export_scene.web is constructed
     bl_label = "Export Web"
     bl_options = {'UNDO', 'PRESET'}
@@ -444,6 +1728,83 @@ class ExportWeb(Operator, ExportHelper):
         default=True,
     )
 
+    mesh_quantization: BoolProperty(
+        name="Quantize Vertex Data",
+        description="Let Godot store positions, normals, tangents and UVs with fewer bits. Makes the export smaller and faster to load",
+        default=default_mesh_settings["quantize"],
+    )
+
+    mesh_tangents: BoolProperty(
+        name="Generate Tangents",
+        description="Generate tangents for meshes without them. Only needed for normal maps",
+        default=default_mesh_settings["tangents"],
+    )
+
+    mesh_lods: BoolProperty(
+        name="Generate LODs",
+        description="Let Godot generate simplified versions of each mesh for rendering at a distance. Makes the export larger",
+        default=default_mesh_settings["lods"],
+    )
+
+    mesh_shadow_meshes: BoolProperty(
+        name="Generate Shadow Meshes",
+        description="Let Godot generate position-only copies of each mesh for rendering shadows. Makes the export larger",
+        default=default_mesh_settings["shadow_meshes"],
+    )
+
+    mesh_optimize_order: BoolProperty(
+        name="Optimize Mesh Order",
+        description="Reorder triangles and vertices of the exported meshes for faster rendering",
+        default=default_mesh_settings["optimize_order"],
+    )
+
+    mesh_instancing: BoolProperty(
+        name="Instance Repeated Meshes",
+        description="Store identical meshes once and draw objects sharing a mesh (e.g. linked duplicates) together with GPU instancing. Makes scenes with many copies of the same objects smaller and faster to render",
+        default=default_mesh_settings["instancing"],
+    )
+
+    watch: BoolProperty(
+        name="Watch and Re-export",
+        description="After this export, export again whenever the .blend file is saved or the scene changes (see the add-on preferences). The open browser tab reloads with each new export. Stop with File > Export > Stop Watching Web Export",
+        default=False,
+    )
+
+    draft: BoolProperty(
+        name="Draft (Stream Model)",
+        description="Export faster by not building a Godot pack for the model. The viewer loads the glTF model at runtime instead, without Godot's import optimizations",
+        default=False,
+    )
+
+    pwa: BoolProperty(
+        name="Cache Engine in Browser (PWA)",
+        description="Add a service worker keeping the engine files in the browser's cache, so later visits and new exports start without downloading the engine again, and a web app manifest for installing the viewer as an app",
+        default=False,
+    )
+
+    deploy: BoolProperty(
+        name="Deploy Build (Hashed Names)",
+        description="Also write a copy of the export for web servers and CDNs next to it (<folder>.deploy), with the content hash in the file names, so all files but index.html can be cached by browsers for a year",
+        default=False,
+    )
+
+    texture_profile: EnumProperty(
+        name="Texture Quality",
+        description="Maximum resolution and compression of the exported textures. Duplicate textures are always removed",
+        items=[(key, label, "") for key, (label, max_size, quality) in textures.profiles.items()],
+        default="NONE",
+    )
+
+    def mesh_settings(self):
+        return {
+            "quantize": self.mesh_quantization,
+            "tangents": self.mesh_tangents,
+            "lods": self.mesh_lods,
+            "shadow_meshes": self.mesh_shadow_meshes,
+            "optimize_order": self.mesh_optimize_order,
+            "instancing": self.mesh_instancing,
+        }
+
     type: EnumProperty(
         name="Example Enum",
         description="Choose between two items",
@@ -454,11 +1815,77 @@ class ExportWeb(Operator, ExportHelper):
         default='OPT_A',
     )
 
+    job : WebExportJob = None
+    timer = None
+
     def execute(self, context):
-        return do_export_web(context, self.filepath, self.open_browser)
-    
+        global current_export_job
+        # A new export replaces the watched one
+        stop_watching()
+        if current_export_job:
+            report_error(header = "ERROR Exporting to Web", msg = "Another export to Web is still running. Wait for it to finish or cancel it with Esc.")
+            return {'CANCELLED'}
+        if bpy.app.background or not context.window:
+            # No UI to keep responsive (e.g. called from a script in background mode)
+            return do_export_web(context, self.filepath, self.open_browser, self.mesh_settings(), self.texture_profile, self.draft, self.pwa, self.deploy)
+
+        # Run the export stage by stage from a timer, so Blender stays responsive
+        self.job = WebExportJob(context, self.filepath, self.open_browser, mesh_settings=self.mesh_settings(), texture_profile=self.texture_profile, draft=self.draft, pwa=self.pwa, deploy=self.deploy)
+        if self.watch:
+            # keep the server for the re-exports
+            self.job.keep_server_running = True
+        if not self.job.prepare():
+            return {'CANCELLED'}
+        current_export_job = self.job
+        wm = context.window_manager
+        wm.progress_begin(0, len(self.job.stages))
+        self.timer = wm.event_timer_add(0.1, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS' and not self.job.cancelled:
+            # Kill Godot (if running). The job rolls back the target directory once the current stage ended.
+            self.job.cancel()
+            context.workspace.status_text_set(self.job.progress_text())
+            return {'RUNNING_MODAL'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        if self.job.step():
+            context.window_manager.progress_update(self.job.stage_index)
+            context.workspace.status_text_set(self.job.progress_text())
+            return {'PASS_THROUGH'}
+
+        # All stages done, failed or cancelled
+        return self.end(context)
+
+    def end(self, context):
+        global current_export_job, current_watcher
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        current_export_job = None
+        result = self.job.finish()
+        if 'FINISHED' in result:
+            self.report({'INFO'}, "Exported to Web: " + self.job.p_target_dir)
+            if self.watch:
+                current_watcher = ExportWatcher(self.filepath, self.mesh_settings(), self.texture_profile, self.draft, self.pwa, self.deploy)
+                current_watcher.start()
+        elif self.job.cancelled:
+            self.report({'WARNING'}, "Export to Web cancelled")
+        return result
+
     def invoke(self, context, event):
         self.godot_present = is_godot4_present(context)
+        addon_prefs = context.preferences.addons[the_unique_name_of_the_addon].preferences
+        if self.godot_present and addon_prefs.use_godot_daemon:
+            # Launch the export daemon now, so it can scan and import the project while the user picks a file
+            try:
+                get_godot_daemon(addon_prefs.godot_path, os.path.join(get_daemon_workspace().p_dir, "project.godot")).start()
+            except Exception:
+                traceback.print_exc()
         context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
@@ -475,6 +1902,23 @@ class ExportWeb(Operator, ExportHelper):
         # self.godot_path = addon_prefs.godot_path
         layout.label(text="Godot 4 is present", icon='CHECKMARK')
         layout.prop(self, "open_browser")
+        layout.prop(self, "draft")
+        layout.prop(self, "pwa")
+        layout.prop(self, "deploy")
+        layout.prop(self, "watch")
+
+        box = layout.box()
+        box.label(text="Meshes")
+        box.prop(self, "mesh_quantization")
+        box.prop(self, "mesh_tangents")
+        box.prop(self, "mesh_lods")
+        box.prop(self, "mesh_shadow_meshes")
+        box.prop(self, "mesh_optimize_order")
+        box.prop(self, "mesh_instancing")
+
+        box = layout.box()
+        box.label(text="Textures")
+        box.prop(self, "texture_profile")
 
 
 #######################################################################################################
@@ -483,6 +1927,8 @@ class ExportWeb(Operator, ExportHelper):
 # Only needed if you want to add into a dynamic menu
 def menu_func_export(self, context):
     self.layout.operator(ExportWeb.bl_idname, text="Web Exporter")
+    if current_watcher:
+        self.layout.operator(the_unique_name_of_the_stop_watching_button)
 
 # We can store multiple preview collections here,
 # however in this example we only store "main"
@@ -506,21 +1952,38 @@ def register():
     preview_collections["main"] = pcoll
 
     bpy.utils.register_class(DownloadGodotOperator)
+    bpy.utils.register_class(ClearExportCacheOperator)
+    bpy.utils.register_class(StopWatchingOperator)
     bpy.utils.register_class(ExportWeb)
     bpy.utils.register_class(ExportWebPreferences)    
     bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+    bpy.app.handlers.load_post.append(on_load_post)
+    bpy.app.handlers.save_post.append(on_save_post)
+    bpy.app.handlers.undo_post.append(on_undo_redo)
+    bpy.app.handlers.redo_post.append(on_undo_redo)
 
 
 def unregister():
+    stop_watching()
+    stop_godot_daemon()
+
     # Custom icon deregistration
     for pcoll in preview_collections.values():
          bpy.utils.previews.remove(pcoll)
     preview_collections.clear()
 
     bpy.utils.unregister_class(DownloadGodotOperator)
+    bpy.utils.unregister_class(ClearExportCacheOperator)
+    bpy.utils.unregister_class(StopWatchingOperator)
     bpy.utils.unregister_class(ExportWeb)
     bpy.utils.unregister_class(ExportWebPreferences)    
     bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
+    bpy.app.handlers.depsgraph_update_post.remove(on_depsgraph_update)
+    bpy.app.handlers.load_post.remove(on_load_post)
+    bpy.app.handlers.save_post.remove(on_save_post)
+    bpy.app.handlers.undo_post.remove(on_undo_redo)
+    bpy.app.handlers.redo_post.remove(on_undo_redo)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,368 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Command line batch export of many .blend files to web bundles:
+#
+#   blender --background --python <add-on dir>/batch_export.py -- "models/**/*.blend" --out <dir> [--jobs N]
+#
+# This Blender process only coordinates. It runs a pool of worker Blender
+# processes (each one loading a single .blend file and running the same export
+# stages as the ExportWeb operator, including Godot), each with its own
+# workspace (see workspaces.py), so the workers do not overwrite each other's
+# model and import cache. Failed files are retried. The per-file status and timings
+# are written to batch_summary.json in the output directory.
+
+import os
+import sys
+import glob
+import json
+import time
+import signal
+import argparse
+import platform
+import threading
+import traceback
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import bpy
+import addon_utils
+
+the_unique_name_of_the_addon = "io_export_webgo"
+
+summary_file_name = "batch_summary.json"
+
+
+class ArgumentParserForBlender(argparse.ArgumentParser):
+    """Parses only the arguments after '--', all others are Blender's (see serve_blend.py)."""
+
+    def parse_args(self, args=None):
+        if args is None:
+            try:
+                idx = sys.argv.index("--")
+                args = sys.argv[idx+1:]
+            except ValueError:
+                args = []
+        return super().parse_args(args=args)
+
+
+def import_addon():
+    '''Enable the add-on and return its module. If it is not installed in Blender, it is imported
+    from the directory containing this script.'''
+    p_parent = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    if p_parent not in sys.path:
+        # append, so an installed add-on takes precedence
+        sys.path.append(p_parent)
+    addon = addon_utils.enable(the_unique_name_of_the_addon, default_set=True)
+    if addon is None:
+        raise RuntimeError("Cannot enable the add-on '" + the_unique_name_of_the_addon + "'")
+    return addon
+
+
+def expand_inputs(inputs):
+    '''Return the absolute paths of all .blend files given as files, directories or glob patterns (in order, without duplicates).'''
+    p_blends = []
+    for p_input in inputs:
+        if glob.has_magic(p_input):
+            matches = sorted(glob.glob(p_input, recursive=True))
+        elif os.path.isdir(p_input):
+            matches = sorted(glob.glob(os.path.join(p_input, "*.blend")))
+        else:
+            matches = [p_input]
+        for p_blend in matches:
+            p_blend = os.path.abspath(p_blend)
+            if p_blend not in p_blends:
+                p_blends.append(p_blend)
+    return p_blends
+
+
+def assign_targets(p_blends, p_out_dir, batch_extension):
+    '''Map each .blend file to its launcher file in p_out_dir (the bundle is the directory of the same name).
+    Files with the same name from different directories get a numbered suffix.'''
+    targets = {}
+    used = set()
+    for p_blend in p_blends:
+        name = os.path.splitext(os.path.basename(p_blend))[0]
+        unique_name = name
+        i = 2
+        while unique_name.lower() in used:
+            unique_name = name + "_" + str(i)
+            i += 1
+        used.add(unique_name.lower())
+        targets[p_blend] = os.path.join(p_out_dir, unique_name + batch_extension)
+    return targets
+
+
+def kill_process_tree(proc):
+    '''Kill a worker Blender together with the Godot it may have started.'''
+    try:
+        if platform.system() == "Windows":
+            subprocess.call(['taskkill', '/F', '/T', '/PID', str(proc.pid)])
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except Exception:
+        traceback.print_exc()
+
+
+class BatchExport:
+    """Runs the worker processes and collects the per-file results."""
+
+    def __init__(self, args, addon):
+        self.args = args
+        self.addon = addon
+        self.p_out_dir = os.path.abspath(args.out)
+        self.p_blends = expand_inputs(args.inputs)
+        self.targets = assign_targets(self.p_blends, self.p_out_dir, addon.get_batch_extension())
+        self.jobs = max(1, min(args.jobs, len(self.p_blends)))
+        self.results = []
+        self.lock = threading.Lock()
+        self.done = 0
+        # Workspaces (private viewer project copies) are shared with interactive exports and other batches
+        self.workspace_pool = addon.get_workspace_pool()
+
+    def worker_args(self, p_blend, p_viewer_dir):
+        worker_args = [
+            bpy.app.binary_path,
+            "--background",
+            p_blend,
+            "--python-exit-code",
+            "1",
+            "--python",
+            os.path.realpath(__file__),
+            "--",
+            "--worker",
+            "--out",
+            self.targets[p_blend],
+            "--viewer-dir",
+            p_viewer_dir,
+        ]
+        if self.args.godot:
+            worker_args += ["--godot", self.args.godot]
+        if self.args.no_cache:
+            worker_args.append("--no-cache")
+        for flag in ("no_quantization", "no_tangents", "no_lods", "no_shadow_meshes", "optimize_mesh_order", "instancing"):
+            if getattr(self.args, flag):
+                worker_args.append("--" + flag.replace("_", "-"))
+        worker_args += ["--texture-profile", self.args.texture_profile]
+        if self.args.draft:
+            worker_args.append("--draft")
+        if self.args.pwa:
+            worker_args.append("--pwa")
+        if self.args.deploy:
+            worker_args.append("--deploy")
+        if self.args.shared_runtime:
+            worker_args.append("--shared-runtime")
+        for viewer_arg in self.args.viewer_arg:
+            worker_args.append("--viewer-arg=" + viewer_arg)
+        return worker_args
+
+    def run_worker(self, p_blend, p_log, attempt):
+        '''Export a single file in a worker Blender. Returns (status, exit code).'''
+        workspace = self.workspace_pool.acquire()
+        p_viewer_dir = workspace.p_dir
+        try:
+            # the log of a file keeps the output of all attempts of this batch run
+            with open(p_log, "a" if attempt else "w", encoding="utf-8", errors="replace") as log:
+                log.write("\n=== " + time.strftime("%Y-%m-%d %H:%M:%S") + " " + p_blend + "\n")
+                log.flush()
+                if platform.system() == "Windows":
+                    proc = subprocess.Popen(self.worker_args(p_blend, p_viewer_dir), stdout=log, stderr=subprocess.STDOUT)
+                else:
+                    # own process group, so a timeout kills Godot, too
+                    proc = subprocess.Popen(self.worker_args(p_blend, p_viewer_dir), stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+                try:
+                    exit_code = proc.wait(self.args.timeout)
+                except subprocess.TimeoutExpired:
+                    kill_process_tree(proc)
+                    proc.wait()
+                    return "timeout", None
+        finally:
+            workspace.release()
+        return ("ok" if exit_code == 0 else "failed"), exit_code
+
+    def export_file(self, p_blend):
+        p_target = self.targets[p_blend]
+        p_bundle = os.path.splitext(p_target)[0]
+        p_log = p_bundle + ".log"
+        result = {"blend": p_blend, "target": p_target, "log": p_log, "attempts": 0}
+        t_start = time.monotonic()
+        for attempt in range(1 + self.args.retries):
+            result["attempts"] += 1
+            try:
+                result["status"], result["exit_code"] = self.run_worker(p_blend, p_log, attempt)
+            except Exception as e:
+                traceback.print_exc()
+                result["status"], result["exit_code"] = "failed", None
+                result["error"] = str(e)
+            if result["status"] == "ok":
+                break
+        result["seconds"] = round(time.monotonic() - t_start, 4)
+        # stage timings measured by the worker
+        report = None
+        if result["status"] == "ok":
+            try:
+                with open(os.path.join(p_bundle, "export_report.json"), "r", encoding="utf-8") as f:
+                    report = json.load(f)
+            except Exception:
+                traceback.print_exc()
+        if report:
+            result["export_seconds"] = report.get("total_seconds")
+            result["stages"] = {stage["name"]: stage["seconds"] for stage in report.get("stages", []) if "/" not in stage["name"]}
+            result["cache_hit"] = report.get("cache", {}).get("hit")
+        with self.lock:
+            self.done += 1
+            self.results.append(result)
+            print("[" + str(self.done) + "/" + str(len(self.p_blends)) + "] " + result["status"] + ": " + p_blend + " (" + format(result["seconds"], ".1f") + " s, " + str(result["attempts"]) + " attempt(s))")
+            sys.stdout.flush()
+        return result
+
+    def run(self):
+        '''Export all files. Returns the summary.'''
+        t_start = time.monotonic()
+        os.makedirs(self.p_out_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            list(executor.map(self.export_file, self.p_blends))
+        # keep the order of the command line
+        order = {p_blend: i for i, p_blend in enumerate(self.p_blends)}
+        self.results.sort(key=lambda result: order[result["blend"]])
+        return {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "jobs": self.jobs,
+            "total_seconds": round(time.monotonic() - t_start, 4),
+            "files": len(self.results),
+            "ok": sum(1 for result in self.results if result["status"] == "ok"),
+            "failed": sum(1 for result in self.results if result["status"] != "ok"),
+            "results": self.results,
+        }
+
+
+def write_summary(summary, p_summary):
+    p_tmp = p_summary + ".tmp"
+    with open(p_tmp, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(p_tmp, p_summary)
+
+
+def run_batch(args):
+    addon = import_addon()
+    addon_prefs = bpy.context.preferences.addons[the_unique_name_of_the_addon].preferences
+    p_godot_app = args.godot or addon_prefs.godot_path
+    if not addon.is_godot4_version(addon.get_godot_version(p_godot_app)):
+        print("ERROR: Godot 4 or higher is not available at '" + str(p_godot_app) + "'. Download Godot in the add-on preferences or pass --godot.")
+        return 2
+
+    batch = BatchExport(args, addon)
+    if not batch.p_blends:
+        print("ERROR: No .blend files found for " + " ".join(args.inputs))
+        return 2
+    print("Exporting " + str(len(batch.p_blends)) + " file(s) to '" + batch.p_out_dir + "' with " + str(batch.jobs) + " worker(s)")
+
+    # Compress the web template once here instead of in each worker's viewer copy
+    if addon_prefs.use_precompression:
+        compression = addon.compression
+        compression.compress_dir(os.path.join(addon.get_path(), "godot_viewer", "export", "web"), compression.brotli_quality_max)
+
+    summary = batch.run()
+    p_summary = args.summary or os.path.join(batch.p_out_dir, summary_file_name)
+    write_summary(summary, p_summary)
+    print("Exported " + str(summary["ok"]) + " of " + str(summary["files"]) + " file(s) in " + format(summary["total_seconds"], ".1f") + " s. Summary written to '" + p_summary + "'")
+    for result in summary["results"]:
+        if result["status"] != "ok":
+            print("  " + result["status"] + ": " + result["blend"] + " (see '" + result["log"] + "')")
+    return 0 if summary["failed"] == 0 else 1
+
+
+def import_gltf(p_gltf):
+    '''Replace the objects of the startup scene by the contents of a glTF file (see export_farm.py).'''
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj)
+    result = bpy.ops.import_scene.gltf(filepath=p_gltf)
+    if result != {'FINISHED'}:
+        raise RuntimeError("Cannot import '" + p_gltf + "'")
+
+
+def run_worker(args):
+    '''Export the .blend file loaded by this (worker) Blender, or the glTF file given by --import-gltf.'''
+    addon = import_addon()
+    if args.import_gltf:
+        import_gltf(args.import_gltf)
+    mesh_settings = {
+        "quantize": not args.no_quantization,
+        "tangents": not args.no_tangents,
+        "lods": not args.no_lods,
+        "shadow_meshes": not args.no_shadow_meshes,
+        "optimize_order": args.optimize_mesh_order,
+        "instancing": args.instancing,
+    }
+    job = addon.WebExportJob(bpy.context, os.path.abspath(args.out), False, viewer_dir=args.viewer_dir, mesh_settings=mesh_settings, texture_profile=args.texture_profile, draft=args.draft, viewer_args=args.viewer_arg, pwa=args.pwa, deploy=args.deploy)
+    # A long-lived Godot does not pay off for a single export
+    job.use_godot_daemon = False
+    # A fresh worker process has no previous export to update, storing its glTF export as a base for
+    # incremental exports would only fill the shared export cache
+    job.use_incremental_gltf = False
+    if args.godot:
+        job.p_godot_app = args.godot
+    if args.no_cache:
+        job.use_export_cache = False
+    if args.shared_runtime:
+        job.export_layout = 'SHARED'
+    if not job.prepare():
+        return 1
+    return 0 if job.run() == {'FINISHED'} else 1
+
+
+def make_parser():
+    parser = ArgumentParserForBlender(description="Export many .blend files to web bundles in parallel.")
+    parser.add_argument("inputs", nargs="*", help=".blend files, directories or glob patterns (quote them, ** matches sub-directories)")
+    parser.add_argument("--out", required=True, help="output directory (worker: launcher file to export to)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="number of files exported in parallel (default: number of CPUs)")
+    parser.add_argument("--retries", type=int, default=1, help="how often a failed file is retried (default: 1)")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds after which a single export attempt is killed")
+    parser.add_argument("--godot", default=None, help="Godot app to use instead of the one set in the add-on preferences")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the export cache")
+    parser.add_argument("--no-quantization", action="store_true", help="store vertex data at full precision")
+    parser.add_argument("--no-tangents", action="store_true", help="do not generate missing tangents")
+    parser.add_argument("--no-lods", action="store_true", help="do not generate mesh LODs")
+    parser.add_argument("--no-shadow-meshes", action="store_true", help="do not generate shadow meshes")
+    parser.add_argument("--optimize-mesh-order", action="store_true", help="reorder triangles and vertices for faster rendering")
+    parser.add_argument("--instancing", action="store_true", help="store identical meshes once and draw repeated meshes with GPU instancing")
+    parser.add_argument("--texture-profile", choices=["NONE", "HIGH", "MEDIUM", "LOW"], default="NONE", help="scale textures down to 2048 (HIGH), 1024 (MEDIUM) or 512 (LOW) px and re-encode them (default: NONE, only remove duplicates)")
+    parser.add_argument("--draft", action="store_true", help="draft export: the viewer loads the glTF model at runtime instead of a Godot pack built for it")
+    parser.add_argument("--pwa", action="store_true", help="add a service worker caching the engine files in the browser (see pwa.py)")
+    parser.add_argument("--deploy", action="store_true", help="also write a deploy build with content-hashed file names next to each export (see deploy.py)")
+    parser.add_argument("--shared-runtime", action="store_true", help="write the engine files once to <out>/webgo_runtime instead of into each exported folder (see shared_runtime.py)")
+    parser.add_argument("--summary", default=None, help="summary file (default: <out>/" + summary_file_name + ")")
+    # used by the coordinator to start workers
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--viewer-dir", default=None, help=argparse.SUPPRESS)
+    # used by export_farm.py to export uploaded .glb files
+    parser.add_argument("--import-gltf", default=None, help=argparse.SUPPRESS)
+    # command line arguments of the exported viewer (see benchmark_draft.py)
+    parser.add_argument("--viewer-arg", action="append", default=[], help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    args = make_parser().parse_args()
+
+    try:
+        exit_code = run_worker(args) if args.worker else run_batch(args)
+    except Exception:
+        traceback.print_exc()
+        exit_code = 1
+    sys.stdout.flush()
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
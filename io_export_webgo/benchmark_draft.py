@@ -0,0 +1,200 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Compares draft exports (the viewer streams model.glb at runtime) with regular
+# exports (the model is baked into the Godot pack):
+#
+#   blender --background --python <add-on dir>/benchmark_draft.py -- scene.blend [...] --out <dir> [--runs 3] [--load-time]
+#
+# Each .blend file is exported --runs times in each mode by worker Blenders (see
+# batch_export.py). Regular exports run without the export cache, so each run
+# builds the pack like the export of a changed scene does. Draft exports take
+# their viewer pack from the cache after the first run. With --load-time, the
+# last export of each mode is opened in the web browser and the viewer posts
+# the time from the start of the page load until its model was rendered to the
+# local web server. With --warm-load, the page is opened a second time to
+# measure a load with warm browser caches (the engine files come from the HTTP
+# cache, or from the service worker's cache with --pwa, see pwa.py). Each
+# measurement uses a new port, so the first load of an export is always cold.
+# The results are written to draft_benchmark.json in the output directory.
+
+import os
+import sys
+import json
+import time
+import statistics
+import traceback
+import subprocess
+import webbrowser
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+import batch_export
+
+benchmark_file_name = "draft_benchmark.json"
+
+# batch_export.py options of each benchmarked mode
+modes = {
+    "baked": ["--no-cache"],
+    "draft": ["--draft"],
+}
+
+
+def median(values):
+    values = [value for value in values if value is not None]
+    return round(statistics.median(values), 4) if values else None
+
+
+def read_report(p_bundle):
+    try:
+        with open(os.path.join(p_bundle, "export_report.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        traceback.print_exc()
+        return {}
+
+
+# seconds between the cold and the warm load, so the service worker can install
+warm_load_delay = 5.0
+
+
+def measure_load_time(addon, p_bundle, timeout, loads=1):
+    '''Serve the bundle, open it in the web browser loads times and wait for the viewer to post its load time
+    each time. Returns the posted entries (page_ms, engine_ms, mode, controlled), None for loads not posted within the timeout.'''
+    p_log = p_bundle + ".load_times.jsonl"
+    if os.path.exists(p_log):
+        os.remove(p_log)
+    port = addon.get_next_free_port()
+    server_args = [sys.executable, os.path.join(addon.get_path(), "serve_bash.py"), "--root", p_bundle, "--port", port, "--no-browser", "--cache", "--load-time-log", p_log]
+    server = subprocess.Popen(server_args)
+    entries = []
+    try:
+        time.sleep(1.0)
+        for load in range(loads):
+            if load:
+                time.sleep(warm_load_delay)
+            webbrowser.open("http://localhost:" + port)
+            entry = None
+            t_end = time.monotonic() + timeout
+            while time.monotonic() < t_end:
+                if os.path.exists(p_log):
+                    with open(p_log, "r", encoding="utf-8") as f:
+                        lines = f.read().splitlines()
+                    if len(lines) > load:
+                        entry = json.loads(lines[load])
+                        break
+                time.sleep(0.2)
+            if entry is None:
+                print("No load time posted by the viewer within " + str(timeout) + " s")
+            entries.append(entry)
+            if entry is None:
+                break
+        return entries + [None] * (loads - len(entries))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_benchmark(args):
+    addon = batch_export.import_addon()
+    p_out_dir = os.path.abspath(args.out)
+    addon_prefs = batch_export.bpy.context.preferences.addons[batch_export.the_unique_name_of_the_addon].preferences
+    if not addon.is_godot4_version(addon.get_godot_version(args.godot or addon_prefs.godot_path)):
+        print("ERROR: Godot 4 or higher is not available. Download Godot in the add-on preferences or pass --godot.")
+        return 2
+
+    results = {}
+    for mode, mode_args in modes.items():
+        batch_args = args.inputs + ["--out", os.path.join(p_out_dir, mode), "--jobs", "1", "--retries", "0", "--viewer-arg=--webgo-report-load-time"] + mode_args
+        if args.pwa:
+            batch_args.append("--pwa")
+        if args.godot:
+            batch_args += ["--godot", args.godot]
+        batch = batch_export.BatchExport(batch_export.make_parser().parse_args(batch_args), addon)
+        if not batch.p_blends:
+            print("ERROR: No .blend files found for " + " ".join(args.inputs))
+            return 2
+        for run in range(args.runs):
+            print("Exporting (" + mode + ", run " + str(run + 1) + "/" + str(args.runs) + ")")
+            batch.results = []
+            batch.done = 0
+            for result in batch.run()["results"]:
+                results.setdefault(result["blend"], {}).setdefault(mode, {"runs": []})["runs"].append(result)
+
+        for p_blend, p_target in batch.targets.items():
+            entry = results[p_blend][mode]
+            runs = entry["runs"]
+            p_bundle = os.path.splitext(p_target)[0]
+            report = read_report(p_bundle)
+            entry["failed_runs"] = sum(1 for result in runs if result["status"] != "ok")
+            entry["seconds"] = median([result["seconds"] for result in runs if result["status"] == "ok"])
+            entry["export_seconds"] = median([result.get("export_seconds") for result in runs])
+            entry["build_pack_seconds"] = median([result.get("stages", {}).get("build_pack") for result in runs])
+            entry["pck_bytes"] = report.get("pck_bytes")
+            entry["glb_bytes"] = report.get("glb_bytes")
+            if args.load_time and entry["failed_runs"] < len(runs):
+                load_times = measure_load_time(addon, p_bundle, args.browser_timeout, 2 if args.warm_load else 1)
+                entry["load_time"] = load_times[0]
+                if args.warm_load:
+                    entry["warm_load_time"] = load_times[1]
+
+    summary = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "runs": args.runs,
+        "pwa": args.pwa,
+        "results": results,
+    }
+    p_summary = os.path.join(p_out_dir, benchmark_file_name)
+    batch_export.write_summary(summary, p_summary)
+
+    for p_blend, entries in results.items():
+        print(p_blend)
+        for mode, entry in entries.items():
+            text = "  " + mode + ": export " + str(entry["seconds"]) + " s (export stages " + str(entry["export_seconds"]) + " s, Godot pack " + str(entry["build_pack_seconds"]) + " s)"
+            text += ", pck " + str(entry["pck_bytes"]) + " bytes"
+            if mode == "draft":
+                text += " + glb " + str(entry["glb_bytes"]) + " bytes"
+            if entry.get("load_time"):
+                text += ", viewer loaded in " + str(round(entry["load_time"]["page_ms"])) + " ms"
+            if entry.get("warm_load_time"):
+                text += " (warm: " + str(round(entry["warm_load_time"]["page_ms"])) + " ms"
+                if entry["warm_load_time"].get("controlled"):
+                    text += " from the service worker"
+                text += ")"
+            print(text)
+    print("Benchmark written to '" + p_summary + "'")
+    return 0
+
+
+def main():
+    parser = batch_export.ArgumentParserForBlender(description="Compare the export latency and viewer load time of draft and regular web exports.")
+    parser.add_argument("inputs", nargs="+", help=".blend files, directories or glob patterns")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--runs", type=int, default=3, help="exports per file and mode (default: 3)")
+    parser.add_argument("--godot", default=None, help="Godot app to use instead of the one set in the add-on preferences")
+    parser.add_argument("--load-time", action="store_true", help="open each export in the web browser and measure the viewer's load time")
+    parser.add_argument("--warm-load", action="store_true", help="with --load-time: open each export a second time and measure the load with warm browser caches")
+    parser.add_argument("--pwa", action="store_true", help="export with a service worker caching the engine files (see pwa.py)")
+    parser.add_argument("--browser-timeout", type=float, default=120, help="seconds to wait for the viewer's load time (default: 120)")
+    args = parser.parse_args()
+
+    try:
+        exit_code = run_benchmark(args)
+    except Exception:
+        traceback.print_exc()
+        exit_code = 1
+    sys.stdout.flush()
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# In-place, incremental update of an exported bundle directory from the web
+# template. Unchanged files are skipped (same inode, same size and mtime, or
+# same contents). Changed files are hard-linked to the template if possible or
+# copied, always into a temporary file that is then atomically renamed over
+# the target, so a running server never serves a half-written file.
+#
+# This module must not import bpy.
+
+import os
+import shutil
+import fnmatch
+import filecmp
+import threading
+
+tmp_suffix = ".webgo-tmp"
+
+
+def tmp_path(p_file):
+    '''Name of the temporary file used to write p_file. Unique per process and thread, as several exports
+    (see batch_export.py) may write the same directory, e.g. the shared engine runtime.'''
+    return p_file + "." + str(os.getpid()) + "-" + str(threading.get_ident()) + tmp_suffix
+
+
+def is_unchanged(p_src, p_dst):
+    '''True if p_dst already has the contents of p_src. Compares contents only if sizes match but mtimes do not.'''
+    try:
+        st_src = os.stat(p_src)
+        st_dst = os.stat(p_dst)
+    except OSError:
+        return False
+    if (st_src.st_dev, st_src.st_ino) == (st_dst.st_dev, st_dst.st_ino):
+        return True
+    if st_src.st_size != st_dst.st_size:
+        return False
+    if st_src.st_mtime_ns == st_dst.st_mtime_ns:
+        return True
+    if filecmp.cmp(p_src, p_dst, shallow=False):
+        # remember the result for the next sync
+        os.utime(p_dst, ns=(st_dst.st_atime_ns, st_src.st_mtime_ns))
+        return True
+    return False
+
+
+def install_file(p_tmp, p_dst, backup=None):
+    '''Atomically replace p_dst with the completely written p_tmp. backup(p_dst) is called before an
+    existing p_dst is replaced.'''
+    if backup and os.path.lexists(p_dst):
+        backup(p_dst)
+    os.replace(p_tmp, p_dst)
+
+
+def sync_file(p_src, p_dst, link=False, backup=None):
+    '''Bring p_dst up to date with p_src. Returns "skipped", "linked" or "copied".'''
+    if is_unchanged(p_src, p_dst):
+        return "skipped"
+    p_tmp = tmp_path(p_dst)
+    if os.path.lexists(p_tmp):
+        os.remove(p_tmp)
+    result = "copied"
+    if link:
+        try:
+            os.link(p_src, p_tmp)
+            result = "linked"
+        except OSError:
+            # other file system, no hard link support, ...
+            pass
+    if result == "copied":
+        shutil.copy2(p_src, p_tmp)
+    install_file(p_tmp, p_dst, backup)
+    return result
+
+
+def sync_tree(p_src_dir, p_dst_dir, exclude=(), no_link=(), link=True, backup=None, on_created=None, check_cancelled=None):
+    '''Update p_dst_dir in place to contain all files of p_src_dir (files existing only in p_dst_dir are kept).
+    exclude and no_link are fnmatch patterns of relative paths. Files matching no_link are always copied,
+    e.g. files modified in place later. on_created(path) is called for each file that did not exist before.
+    Returns {"skipped": n, "linked": n, "copied": n, "bytes_written": n}.'''
+    stats = {"skipped": 0, "linked": 0, "copied": 0, "bytes_written": 0}
+    # Hard links only work within one file system
+    os.makedirs(p_dst_dir, exist_ok=True)
+    link = link and os.stat(p_src_dir).st_dev == os.stat(p_dst_dir).st_dev
+    for dirpath, dirnames, filenames in os.walk(p_src_dir):
+        dirnames.sort()
+        rel_dir = os.path.relpath(dirpath, p_src_dir)
+        p_dst_sub = os.path.normpath(os.path.join(p_dst_dir, rel_dir))
+        os.makedirs(p_dst_sub, exist_ok=True)
+        for filename in sorted(filenames):
+            rel_path = os.path.normpath(os.path.join(rel_dir, filename)).replace(os.sep, "/")
+            if any(fnmatch.fnmatch(rel_path, pattern) for pattern in exclude):
+                continue
+            if check_cancelled:
+                check_cancelled()
+            p_src = os.path.join(dirpath, filename)
+            p_dst = os.path.join(p_dst_sub, filename)
+            existed = os.path.lexists(p_dst)
+            file_link = link and not any(fnmatch.fnmatch(rel_path, pattern) for pattern in no_link)
+            result = sync_file(p_src, p_dst, file_link, backup)
+            stats[result] += 1
+            if result == "copied":
+                stats["bytes_written"] += os.path.getsize(p_dst)
+            if not existed and on_created:
+                on_created(p_dst)
+    return stats
+
+
+def remove_extra_files(p_src_dir, p_dst_dir, exclude=()):
+    '''Remove the files of p_dst_dir that do not exist in p_src_dir, and directories left empty. exclude are
+    fnmatch patterns of relative paths to keep, a directory is skipped if "<path>/" matches. Returns the removed
+    relative paths.'''
+    removed = []
+    p_dirs = []
+    for dirpath, dirnames, filenames in os.walk(p_dst_dir):
+        rel_dir = os.path.relpath(dirpath, p_dst_dir)
+        dirnames[:] = [d for d in dirnames if not any(fnmatch.fnmatch(os.path.normpath(os.path.join(rel_dir, d)).replace(os.sep, "/") + "/", pattern) for pattern in exclude)]
+        if rel_dir != "." and not os.path.isdir(os.path.join(p_src_dir, rel_dir)):
+            p_dirs.append(dirpath)
+        for filename in sorted(filenames):
+            rel_path = os.path.normpath(os.path.join(rel_dir, filename)).replace(os.sep, "/")
+            if any(fnmatch.fnmatch(rel_path, pattern) for pattern in exclude):
+                continue
+            if not os.path.lexists(os.path.join(p_src_dir, rel_path)):
+                os.remove(os.path.join(dirpath, filename))
+                removed.append(rel_path)
+    # innermost first
+    for p_dir in reversed(p_dirs):
+        if not os.listdir(p_dir):
+            os.rmdir(p_dir)
+    return removed
@@ -0,0 +1,148 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Precompressed .gz (and .br if the brotli module is available) siblings of
+# the compressible files of a web bundle. The serve scripts pick the best
+# variant according to the browser's Accept-Encoding header. A sibling is only
+# rewritten if it is older than its source, so syncing a precompressed
+# template into the bundle (which keeps the modification times, see
+# bundle_sync) does not trigger recompressing the unchanged engine files.
+#
+# This module must not import bpy.
+
+import os
+import gzip
+import shutil
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+compressible_extensions = {".wasm", ".js", ".pck", ".html", ".json", ".svg", ".glb"}
+
+# Not worth compressing
+min_compress_size = 1024
+
+# Compression levels. Brotli's maximum quality is very slow on the ~35 MB engine, so
+# it is only used where the result is reused over many exports (see compress_dir).
+gzip_level = 9
+brotli_quality_max = 11
+brotli_quality_fast = 5
+
+chunk_size = 1024 * 1024
+
+
+def available_encodings():
+    '''Content-Encodings written by this module, best first.'''
+    return ["br", "gzip"] if brotli else ["gzip"]
+
+
+def encoding_extension(encoding):
+    return ".br" if encoding == "br" else ".gz"
+
+
+def is_compressible(p_file):
+    return os.path.splitext(p_file)[1].lower() in compressible_extensions
+
+
+def is_up_to_date(p_file, p_compressed):
+    try:
+        return os.path.getmtime(p_compressed) >= os.path.getmtime(p_file)
+    except OSError:
+        return False
+
+
+def _write_compressed(p_file, p_compressed, encoding, brotli_quality):
+    # Write via a temporary file and rename, so a running server never serves a half-written file.
+    # Unique per process, as concurrent exports share the web template.
+    p_tmp = p_compressed + "." + str(os.getpid()) + ".tmp"
+    with open(p_file, "rb") as src, open(p_tmp, "wb") as dst:
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=brotli_quality)
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                dst.write(compressor.process(chunk))
+            dst.write(compressor.finish())
+        else:
+            # mtime=0 and no file name keep the output reproducible
+            with gzip.GzipFile(filename="", mode="wb", fileobj=dst, compresslevel=gzip_level, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, chunk_size)
+    os.replace(p_tmp, p_compressed)
+
+
+def compress_file(p_file, brotli_quality=brotli_quality_fast, force=False):
+    '''Write all available compressed siblings of p_file (unless up to date). Siblings not smaller than
+    the source are removed. Returns {"bytes": size, "<encoding>": compressed size, "<encoding>_ratio": ratio, ...}.'''
+    size = os.path.getsize(p_file)
+    info = {"bytes": size}
+    for encoding in available_encodings():
+        p_compressed = p_file + encoding_extension(encoding)
+        if force or not is_up_to_date(p_file, p_compressed):
+            _write_compressed(p_file, p_compressed, encoding, brotli_quality)
+        compressed_size = os.path.getsize(p_compressed)
+        if compressed_size >= size:
+            os.remove(p_compressed)
+            continue
+        info[encoding] = compressed_size
+        info[encoding + "_ratio"] = round(compressed_size / size, 4) if size else 1.0
+    return info
+
+
+def remove_compressed(p_file):
+    for encoding in ("br", "gzip"):
+        p_compressed = p_file + encoding_extension(encoding)
+        if os.path.isfile(p_compressed):
+            os.remove(p_compressed)
+
+
+def compress_dir(p_dir, brotli_quality=brotli_quality_fast, max_workers=None, exclude=()):
+    '''Compress all compressible files directly in p_dir in parallel (zlib and brotli release the GIL).
+    Files named in exclude are not compressed. Returns {file name: info} as returned by compress_file.
+    Files failing to compress are left out.'''
+    files = []
+    for name in sorted(os.listdir(p_dir)):
+        p_file = os.path.join(p_dir, name)
+        if not os.path.isfile(p_file) or not is_compressible(name):
+            continue
+        if name in exclude or os.path.getsize(p_file) < min_compress_size:
+            remove_compressed(p_file)
+            continue
+        files.append(name)
+
+    def compress(name):
+        try:
+            return name, compress_file(os.path.join(p_dir, name), brotli_quality)
+        except Exception:
+            traceback.print_exc()
+            return name, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(compress, files))
+    return {name: info for name, info in results if info is not None}
+
+
+def format_ratios(infos):
+    '''Human readable per-file compression summary.'''
+    lines = []
+    for name, info in infos.items():
+        parts = [name + ": " + str(info["bytes"]) + " bytes"]
+        for encoding in available_encodings():
+            if encoding in info:
+                parts.append(encoding + " " + str(info[encoding]) + " (" + format(100.0 * info[encoding + "_ratio"], ".1f") + "%)")
+        lines.append(", ".join(parts))
+    return "\n".join(lines)
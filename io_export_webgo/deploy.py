@@ -0,0 +1,208 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Deploy builds: a copy of an exported bundle for CDN hosting, in which every
+# file but the entry points has its content hash in its name, e.g.
+#
+#   index.pck  ->  index.3fa9c1d2e4b7.pck
+#
+# Such a file never changes under its name, so it can be served with
+# "Cache-Control: public, max-age=31536000, immutable" and a new export never
+# needs a cache purge: its index.html (served with no-cache) refers to new
+# names. The engine loader derives the names of index.wasm, index.worker.js
+# and index.audio.worklet.js from GODOT_CONFIG.executable, so these and
+# index.js share one hashed base name (index.<hash>.wasm, index.<hash>.js,
+# ...). index.html is rewritten accordingly (executable, mainPack, the
+# fileSizes map, the draft model argument, script and icon references), the
+# PWA service worker and manifest get the new names, and deploy_manifest.json
+# lists all files with their hashes, sizes and cache policy.
+#
+# The deploy build is written next to the bundle (<bundle>.deploy), from hard
+# links where possible. The bundle itself keeps its fixed names, so the local
+# web server, live reload and the export cache keep working on it. With the
+# shared engine runtime (see shared_runtime.py), the runtime directory is
+# already named after its content and referenced as it is.
+#
+# This module must not import bpy.
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+
+from . import pwa
+from . import html_shell
+from . import bundle_sync
+from . import compression
+from . import export_report
+
+deploy_suffix = ".deploy"
+manifest_file_name = "deploy_manifest.json"
+
+# hex digits of the content hash in file names
+hash_length = 12
+immutable_max_age = 365 * 24 * 60 * 60
+immutable_cache_control = "public, max-age=" + str(immutable_max_age) + ", immutable"
+mutable_cache_control = "no-cache"
+
+# Loaded by the engine loader from GODOT_CONFIG.executable + their extension
+engine_group = ["index.js", "index.wasm", "index.worker.js", "index.audio.worklet.js"]
+engine_base = "index"
+# Entry points keeping their names
+mutable_files = ["index.html", pwa.service_worker_file_name, pwa.manifest_file_name]
+# Files of a bundle that are not published
+unpublished_files = ["serve_bash.py", "serve_blend.py", export_report.report_file_name]
+
+model_arg_prefix = "--webgo-model="
+
+
+def deploy_path(p_bundle_dir):
+    return os.path.abspath(p_bundle_dir) + deploy_suffix
+
+
+def hashed_name(name, digest):
+    '''name with the content hash inserted before its extension: index.pck -> index.<hash>.pck.'''
+    root, ext = os.path.splitext(name)
+    return root + "." + digest[:hash_length] + ext
+
+
+def bundle_assets(p_bundle_dir):
+    '''Names of the files of a bundle that get hashed names (no compressed siblings, temporary or unpublished files).'''
+    assets = []
+    for name in sorted(os.listdir(p_bundle_dir)):
+        if not os.path.isfile(os.path.join(p_bundle_dir, name)):
+            continue
+        if name in mutable_files or name in unpublished_files or name.endswith((".gz", ".br", bundle_sync.tmp_suffix)):
+            continue
+        if bundle_sync.tmp_suffix in name or name.endswith(".webgo-backup"):
+            continue
+        assets.append(name)
+    return assets
+
+
+def plan_names(p_bundle_dir):
+    '''Return ({name: hashed name}, {name: sha256}) for the assets of a bundle.'''
+    assets = bundle_assets(p_bundle_dir)
+    digests = {name: pwa.file_hash(os.path.join(p_bundle_dir, name)) for name in assets}
+    names = {}
+    group = [name for name in engine_group if name in digests]
+    if group:
+        group_digest = hashlib.sha256("".join(name + digests[name] for name in group).encode("utf-8")).hexdigest()
+        for name in group:
+            names[name] = engine_base + "." + group_digest[:hash_length] + name[len(engine_base):]
+    for name in assets:
+        if name not in names:
+            names[name] = hashed_name(name, digests[name])
+    return names, digests
+
+
+def _link_or_copy(p_src, p_dst):
+    try:
+        os.link(p_src, p_dst)
+    except OSError:
+        shutil.copy2(p_src, p_dst)
+
+
+def _replace_quoted_names(text, names):
+    '''Replace all quoted (JSON or HTML attribute) occurrences of the given names.'''
+    for name, new_name in names.items():
+        text = re.sub(r"""(["'])""" + re.escape(name) + r"\1", lambda m, new_name=new_name: m.group(1) + new_name + m.group(1), text)
+    return text
+
+
+def rewrite_html(html, names):
+    '''Return the contents of a bundle's index.html referring to the hashed names.'''
+    config = html_shell.read_config(html)
+    executable = config.get("executable", engine_base)
+    pack = config.get("mainPack") or executable + ".pck"
+    group = [name for name in engine_group if name in names]
+    if executable == engine_base and group:
+        # index.<hash> of index.<hash>.js, ...
+        config["executable"] = names[group[0]][:-len(group[0][len(engine_base):])]
+    # the executable no longer tells the name of the pack
+    config["mainPack"] = names.get(pack, pack)
+    config["fileSizes"] = {names.get(name, name): size for name, size in config.get("fileSizes", {}).items()}
+    args = []
+    for arg in config.get("args", []):
+        if arg.startswith(model_arg_prefix):
+            arg = model_arg_prefix + names.get(arg[len(model_arg_prefix):], arg[len(model_arg_prefix):])
+        args.append(arg)
+    config["args"] = args
+    html = html_shell.replace_config(html, config)
+    # script and icon references outside of the GODOT_CONFIG
+    return _replace_quoted_names(html, names)
+
+
+def write_deploy(p_bundle_dir, compress=True):
+    '''Write the deploy build of a bundle to deploy_path(p_bundle_dir), replacing a previous one.
+    Returns the deploy manifest.'''
+    p_deploy_dir = deploy_path(p_bundle_dir)
+    p_tmp_dir = p_deploy_dir + bundle_sync.tmp_suffix
+    shutil.rmtree(p_tmp_dir, ignore_errors=True)
+    os.makedirs(p_tmp_dir)
+    try:
+        names, digests = plan_names(p_bundle_dir)
+        files = []
+        for name, new_name in names.items():
+            p_src = os.path.join(p_bundle_dir, name)
+            _link_or_copy(p_src, os.path.join(p_tmp_dir, new_name))
+            encodings = []
+            for encoding in compression.available_encodings():
+                extension = compression.encoding_extension(encoding)
+                if compression.is_up_to_date(p_src, p_src + extension):
+                    _link_or_copy(p_src + extension, os.path.join(p_tmp_dir, new_name + extension))
+                    encodings.append(encoding)
+            files.append({"path": new_name, "source": name, "bytes": os.path.getsize(p_src), "sha256": digests[name], "cache_control": immutable_cache_control, "encodings": encodings})
+
+        for name in mutable_files:
+            p_src = os.path.join(p_bundle_dir, name)
+            if not os.path.isfile(p_src):
+                continue
+            with open(p_src, "r", encoding="utf-8", newline="") as f:
+                text = f.read()
+            text = rewrite_html(text, names) if name == "index.html" else _replace_quoted_names(text, names)
+            p_dst = os.path.join(p_tmp_dir, name)
+            with open(p_dst, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+            encodings = []
+            if compress and compression.is_compressible(p_dst):
+                info = compression.compress_file(p_dst)
+                encodings = [encoding for encoding in compression.available_encodings() if encoding in info]
+            files.append({"path": name, "source": name, "bytes": os.path.getsize(p_dst), "sha256": pwa.file_hash(p_dst), "cache_control": mutable_cache_control, "encodings": encodings})
+
+        manifest = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "entry": "index.html",
+            "files": files,
+        }
+        with open(os.path.join(p_bundle_dir, "index.html"), "r", encoding="utf-8", newline="") as f:
+            executable = html_shell.read_config(f.read()).get("executable", engine_base)
+        if "/" in executable:
+            # the shared engine runtime, named after its content as well
+            manifest["runtime"] = {"path": executable.rsplit("/", 1)[0] + "/", "cache_control": immutable_cache_control}
+        with open(os.path.join(p_tmp_dir, manifest_file_name), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        # replace the previous deploy build at once
+        p_old_dir = p_deploy_dir + ".old"
+        shutil.rmtree(p_old_dir, ignore_errors=True)
+        if os.path.isdir(p_deploy_dir):
+            os.replace(p_deploy_dir, p_old_dir)
+        os.replace(p_tmp_dir, p_deploy_dir)
+        shutil.rmtree(p_old_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(p_tmp_dir, ignore_errors=True)
+        raise
+    return manifest
@@ -0,0 +1,318 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Content-hashed cache of Godot pack exports. An entry is keyed by the hash of
+# the generated model.glb, all files of the Godot viewer project, the Godot
+# version and whether a one-shot export or the export daemon builds the pack
+# (see build_modes). If nothing of that changed, the cached index.pck can be copied
+# instead of running a headless Godot export.
+#
+# A second, cheaper level maps a saved (non-dirty) .blend file, the images and
+# libraries it refers to, the Godot version and the viewer project to the key
+# of the pack they produced, so even the glTF export can be skipped.
+#
+# If only scripts of the viewer project changed, a cached pack built from the
+# same model and the same other project files is patched instead (see
+# ExportCache.patch and pck.py): Godot stores scripts in packs as they are.
+#
+# This module must not import bpy. It is used by the add-on as well as by
+# command line tools.
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import traceback
+
+from . import pck
+
+# Directories inside the Godot viewer project that are not inputs of an export
+viewer_ignored_dirs = {".godot", "export"}
+
+# Viewer project files stored unchanged in packs. Packs differing only in these files can be patched without Godot.
+patchable_extensions = {".gd", ".gdshader"}
+
+# Viewer project scripts run by the editor while importing the model (see instancing.py). Changing them changes the
+# imported model, so they are never patched.
+import_time_files = {"gltf_gpu_instancing.gd"}
+
+# How a pack is built, part of its key: a one-shot "godot --export-pack" writes the exported (binary, remapped)
+# scenes and project.binary, the export daemon (see godot_daemon.py) packs the project files as they are.
+# The packs work the same, but a key must not stand for two different packs.
+build_modes = ("one-shot", "daemon")
+
+# Keep at most this many packs. Oldest (least recently used) entries are removed first.
+max_cache_entries = 32
+
+hash_chunk_size = 1024 * 1024
+
+
+def tmp_path(p_file):
+    '''Temporary file to write p_file. Unique per process, as several exports (see batch_export.py) may share the cache.'''
+    return p_file + "." + str(os.getpid()) + ".tmp"
+
+
+def hash_file(p_file, hasher=None):
+    '''Feed the contents of the given file into hasher (a new sha256 if None) and return the hasher.'''
+    if hasher is None:
+        hasher = hashlib.sha256()
+    with open(p_file, "rb") as f:
+        while True:
+            chunk = f.read(hash_chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher
+
+
+def hash_viewer_project(p_project_dir, p_exclude_files=(), hasher=None):
+    '''Hash all files of the Godot viewer project (project.godot, *.tscn, *.gd, *.import, export_presets.cfg, ...)
+    except generated content (.godot import cache, export directory) and the given excluded files.'''
+    if hasher is None:
+        hasher = hashlib.sha256()
+    excluded = {os.path.normcase(os.path.abspath(p)) for p in p_exclude_files}
+    for dirpath, dirnames, filenames in os.walk(p_project_dir):
+        # sort to get a stable hash independent of the file system's directory order
+        dirnames[:] = sorted(d for d in dirnames if d not in viewer_ignored_dirs)
+        for filename in sorted(filenames):
+            p_file = os.path.join(dirpath, filename)
+            if os.path.normcase(os.path.abspath(p_file)) in excluded:
+                continue
+            rel_path = os.path.relpath(p_file, p_project_dir).replace(os.sep, "/")
+            hasher.update(rel_path.encode("utf-8") + b"\0")
+            hash_file(p_file, hasher)
+            hasher.update(b"\0")
+    return hasher
+
+
+def compute_pack_key(p_glb, p_project_dir, godot_version, godot_mode):
+    '''Return the cache key for a pack built from the given glb and viewer project with the given Godot version
+    and godot_mode (see build_modes).'''
+    hasher = hashlib.sha256()
+    hasher.update(b"godot:" + godot_version.strip().encode("utf-8") + b"\0mode:" + godot_mode.encode("utf-8") + b"\0")
+    hasher.update(b"glb:")
+    hash_file(p_glb, hasher)
+    hasher.update(b"\0project:")
+    hash_viewer_project(p_project_dir, p_exclude_files=[p_glb], hasher=hasher)
+    return hasher.hexdigest()
+
+
+def patchable_files(p_project_dir):
+    '''Return {path relative to the project: MD5 hex digest} of the patchable files of the viewer project.'''
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(p_project_dir):
+        dirnames[:] = [d for d in dirnames if d not in viewer_ignored_dirs]
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() in patchable_extensions:
+                p_file = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(p_file, p_project_dir).replace(os.sep, "/")
+                if rel_path not in import_time_files:
+                    files[rel_path] = hash_file(p_file, hashlib.md5()).hexdigest()
+    return files
+
+
+def compute_base_key(p_glb, p_project_dir, godot_version, godot_mode, files):
+    '''Return the key of everything influencing a pack except the contents of the given patchable files.
+    Their names are part of the key, so adding or removing a script needs a new pack.'''
+    hasher = hashlib.sha256()
+    hasher.update(b"godot:" + godot_version.strip().encode("utf-8") + b"\0mode:" + godot_mode.encode("utf-8") + b"\0")
+    hasher.update(b"glb:")
+    hash_file(p_glb, hasher)
+    hasher.update(b"\0patchable:" + "\0".join(sorted(files)).encode("utf-8") + b"\0project:")
+    p_excluded = [p_glb] + [os.path.join(p_project_dir, *rel_path.split("/")) for rel_path in files]
+    hash_viewer_project(p_project_dir, p_exclude_files=p_excluded, hasher=hasher)
+    return hasher.hexdigest()
+
+
+def script_declarations(data):
+    '''Lines of a script that are recorded in the project's global class cache when exporting.'''
+    lines = data.decode("utf-8", "replace").splitlines()
+    return [line.strip() for line in lines if line.strip().startswith(("class_name", "extends", "@icon"))]
+
+
+def compute_scene_key(p_blend_file, p_dependencies, godot_version, project_digest, *settings):
+    '''Return a key identifying a saved .blend file and the files it refers to (images, libraries) together with
+    everything else (Godot version, viewer project digest, Blender version, export settings) influencing the pack.'''
+    hasher = hashlib.sha256()
+    hasher.update(b"godot:" + godot_version.strip().encode("utf-8") + b"\0project:" + project_digest.encode("utf-8") + b"\0")
+    for setting in settings:
+        hasher.update(str(setting).encode("utf-8") + b"\0")
+    hash_file(p_blend_file, hasher)
+    for p_dependency in p_dependencies:
+        hasher.update(b"\0" + p_dependency.encode("utf-8") + b"\0")
+        hash_file(p_dependency, hasher)
+    return hasher.hexdigest()
+
+
+class ExportCache:
+    """A directory holding one sub-directory per cached pack (index.pck + meta.json), an index mapping
+    scene keys to pack keys and the accumulated hit/miss statistics."""
+
+    def __init__(self, p_cache_dir):
+        self.p_cache_dir = p_cache_dir
+        self.p_packs_dir = os.path.join(p_cache_dir, "packs")
+        self.p_scenes_dir = os.path.join(p_cache_dir, "scenes")
+        self.p_bases_dir = os.path.join(p_cache_dir, "bases")
+        self.p_stats = os.path.join(p_cache_dir, "stats.json")
+
+    def _pack_dir(self, key):
+        return os.path.join(self.p_packs_dir, key)
+
+    def _read_json(self, p_file, default):
+        try:
+            with open(p_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+        except Exception:
+            traceback.print_exc()
+            return default
+
+    def _write_json(self, p_file, data):
+        os.makedirs(os.path.dirname(p_file), exist_ok=True)
+        p_tmp = tmp_path(p_file)
+        with open(p_tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(p_tmp, p_file)
+
+    def lookup(self, key):
+        '''Return the meta data of the cached pack with the given key or None on a miss.'''
+        if not key:
+            return None
+        p_dir = self._pack_dir(key)
+        meta = self._read_json(os.path.join(p_dir, "meta.json"), None)
+        if meta is None or not os.path.isfile(os.path.join(p_dir, "index.pck")):
+            return None
+        return meta
+
+    def lookup_scene(self, scene_key):
+        '''Return the pack key previously produced by the given scene key, if that pack is still cached.'''
+        if not scene_key:
+            return None
+        entry = self._read_json(os.path.join(self.p_scenes_dir, scene_key + ".json"), None)
+        if entry is None or self.lookup(entry.get("key")) is None:
+            return None
+        return entry["key"]
+
+    def lookup_base(self, base_key):
+        '''Return the key of a cached pack built with the given base key (see compute_base_key), if any.'''
+        if not base_key:
+            return None
+        entry = self._read_json(os.path.join(self.p_bases_dir, base_key + ".json"), None)
+        if entry is None or self.lookup(entry.get("key")) is None:
+            return None
+        return entry["key"]
+
+    def patch(self, key, p_project_dir, files, p_target_pck):
+        '''Write the cached pack with the given key to p_target_pck with the changed ones of the given patchable
+        files ({relative path: MD5}, see patchable_files) replaced. Returns the replaced pack paths, or None if the
+        pack cannot be patched, e.g. because Godot converted a changed file or the change affects other files.'''
+        meta = self.lookup(key)
+        old_files = meta.get("patchable_files") if meta else None
+        if old_files is None or set(old_files) != set(files):
+            return None
+        pack = pck.Pack.read(os.path.join(self._pack_dir(key), "index.pck"))
+        replaced = []
+        for rel_path, md5 in sorted(files.items()):
+            if old_files[rel_path] == md5:
+                continue
+            path = pck.res_path(rel_path)
+            entry = pack.entries.get(path)
+            if entry is None:
+                if any(other.startswith(path) for other in pack.entries):
+                    # exported in another form (e.g. compiled or remapped)
+                    return None
+                # not exported at all (export filter)
+                continue
+            if entry.md5.hex() != old_files[rel_path]:
+                # not stored as it is
+                return None
+            with open(os.path.join(p_project_dir, *rel_path.split("/")), "rb") as f:
+                data = f.read()
+            if script_declarations(pack.read_file(path)) != script_declarations(data):
+                return None
+            pack.set_file(path, data)
+            replaced.append(path)
+        p_tmp = tmp_path(p_target_pck)
+        pack.write(p_tmp)
+        os.replace(p_tmp, p_target_pck)
+        os.utime(os.path.join(self._pack_dir(key), "meta.json"))
+        return replaced
+
+    def restore(self, key, p_target_pck):
+        '''Copy the cached pack to p_target_pck (via a temporary file, so the target is never half-written).'''
+        p_tmp = tmp_path(p_target_pck)
+        shutil.copyfile(os.path.join(self._pack_dir(key), "index.pck"), p_tmp)
+        os.replace(p_tmp, p_target_pck)
+        # Touch the entry so pruning removes least recently used packs first
+        os.utime(os.path.join(self._pack_dir(key), "meta.json"))
+
+    def store(self, key, p_pck, scene_key=None, base_key=None, **meta):
+        '''Add the given pack to the cache. meta holds e.g. the durations of the stages a hit will save and
+        the patchable files the pack was built from (needed to patch it later).'''
+        p_dir = self._pack_dir(key)
+        os.makedirs(p_dir, exist_ok=True)
+        p_tmp = tmp_path(os.path.join(p_dir, "index.pck"))
+        shutil.copyfile(p_pck, p_tmp)
+        os.replace(p_tmp, os.path.join(p_dir, "index.pck"))
+        meta["key"] = key
+        meta["created"] = time.time()
+        self._write_json(os.path.join(p_dir, "meta.json"), meta)
+        if scene_key:
+            self.store_scene(scene_key, key)
+        if base_key:
+            self._write_json(os.path.join(self.p_bases_dir, base_key + ".json"), {"key": key})
+        self.prune()
+
+    def store_scene(self, scene_key, key):
+        self._write_json(os.path.join(self.p_scenes_dir, scene_key + ".json"), {"key": key})
+
+    def prune(self, max_entries=max_cache_entries):
+        '''Remove the least recently used packs exceeding max_entries.'''
+        if not os.path.isdir(self.p_packs_dir):
+            return
+        entries = []
+        for key in os.listdir(self.p_packs_dir):
+            p_meta = os.path.join(self._pack_dir(key), "meta.json")
+            entries.append((os.path.getmtime(p_meta) if os.path.isfile(p_meta) else 0, key))
+        entries.sort(reverse=True)
+        for _, key in entries[max_entries:]:
+            shutil.rmtree(self._pack_dir(key), ignore_errors=True)
+
+    def record(self, hit, saved_seconds=0.0):
+        '''Accumulate hit/miss statistics and return them.'''
+        stats = self._read_json(self.p_stats, {"hits": 0, "misses": 0, "saved_seconds": 0.0})
+        if hit:
+            stats["hits"] += 1
+            stats["saved_seconds"] += saved_seconds
+        else:
+            stats["misses"] += 1
+        try:
+            self._write_json(self.p_stats, stats)
+        except Exception:
+            traceback.print_exc()
+        return stats
+
+    def clear(self):
+        shutil.rmtree(self.p_cache_dir, ignore_errors=True)
+
+
+def format_report(hit, key, saved_seconds, stats, skipped, patched=None):
+    '''Human readable one-line hit/miss report. patched lists the files replaced in a patched cached pack.'''
+    totals = "cache totals: " + str(stats["hits"]) + " hits, " + str(stats["misses"]) + " misses, " + format(stats["saved_seconds"], ".1f") + " s saved"
+    if patched is not None:
+        return "Export cache MISS (" + key[:12] + "): patched " + str(len(patched)) + " script(s) of a cached pack (" + totals + ")"
+    if hit:
+        return "Export cache HIT (" + key[:12] + "): skipped " + skipped + ", saved about " + format(saved_seconds, ".1f") + " s (" + totals + ")"
+    return "Export cache MISS (" + (key[:12] if key else "no key") + "): full export (" + totals + ")"
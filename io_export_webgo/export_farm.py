@@ -0,0 +1,648 @@
+#!/usr/bin/env python3
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Export farm: a small HTTP service exporting uploaded .blend or .glb files to
+# web bundles on a build machine, so artists do not have to wait for Godot.
+#
+#   python3 <add-on dir>/export_farm.py --root <dir> [--port 8070] [--workers N] [--blender <path>] [--godot <path>]
+#
+#   POST /jobs?name=scene.blend[&draft=1&texture_profile=LOW&...]   upload (request body), returns the job
+#   GET  /jobs                      all jobs
+#   GET  /jobs/<id>[?wait=SECONDS]  status of a job (optionally waiting until it is done)
+#   GET  /jobs/<id>/bundle.zip      the exported bundle
+#   GET  /jobs/<id>/log             output of the worker
+#   GET  /bundles/<id>/index.html   the exported viewer
+#   GET  /metrics                   queue depth, latencies and throughput
+#
+# Uploads are queued and exported by a fixed pool of worker threads, each
+# running one headless Blender at a time with batch_export.py's worker mode
+# (the same export stages as the ExportWeb operator, including Godot). .glb
+# files are imported into an empty scene first. The job id is a hash of the
+# uploaded file and the export options: submitting the same file with the
+# same options again returns the finished bundle right away or the job already
+# queued for it. Finished bundles are kept in <root>/bundles and survive
+# restarts.
+#
+# With --stand-in, the workers run this script instead of Blender. It writes
+# a dummy bundle after a delay, so the service can be tried and load tested
+# without Blender and Godot.
+#
+# This module must not import bpy.
+
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler  # type: ignore
+from http import HTTPStatus
+from collections import deque
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import signal
+import argparse
+import hashlib
+import platform
+import threading
+import traceback
+import subprocess
+import urllib.parse
+
+uploads_dir_name = "uploads"
+bundles_dir_name = "bundles"
+# written into a bundle directory when its export succeeded
+job_file_name = "farm_job.json"
+
+upload_extensions = (".blend", ".glb")
+
+# Export options accepted as query parameters of an upload, with their defaults
+option_defaults = {
+    "draft": False,
+    "texture_profile": "NONE",
+    "quantization": True,
+    "tangents": True,
+    "lods": True,
+    "shadow_meshes": True,
+    "optimize_mesh_order": False,
+    "instancing": False,
+    "pwa": False,
+}
+texture_profiles = ("NONE", "HIGH", "MEDIUM", "LOW")
+
+# jobs finished within this many seconds count for the throughput
+throughput_window = 300
+# finished jobs the latency percentiles are computed from
+latency_samples = 1000
+
+
+class FarmError(Exception):
+    """A request the farm cannot accept. The message is sent to the client."""
+
+
+def parse_options(params):
+    '''Export options from the query parameters of an upload (a dict of lists as returned by urllib.parse.parse_qs).'''
+    options = dict(option_defaults)
+    for key, values in params.items():
+        if key == "name":
+            continue
+        if key not in option_defaults:
+            raise FarmError("Unknown option '" + key + "'")
+        value = values[-1]
+        if key == "texture_profile":
+            if value.upper() not in texture_profiles:
+                raise FarmError("texture_profile must be one of " + ", ".join(texture_profiles))
+            options[key] = value.upper()
+        elif value.lower() in ("1", "true", "yes", "on"):
+            options[key] = True
+        elif value.lower() in ("0", "false", "no", "off"):
+            options[key] = False
+        else:
+            raise FarmError("Option '" + key + "' must be 1 or 0")
+    return options
+
+
+def job_id(content_hash, kind, options):
+    '''Identify a job by the hash of the uploaded file, its type and the export options.'''
+    key = json.dumps([content_hash, kind, sorted(options.items())])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]
+
+
+def export_flags(options):
+    '''batch_export.py worker arguments for the export options.'''
+    flags = []
+    for key in ("quantization", "tangents", "lods", "shadow_meshes"):
+        if not options[key]:
+            flags.append("--no-" + key.replace("_", "-"))
+    for key in ("optimize_mesh_order", "instancing", "draft", "pwa"):
+        if options[key]:
+            flags.append("--" + key.replace("_", "-"))
+    flags += ["--texture-profile", options["texture_profile"]]
+    return flags
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    def at(fraction):
+        return round(values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))], 4)
+    return {"p50": at(0.5), "p95": at(0.95), "max": round(values[-1], 4)}
+
+
+def kill_process_tree(proc):
+    '''Kill a worker Blender together with the Godot it may have started (see batch_export.py).'''
+    try:
+        if platform.system() == "Windows":
+            subprocess.call(['taskkill', '/F', '/T', '/PID', str(proc.pid)])
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except Exception:
+        traceback.print_exc()
+
+
+class FarmJob:
+    """An uploaded file and the state of its export."""
+
+    def __init__(self, id, name, kind, options):
+        self.id = id
+        self.name = name
+        self.kind = kind
+        self.options = options
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.attempts = 0
+        self.exit_code = None
+        self.error = None
+        # deduplicated submissions of the same file and options
+        self.submissions = 1
+        self.proc : subprocess.Popen = None
+
+    def as_dict(self):
+        d = {
+            "id": self.id,
+            "name": self.name,
+            "kind": self.kind,
+            "options": self.options,
+            "status": self.status,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "attempts": self.attempts,
+            "exit_code": self.exit_code,
+            "error": self.error,
+            "submissions": self.submissions,
+            "log": "/jobs/" + self.id + "/log",
+        }
+        if self.started:
+            d["wait_seconds"] = round(self.started - self.submitted, 4)
+        if self.finished:
+            d["run_seconds"] = round(self.finished - self.started, 4)
+            d["total_seconds"] = round(self.finished - self.submitted, 4)
+        if self.status == "done":
+            d["bundle"] = "/" + bundles_dir_name + "/" + self.id + "/index.html"
+            d["zip"] = "/jobs/" + self.id + "/bundle.zip"
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        job = cls(d["id"], d["name"], d["kind"], d["options"])
+        for key in ("status", "submitted", "started", "finished", "attempts", "exit_code", "error", "submissions"):
+            setattr(job, key, d.get(key, getattr(job, key)))
+        return job
+
+
+class ExportFarm:
+    """The job queue, the worker threads and the finished bundles in p_root."""
+
+    def __init__(self, p_root, workers, blender="blender", godot=None, stand_in=False, stand_in_seconds=1.0, timeout=None, retries=1):
+        self.p_root = os.path.abspath(p_root)
+        self.p_uploads = os.path.join(self.p_root, uploads_dir_name)
+        self.p_bundles = os.path.join(self.p_root, bundles_dir_name)
+        self.worker_count = max(1, workers)
+        self.blender = blender
+        self.godot = godot
+        self.stand_in = stand_in
+        self.stand_in_seconds = stand_in_seconds
+        self.timeout = timeout
+        self.retries = retries
+        self.lock = threading.Lock()
+        # notified whenever a job finishes
+        self.changed = threading.Condition(self.lock)
+        self.queue = queue.Queue()
+        self.jobs = {}
+        self.workers = []
+        self.stopping = False
+        self.start_time = time.time()
+        self.counts = {"submitted": 0, "deduplicated": 0, "cache_hits": 0, "completed": 0, "failed": 0}
+        # (finish time, wait seconds, run seconds, status) of the latest finished jobs
+        self.finished = deque(maxlen=latency_samples)
+
+    def start(self):
+        os.makedirs(self.p_bundles, exist_ok=True)
+        # uploads of jobs that were queued when the farm stopped are not resumed
+        shutil.rmtree(self.p_uploads, ignore_errors=True)
+        os.makedirs(self.p_uploads, exist_ok=True)
+        self.load_bundles()
+        for i in range(self.worker_count):
+            worker = threading.Thread(target=self.work, name="farm-worker-" + str(i), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        with self.lock:
+            self.stopping = True
+            running = [job for job in self.jobs.values() if job.proc]
+        for _ in self.workers:
+            self.queue.put(None)
+        for job in running:
+            kill_process_tree(job.proc)
+
+    def load_bundles(self):
+        '''Make the bundles of earlier runs available.'''
+        for name in os.listdir(self.p_bundles):
+            try:
+                with open(os.path.join(self.p_bundles, name, job_file_name), "r", encoding="utf-8") as f:
+                    job = FarmJob.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError):
+                continue
+            if job.id == name and job.status == "done":
+                self.jobs[job.id] = job
+
+    # Submission
+
+    def submit(self, stream, length, name, options):
+        '''Store an upload of the given length read from stream and queue its export.
+        Returns (job, whether the finished bundle was already there).'''
+        kind = os.path.splitext(name)[1].lower()
+        if kind not in upload_extensions:
+            raise FarmError("Only " + " and ".join(upload_extensions) + " files can be exported")
+        # hash while storing, so the upload is read only once
+        hasher = hashlib.sha256()
+        p_tmp = os.path.join(self.p_uploads, "upload-" + str(threading.get_ident()) + "-" + str(time.monotonic_ns()))
+        try:
+            with open(p_tmp, "wb") as f:
+                remaining = length
+                while remaining > 0:
+                    chunk = stream.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        raise FarmError("Upload incomplete")
+                    if remaining == length and kind == ".glb" and not chunk.startswith(b"glTF"):
+                        raise FarmError("Not a binary glTF file")
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    remaining -= len(chunk)
+        except BaseException:
+            os.remove(p_tmp)
+            raise
+        id = job_id(hasher.hexdigest(), kind, options)
+        with self.lock:
+            self.counts["submitted"] += 1
+            job = self.jobs.get(id)
+            if job and job.status != "failed":
+                os.remove(p_tmp)
+                job.submissions += 1
+                if job.status == "done":
+                    self.counts["cache_hits"] += 1
+                    return job, True
+                self.counts["deduplicated"] += 1
+                return job, False
+            # new or failed before: (re-)export
+            os.replace(p_tmp, self.upload_path(id, kind))
+            job = FarmJob(id, name, kind, options)
+            self.jobs[id] = job
+        print("Queued " + name + " as job " + id)
+        self.queue.put(job)
+        return job, False
+
+    def upload_path(self, id, kind):
+        return os.path.join(self.p_uploads, id + kind)
+
+    def bundle_path(self, id):
+        return os.path.join(self.p_bundles, id)
+
+    def log_path(self, id):
+        return os.path.join(self.p_bundles, id + ".log")
+
+    def get(self, id, wait=0.0):
+        '''The job with the given id, waiting up to wait seconds for it to finish. None if there is no such job.'''
+        deadline = time.monotonic() + wait
+        with self.lock:
+            job = self.jobs.get(id)
+            while job and job.status in ("queued", "running") and time.monotonic() < deadline:
+                self.changed.wait(deadline - time.monotonic())
+            return job
+
+    # Workers
+
+    def worker_command(self, job, p_launcher):
+        p_upload = self.upload_path(job.id, job.kind)
+        if self.stand_in:
+            return [sys.executable, os.path.realpath(__file__), "--stand-in-worker", p_upload, "--out", p_launcher, "--stand-in-seconds", str(self.stand_in_seconds)] + export_flags(job.options)
+        command = [self.blender, "--background"]
+        if job.kind == ".blend":
+            command.append(p_upload)
+        command += [
+            "--python-exit-code",
+            "1",
+            "--python",
+            os.path.join(os.path.dirname(os.path.realpath(__file__)), "batch_export.py"),
+            "--",
+            "--worker",
+            "--out",
+            p_launcher,
+        ]
+        if job.kind == ".glb":
+            command += ["--import-gltf", p_upload]
+        if self.godot:
+            command += ["--godot", self.godot]
+        return command + export_flags(job.options)
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            try:
+                self.export(job)
+            except Exception as e:
+                traceback.print_exc()
+                with self.lock:
+                    job.status = "failed"
+                    job.error = str(e)
+                    self.finish(job)
+
+    def export(self, job):
+        with self.lock:
+            if self.stopping:
+                return
+            job.status = "running"
+            job.started = time.time()
+        p_bundle = self.bundle_path(job.id)
+        # the launcher file next to the bundle directory of the same name (see WebExportJob.prepare)
+        p_launcher = p_bundle + ".bash"
+        exit_code = None
+        for attempt in range(1 + self.retries):
+            job.attempts += 1
+            with open(self.log_path(job.id), "a" if attempt else "w", encoding="utf-8", errors="replace") as log:
+                log.write("=== " + time.strftime("%Y-%m-%d %H:%M:%S") + " " + job.name + " (attempt " + str(job.attempts) + ")\n")
+                log.flush()
+                if platform.system() == "Windows":
+                    proc = subprocess.Popen(self.worker_command(job, p_launcher), stdout=log, stderr=subprocess.STDOUT)
+                else:
+                    # own process group, so a timeout kills Godot, too
+                    proc = subprocess.Popen(self.worker_command(job, p_launcher), stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+                with self.lock:
+                    job.proc = proc
+                try:
+                    exit_code = proc.wait(self.timeout)
+                except subprocess.TimeoutExpired:
+                    kill_process_tree(proc)
+                    proc.wait()
+                    exit_code = None
+                    log.write("=== timed out after " + str(self.timeout) + " s\n")
+                with self.lock:
+                    job.proc = None
+            if exit_code == 0 or self.stopping:
+                break
+
+        with self.lock:
+            job.exit_code = exit_code
+            if exit_code == 0 and os.path.isfile(os.path.join(p_bundle, "index.html")):
+                job.status = "done"
+            else:
+                job.status = "failed"
+                job.error = "timed out" if exit_code is None else "export failed with exit code " + str(exit_code)
+            self.finish(job)
+        if job.status == "done":
+            self.write_job_file(job)
+
+    def finish(self, job):
+        '''Record a finished job. Must be called with the lock held.'''
+        job.finished = time.time()
+        started = job.started or job.finished
+        self.finished.append((job.finished, started - job.submitted, job.finished - started, job.status))
+        self.counts["completed" if job.status == "done" else "failed"] += 1
+        try:
+            os.remove(self.upload_path(job.id, job.kind))
+        except OSError:
+            pass
+        print(job.status + ": " + job.name + " (job " + job.id + ", " + format(job.finished - job.submitted, ".1f") + " s)")
+        sys.stdout.flush()
+        self.changed.notify_all()
+
+    def write_job_file(self, job):
+        p_job_file = os.path.join(self.bundle_path(job.id), job_file_name)
+        with open(p_job_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(job.as_dict(), f, indent=2)
+        os.replace(p_job_file + ".tmp", p_job_file)
+
+    def bundle_zip(self, job):
+        '''Path of a zip archive of the bundle of a finished job, created on first use.'''
+        p_zip = self.bundle_path(job.id) + ".zip"
+        if not os.path.isfile(p_zip):
+            p_tmp = shutil.make_archive(p_zip + "-" + str(threading.get_ident()), "zip", self.bundle_path(job.id))
+            os.replace(p_tmp, p_zip)
+        return p_zip
+
+    def metrics(self):
+        now = time.time()
+        with self.lock:
+            finished = list(self.finished)
+            running = sum(1 for job in self.jobs.values() if job.status == "running")
+            counts = dict(self.counts)
+            queue_depth = sum(1 for job in self.jobs.values() if job.status == "queued")
+        window = min(throughput_window, max(now - self.start_time, 1.0))
+        recent = [entry for entry in finished if entry[0] >= now - window]
+        return {
+            "workers": self.worker_count,
+            "uptime_seconds": round(now - self.start_time, 1),
+            "queue_depth": queue_depth,
+            "running": running,
+            "jobs": counts,
+            "latency_seconds": {
+                "wait": percentiles([entry[1] for entry in finished]),
+                "run": percentiles([entry[2] for entry in finished if entry[3] == "done"]),
+                "total": percentiles([entry[1] + entry[2] for entry in finished if entry[3] == "done"]),
+            },
+            "throughput_per_minute": round(sum(1 for entry in recent if entry[3] == "done") * 60.0 / window, 3),
+            "throughput_window_seconds": round(window, 1),
+        }
+
+
+class FarmRequestHandler(SimpleHTTPRequestHandler):
+    farm : ExportFarm = None
+
+    # Largest accepted upload in bytes. Set by --max-upload-mb.
+    max_upload = 1024 * 1024 * 1024
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=self.farm.p_bundles, **kwargs)
+
+    def send_json(self, status, data, headers=()):
+        body = json.dumps(data, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_file(self, path, content_type):
+        with open(path, "rb") as f:
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            if self.command != "HEAD":
+                shutil.copyfileobj(f, self.wfile)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        if parts[:1] == [bundles_dir_name]:
+            # the exported viewers, served like serve_bash.py does
+            self.path = url.path[len("/" + bundles_dir_name):] + ("?" + url.query if url.query else "")
+            super().do_GET()
+            return
+        if parts == ["metrics"]:
+            self.send_json(HTTPStatus.OK, self.farm.metrics())
+            return
+        if parts == ["jobs"]:
+            with self.farm.lock:
+                jobs = [job.as_dict() for job in self.farm.jobs.values()]
+            jobs.sort(key=lambda job: job["submitted"], reverse=True)
+            self.send_json(HTTPStatus.OK, jobs)
+            return
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            try:
+                wait = min(float(urllib.parse.parse_qs(url.query).get("wait", ["0"])[-1]), 600.0)
+            except ValueError:
+                wait = 0.0
+            job = self.farm.get(parts[1], wait if len(parts) == 2 else 0.0)
+            if job is None:
+                self.send_error(HTTPStatus.NOT_FOUND, "No such job")
+            elif len(parts) == 2:
+                self.send_json(HTTPStatus.OK, job.as_dict())
+            elif parts[2] == "log" and os.path.isfile(self.farm.log_path(job.id)):
+                self.send_file(self.farm.log_path(job.id), "text/plain; charset=utf-8")
+            elif parts[2] == "bundle.zip" and job.status == "done":
+                self.send_file(self.farm.bundle_zip(job), "application/zip")
+            else:
+                self.send_error(HTTPStatus.NOT_FOUND, "Not available")
+            return
+        self.send_error(HTTPStatus.NOT_FOUND, "Unknown path")
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            self.send_error(HTTPStatus.NOT_FOUND, "Unknown path")
+            return
+        params = urllib.parse.parse_qs(url.query)
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self.send_error(HTTPStatus.LENGTH_REQUIRED, "Content-Length required")
+            return
+        if length <= 0 or length > self.max_upload:
+            # the upload is not read, so the connection cannot be reused
+            self.close_connection = True
+            self.send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE if length > 0 else HTTPStatus.BAD_REQUEST, "Upload must have 1 to " + str(self.max_upload) + " bytes")
+            return
+        try:
+            name = os.path.basename(params.get("name", [""])[-1])
+            options = parse_options(params)
+            job, cached = self.farm.submit(self.rfile, length, name, options)
+        except FarmError as e:
+            self.close_connection = True
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+        d = job.as_dict()
+        d["cached"] = cached
+        self.send_json(HTTPStatus.OK if job.status == "done" else HTTPStatus.ACCEPTED, d, [("Location", "/jobs/" + job.id)])
+
+    def end_headers(self):
+        # like serve_bash.py: the viewer needs cross-origin isolation
+        self.send_header("Cross-Origin-Opener-Policy", "same-origin")
+        self.send_header("Cross-Origin-Embedder-Policy", "require-corp")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Cache-Control", "no-store")
+        super().end_headers()
+
+
+def run_stand_in_worker(args):
+    '''Pretend to export args.stand_in_worker like batch_export.py's worker does.'''
+    p_upload = args.stand_in_worker
+    with open(p_upload, "rb") as f:
+        header = f.read(12)
+    # .blend files may be gzip or zstd compressed
+    if not header.startswith((b"BLENDER", b"glTF", b"\x1f\x8b", b"\x28\xb5\x2f\xfd")):
+        print("ERROR: '" + p_upload + "' is neither a .blend nor a .glb file")
+        return 1
+    print("Stand-in export of '" + p_upload + "' to '" + args.out + "'")
+    t_start = time.monotonic()
+    time.sleep(args.stand_in_seconds)
+    p_bundle = os.path.splitext(args.out)[0]
+    os.makedirs(p_bundle, exist_ok=True)
+    with open(os.path.join(p_bundle, "index.html"), "w", encoding="utf-8") as f:
+        f.write("<!DOCTYPE html>\n<html><body><p>Stand-in export of " + os.path.basename(p_upload) + "</p></body></html>\n")
+    with open(os.path.join(p_bundle, "index.pck"), "wb") as f:
+        f.write(b"GDPC" + hashlib.sha256(open(p_upload, "rb").read()).digest())
+    if header.startswith(b"glTF"):
+        shutil.copyfile(p_upload, os.path.join(p_bundle, "model.glb"))
+    report = {
+        "stand_in": True,
+        "total_seconds": round(time.monotonic() - t_start, 4),
+        "stages": [{"name": "stand_in", "seconds": round(time.monotonic() - t_start, 4)}],
+        "arguments": sys.argv[1:],
+    }
+    with open(os.path.join(p_bundle, "export_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    with open(args.out, "w", encoding="utf-8") as f:
+        f.write("#!/bin/bash\n")
+    return 0
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Export uploaded .blend and .glb files to web bundles.")
+    parser.add_argument("-r", "--root", default="export_farm", help="directory for uploads, bundles and logs (default: export_farm)")
+    parser.add_argument("-p", "--port", type=int, default=8070, help="port to listen on (default: 8070)")
+    parser.add_argument("--bind", default="", help="address to listen on (default: all interfaces)")
+    parser.add_argument("-w", "--workers", type=int, default=max(1, (os.cpu_count() or 1) // 2), help="number of exports running in parallel (default: half the number of CPUs)")
+    parser.add_argument("--blender", default="blender", help="Blender executable of the workers (default: blender)")
+    parser.add_argument("--godot", default=None, help="Godot app to use instead of the one set in the add-on preferences")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds after which a single export attempt is killed")
+    parser.add_argument("--retries", type=int, default=1, help="how often a failed export is retried (default: 1)")
+    parser.add_argument("--max-upload-mb", type=float, default=1024, help="largest accepted upload (default: 1024)")
+    parser.add_argument("--stand-in", action="store_true", help="run a stand-in worker writing dummy bundles instead of Blender (for testing)")
+    parser.add_argument("--stand-in-seconds", type=float, default=1.0, help="duration of a stand-in export (default: 1)")
+    # used by the farm to start stand-in workers
+    parser.add_argument("--stand-in-worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--out", default=None, help=argparse.SUPPRESS)
+    for key in ("no_quantization", "no_tangents", "no_lods", "no_shadow_meshes", "optimize_mesh_order", "instancing", "draft", "pwa"):
+        parser.add_argument("--" + key.replace("_", "-"), action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--texture-profile", default="NONE", help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    args = make_parser().parse_args()
+    if args.stand_in_worker:
+        sys.exit(run_stand_in_worker(args))
+
+    farm = ExportFarm(args.root, args.workers, args.blender, args.godot, args.stand_in, args.stand_in_seconds, args.timeout, args.retries)
+    farm.start()
+    FarmRequestHandler.farm = farm
+    FarmRequestHandler.max_upload = int(args.max_upload_mb * 1024 * 1024)
+    # One thread per connection: uploads and waiting clients do not block each other
+    FarmRequestHandler.protocol_version = "HTTP/1.1"
+    httpd = ThreadingHTTPServer((args.bind, args.port), FarmRequestHandler)
+    print("Export farm serving on port " + str(args.port) + " with " + str(farm.worker_count) + (" stand-in" if args.stand_in else "") + " worker(s), files in '" + farm.p_root + "'")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nKeyboard interrupt received, exiting.")
+    finally:
+        httpd.server_close()
+        farm.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Timing and size records of a single export. Written as export_report.json
+# into the exported bundle and, if the WEBGO_EXPORT_LOG environment variable
+# holds a file path, appended as one line to that (rolling) JSONL log to track
+# export latency across add-on and Godot versions.
+#
+# This module must not import bpy.
+
+import os
+import json
+import time
+import platform
+import traceback
+import contextlib
+
+report_file_name = "export_report.json"
+
+export_log_env_var = "WEBGO_EXPORT_LOG"
+
+# The JSONL log is trimmed to the latest records when it grows beyond this
+max_log_records = 5000
+
+
+class ExportReport:
+    """Collects stage timings (monotonic clock) and arbitrary key/value data of an export."""
+
+    def __init__(self, **data):
+        self.data = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "platform": platform.platform(),
+            "stages": [],
+        }
+        self.data.update(data)
+        self.t_start = time.monotonic()
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def add_stage(self, name, seconds, **info):
+        stage = {"name": name, "seconds": round(seconds, 4)}
+        stage.update(info)
+        self.data["stages"].append(stage)
+
+    @contextlib.contextmanager
+    def timed(self, name, **info):
+        '''Time the enclosed block and add it as a stage, even if it raises.'''
+        t_start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.monotonic() - t_start, **info)
+
+    def stage_seconds(self, name):
+        return sum(stage["seconds"] for stage in self.data["stages"] if stage["name"] == name)
+
+    def finish(self, result):
+        self.data["result"] = result
+        self.data["total_seconds"] = round(time.monotonic() - self.t_start, 4)
+
+    def write(self, p_dir):
+        '''Write the report as export_report.json into p_dir. Returns the file path.'''
+        p_report = os.path.join(p_dir, report_file_name)
+        with open(p_report, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        return p_report
+
+    def append_to_log(self):
+        '''Append the report to the JSONL log named by the WEBGO_EXPORT_LOG environment variable (if set).'''
+        p_log = os.environ.get(export_log_env_var)
+        if not p_log:
+            return None
+        try:
+            append_jsonl(p_log, self.data, max_log_records)
+        except Exception:
+            traceback.print_exc()
+            return None
+        return p_log
+
+
+def append_jsonl(p_log, record, max_records):
+    '''Append a record to a JSONL file. If the file holds more than max_records lines, keep only the newest.'''
+    with open(p_log, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, separators=(",", ":")) + "\n")
+    # Cheap check before reading the whole log: records are much larger than 64 bytes
+    if os.path.getsize(p_log) < max_records * 64:
+        return
+    with open(p_log, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    if len(lines) <= max_records:
+        return
+    p_tmp = p_log + ".tmp"
+    with open(p_tmp, "w", encoding="utf-8") as f:
+        f.writelines(lines[-max_records:])
+    os.replace(p_tmp, p_log)
+
+
+def file_sizes(p_dir):
+    '''Return {relative path: bytes} of all files below p_dir.'''
+    sizes = {}
+    for dirpath, dirnames, filenames in os.walk(p_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            p_file = os.path.join(dirpath, filename)
+            sizes[os.path.relpath(p_file, p_dir).replace(os.sep, "/")] = os.path.getsize(p_file)
+    return sizes
+
+
+def file_size(p_file):
+    '''Size of the file in bytes or None if it does not exist.'''
+    try:
+        return os.path.getsize(p_file)
+    except OSError:
+        return None
@@ -0,0 +1,205 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Client side of a long-lived headless Godot editor exporting packs on request.
+# The Godot side is the 'webgo_daemon' editor plugin of the viewer project
+# (godot_viewer/addons/webgo_daemon). Starting Godot, scanning the project and
+# importing everything is paid once; each export job then only reimports the
+# changed model and writes the pack.
+#
+# This module must not import bpy.
+
+import os
+import json
+import time
+import socket
+import subprocess
+import traceback
+import itertools
+
+# Time to wait for a freshly started editor to scan and import the project
+startup_timeout = 120.0
+
+# Time to wait for a pong
+ping_timeout = 2.0
+
+# Time to wait for a single pack export
+export_timeout = 600.0
+
+# Give up (and let callers fall back to one-shot exports) after that many restarts in a row
+max_restarts = 3
+
+
+class GodotDaemonError(Exception):
+    pass
+
+
+def get_free_local_port():
+    '''Let the OS pick a currently unused local TCP port.'''
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class GodotDaemon:
+    """Starts, health-checks and restarts a headless Godot editor running the viewer project and submits
+    pack export jobs to it."""
+
+    def __init__(self, p_godot_app, p_godot_project, godot_version=None):
+        self.p_godot_app = p_godot_app
+        self.p_godot_project = p_godot_project
+        self.godot_version = godot_version
+        self.proc : subprocess.Popen = None
+        self.port = 0
+        self.ready = False
+        self.restarts = 0
+        self.aborted = False
+        self._ids = itertools.count(1)
+
+    def is_running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        '''Launch the Godot editor process without waiting for it to become ready.'''
+        if self.is_running():
+            return
+        self.port = get_free_local_port()
+        self.ready = False
+        godot_args = [
+            self.p_godot_app,
+            "--headless",
+            "--editor",
+            "--path",
+            os.path.dirname(self.p_godot_project),
+            "--",
+            "--webgo-daemon-port=" + str(self.port)
+        ]
+        print(godot_args)
+        self.proc = subprocess.Popen(godot_args)
+
+    def stop(self):
+        '''Ask the editor to quit and kill it if it does not.'''
+        if self.is_running():
+            try:
+                self._request({"cmd": "quit"}, timeout=ping_timeout)
+            except Exception:
+                pass
+            try:
+                self.proc.wait(5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait(5)
+        self.proc = None
+        self.ready = False
+
+    def abort(self):
+        '''Kill the daemon, e.g. to cancel a running export job. The job does not retry on a restarted daemon.
+        Thread-safe with respect to a job blocked in export_pack.'''
+        self.aborted = True
+        proc = self.proc
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+
+    def restart(self):
+        self.restarts += 1
+        print("Restarting Godot export daemon (restart " + str(self.restarts) + ")")
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait(5)
+        self.proc = None
+        self.start()
+
+    def ping(self, timeout=ping_timeout):
+        '''Health check: True if the daemon answers within timeout.'''
+        if not self.is_running():
+            return False
+        try:
+            reply = self._request({"cmd": "ping"}, timeout=timeout)
+        except (OSError, GodotDaemonError):
+            return False
+        return reply.get("ok", False)
+
+    def wait_ready(self, timeout=startup_timeout):
+        '''Wait until a (freshly started) daemon answers pings. Raises GodotDaemonError if it does not.'''
+        if self.ready and self.ping():
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.is_running():
+                raise GodotDaemonError("Godot export daemon exited with code " + str(self.proc.returncode if self.proc else None))
+            if self.ping():
+                self.ready = True
+                return
+            time.sleep(0.25)
+        raise GodotDaemonError("Godot export daemon did not answer within " + str(timeout) + " s")
+
+    def ensure_running(self):
+        '''Start the daemon or restart it if it crashed or hangs. Raises GodotDaemonError after max_restarts.'''
+        if not self.is_running():
+            if self.proc is not None:
+                if self.restarts >= max_restarts:
+                    raise GodotDaemonError("Godot export daemon crashed " + str(self.restarts) + " times in a row")
+                self.restart()
+            else:
+                self.start()
+        elif self.ready and not self.ping():
+            if self.restarts >= max_restarts:
+                raise GodotDaemonError("Godot export daemon is not responding")
+            self.restart()
+        self.wait_ready()
+
+    def export_pack(self, p_target_pck, reimport=("res://model/model.glb",)):
+        '''Export the viewer project to p_target_pck. Retries once on a restarted daemon if the connection
+        breaks (e.g. Godot crashed during the import). Returns the daemon's reply.'''
+        request = {"cmd": "export_pack", "target": os.path.abspath(p_target_pck), "reimport": list(reimport)}
+        self.aborted = False
+        for attempt in range(2):
+            if self.aborted:
+                raise GodotDaemonError("Godot export daemon job was aborted")
+            self.ensure_running()
+            try:
+                reply = self._request(request, timeout=export_timeout)
+            except (OSError, GodotDaemonError):
+                if self.aborted:
+                    raise GodotDaemonError("Godot export daemon job was aborted")
+                traceback.print_exc()
+                if attempt == 0:
+                    # give a crashing process a moment to actually exit
+                    try:
+                        self.proc.wait(2)
+                    except subprocess.TimeoutExpired:
+                        pass
+                    if not self.is_running():
+                        continue
+                raise
+            if not reply.get("ok", False):
+                raise GodotDaemonError("Godot export daemon failed: " + str(reply.get("error")))
+            # a successful job resets the crash counter
+            self.restarts = 0
+            return reply
+        raise GodotDaemonError("Godot export daemon crashed while exporting")
+
+    def _request(self, request, timeout):
+        request = dict(request, id=next(self._ids))
+        with socket.create_connection(("127.0.0.1", self.port), timeout=timeout) as conn:
+            conn.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = conn.recv(65536)
+                if not chunk:
+                    raise GodotDaemonError("Godot export daemon closed the connection")
+                data += chunk
+        reply = json.loads(data.decode("utf-8"))
+        if reply.get("id") != request["id"]:
+            raise GodotDaemonError("Godot export daemon sent an unexpected reply")
+        return reply
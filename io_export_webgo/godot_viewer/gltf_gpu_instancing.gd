@@ -0,0 +1,71 @@
+@tool
+extends GLTFDocumentExtension
+
+# Imports glTF nodes with the EXT_mesh_gpu_instancing extension as a
+# MultiMeshInstance3D drawing all instances at once. The Blender add-on writes
+# them for meshes repeated many times in a scene (see instancing.py), Godot 4.2
+# does not support the extension itself.
+# Registered by the webgo_gltf_instancing editor plugin to import the model
+# baked into the pack and by turntable.gd to load models at runtime.
+
+const EXTENSION_NAME = "EXT_mesh_gpu_instancing"
+const FLOAT_COMPONENT = 5126
+
+
+func _get_supported_extensions() -> PackedStringArray:
+	return PackedStringArray([EXTENSION_NAME])
+
+
+func _parse_node_extensions(state: GLTFState, gltf_node: GLTFNode, extensions: Dictionary) -> Error:
+	if extensions.has(EXTENSION_NAME):
+		gltf_node.set_additional_data(EXTENSION_NAME, extensions[EXTENSION_NAME].get("attributes", {}))
+	return OK
+
+
+func _generate_scene_node(state: GLTFState, gltf_node: GLTFNode, scene_parent: Node) -> Node3D:
+	var attributes = gltf_node.get_additional_data(EXTENSION_NAME)
+	if attributes == null or gltf_node.mesh < 0:
+		return null
+	var translations = read_floats(state, attributes.get("TRANSLATION", -1), 3)
+	var rotations = read_floats(state, attributes.get("ROTATION", -1), 4)
+	var scales = read_floats(state, attributes.get("SCALE", -1), 3)
+	var count = max(translations.size() / 3, rotations.size() / 4, scales.size() / 3)
+
+	var multimesh = MultiMesh.new()
+	multimesh.transform_format = MultiMesh.TRANSFORM_3D
+	multimesh.mesh = state.get_meshes()[gltf_node.mesh].mesh.get_mesh()
+	multimesh.instance_count = count
+	for i in count:
+		var basis = Basis.IDENTITY
+		if not rotations.is_empty():
+			basis = Basis(Quaternion(rotations[4 * i], rotations[4 * i + 1], rotations[4 * i + 2], rotations[4 * i + 3]))
+		if not scales.is_empty():
+			basis = basis * Basis.from_scale(Vector3(scales[3 * i], scales[3 * i + 1], scales[3 * i + 2]))
+		var origin = Vector3.ZERO
+		if not translations.is_empty():
+			origin = Vector3(translations[3 * i], translations[3 * i + 1], translations[3 * i + 2])
+		multimesh.set_instance_transform(i, Transform3D(basis, origin))
+	var instance = MultiMeshInstance3D.new()
+	instance.multimesh = multimesh
+	return instance
+
+
+# Read the float accessor with the given index (-1: none) into a flat array
+func read_floats(state: GLTFState, index, components: int) -> PackedFloat32Array:
+	var values = PackedFloat32Array()
+	index = int(index)
+	if index < 0:
+		return values
+	var accessor : GLTFAccessor = state.get_accessors()[index]
+	if accessor.component_type != FLOAT_COMPONENT:
+		push_warning("webgo: instance transforms must be floats (accessor ", index, ")")
+		return values
+	var view : GLTFBufferView = state.get_buffer_views()[accessor.buffer_view]
+	var buffer : PackedByteArray = state.get_buffers()[view.buffer]
+	var stride = view.byte_stride if view.byte_stride > 0 else components * 4
+	var offset = view.byte_offset + accessor.byte_offset
+	values.resize(accessor.count * components)
+	for i in accessor.count:
+		for c in components:
+			values[i * components + c] = buffer.decode_float(offset + i * stride + c * 4)
+	return values
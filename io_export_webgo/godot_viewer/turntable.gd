@@ -19,6 +19,8 @@ func calc_aabb(n : Node):
 	
 	if n is MeshInstance3D:
 		aabb_ret = aabb_mergev(aabb_ret, n.transform * n.mesh.get_aabb())
+	elif n is MultiMeshInstance3D and n.multimesh:
+		aabb_ret = aabb_mergev(aabb_ret, n.transform * n.multimesh.get_aabb())
 
 	for child in n.get_children():
 		aabb_ret = aabb_mergev(aabb_ret, n.transform * calc_aabb(child))
@@ -26,15 +28,105 @@ func calc_aabb(n : Node):
 	return aabb_ret
 
 
-# Called when the node enters the scene tree for the first time.
-func _ready():
-	var aabb = calc_aabb($model_container)
+# The exporter passes the bounds of the model and a camera distance showing all of it
+# (see the add-on's scene_stats.py). Exports without them fall back to calc_aabb.
+const SCENE_STATS_ARG = "--webgo-scene-stats="
+var scene_stats = null
+
+
+func model_aabb():
+	if scene_stats is Dictionary and scene_stats.get("aabb") is Dictionary:
+		var p = scene_stats.aabb.position
+		var s = scene_stats.aabb.size
+		return AABB(Vector3(p[0], p[1], p[2]), Vector3(s[0], s[1], s[2]))
+	return calc_aabb($model_container)
+
+
+# Distance from the center of aabb at which the camera sees all of it from any direction
+func camera_distance(aabb : AABB):
+	if scene_stats is Dictionary and scene_stats.get("camera_distance"):
+		return scene_stats.camera_distance
+	return aabb.size.length() / 2 / sin(deg_to_rad($"../camera_rig/camera_arm/camera".fov) / 2)
+
+
+# Scale the model and position it in the middle
+func fit_model():
+	var aabb = model_aabb()
 	if aabb.has_volume():
-		# Scale the model and position it in the middle
 		var max_size = aabb.size[aabb.get_longest_axis_index()]
 		var scale_fac = Scale / max_size
 		$model_container.scale = Vector3(scale_fac, scale_fac, scale_fac)
 		$model_container.position = -scale_fac * aabb.get_center()
+		$"../camera_rig".camera_distance = scale_fac * camera_distance(aabb)
+
+
+# Draft exports (see the Blender add-on) do not bake the model into the pack.
+# Their index.html starts the engine with "-- --webgo-model=<url>" and the
+# model is downloaded and loaded at runtime instead.
+const MODEL_ARG = "--webgo-model="
+# Set by the add-on's draft benchmark: post the load time to the local web server
+const LOAD_TIME_ARG = "--webgo-report-load-time"
+const LOAD_TIME_PATH = "/__webgo/load-time"
+const GLTFGpuInstancing = preload("res://gltf_gpu_instancing.gd")
+
+var load_mode = "baked"
+
+
+# Called when the node enters the scene tree for the first time.
+func _ready():
+	var model_url = ""
+	for arg in OS.get_cmdline_user_args():
+		if arg.begins_with(MODEL_ARG):
+			model_url = arg.substr(MODEL_ARG.length())
+		elif arg.begins_with(SCENE_STATS_ARG):
+			scene_stats = JSON.parse_string(arg.substr(SCENE_STATS_ARG.length()))
+	if model_url.is_empty():
+		fit_model()
+		report_load_time()
+		return
+
+	# The pack contains a placeholder model
+	load_mode = "draft"
+	for child in $model_container.get_children():
+		$model_container.remove_child(child)
+		child.queue_free()
+	if OS.has_feature("web"):
+		# HTTPRequest needs an absolute URL
+		model_url = JavaScriptBridge.eval("new URL(" + JSON.stringify(model_url) + ", window.location.href).href")
+	var http = HTTPRequest.new()
+	add_child(http)
+	http.request_completed.connect(_on_model_downloaded.bind(http))
+	var err = http.request(model_url)
+	if err != OK:
+		printerr("webgo: cannot request model ", model_url, " (error ", err, ")")
+
+
+func _on_model_downloaded(result, response_code, _headers, body, http):
+	http.queue_free()
+	if result != HTTPRequest.RESULT_SUCCESS or response_code != 200:
+		printerr("webgo: cannot download model (result ", result, ", HTTP status ", response_code, ")")
+		return
+	# Instanced meshes (see gltf_gpu_instancing.gd)
+	GLTFDocument.register_gltf_document_extension(GLTFGpuInstancing.new())
+	var gltf = GLTFDocument.new()
+	var state = GLTFState.new()
+	var err = gltf.append_from_buffer(body, "", state)
+	if err != OK:
+		printerr("webgo: cannot load model (error ", err, ")")
+		return
+	$model_container.add_child(gltf.generate_scene(state))
+	fit_model()
+	report_load_time()
+
+
+func report_load_time():
+	# wait until the model was rendered once
+	await get_tree().process_frame
+	print("webgo: model ready after ", Time.get_ticks_msec(), " ms (", load_mode, ")")
+	if OS.has_feature("web") and LOAD_TIME_ARG in OS.get_cmdline_user_args():
+		# performance.now() counts from the start of the page load, including the download of the engine and pack.
+		# controlled: the page was loaded through the service worker of a PWA export.
+		JavaScriptBridge.eval("fetch('" + LOAD_TIME_PATH + "', {method: 'POST', body: JSON.stringify({mode: '" + load_mode + "', engine_ms: " + str(Time.get_ticks_msec()) + ", page_ms: performance.now(), controlled: !!(navigator.serviceWorker && navigator.serviceWorker.controller)})})")
 
 # Called every frame. 'delta' is the elapsed time since the previous frame.
 func _process(delta):
@@ -0,0 +1,62 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Editing the engine configuration in the index.html of a Godot web export
+# (the "HTML shell"). Godot writes it as a single line
+#   const GODOT_CONFIG = {"args":[],"canvasResizePolicy":2,...,"fileSizes":{...}};
+# which is read by the engine loader (index.js) on startup. The "args" are
+# passed to the engine as its command line, e.g. to let the viewer stream its
+# model at runtime (see the draft export in __init__.py).
+#
+# This module must not import bpy.
+
+import json
+
+config_prefix = "const GODOT_CONFIG = "
+
+
+def _find_config(html):
+    '''Return (config, start, end) of the GODOT_CONFIG object literal in html.'''
+    idx = html.find(config_prefix)
+    if idx < 0:
+        raise ValueError("No GODOT_CONFIG found in the HTML shell")
+    start = idx + len(config_prefix)
+    config, end = json.JSONDecoder().raw_decode(html, start)
+    return config, start, end
+
+
+def read_config(html):
+    '''Return the GODOT_CONFIG of the given index.html contents as a dict.'''
+    return _find_config(html)[0]
+
+
+def replace_config(html, config):
+    '''Return html with its GODOT_CONFIG replaced by config (written as compactly as Godot does).'''
+    old_config, start, end = _find_config(html)
+    return html[:start] + json.dumps(config, separators=(",", ":")) + html[end:]
+
+
+def read_config_file(p_html):
+    '''Return the GODOT_CONFIG of the given index.html file as a dict.'''
+    with open(p_html, "r", encoding="utf-8", newline="") as f:
+        return read_config(f.read())
+
+
+def write_config(p_src_html, p_dst_html, **changes):
+    '''Write p_src_html to p_dst_html with the given GODOT_CONFIG entries replaced.'''
+    with open(p_src_html, "r", encoding="utf-8", newline="") as f:
+        html = f.read()
+    config = read_config(html)
+    config.update(changes)
+    with open(p_dst_html, "w", encoding="utf-8", newline="") as f:
+        f.write(replace_config(html, config))
@@ -0,0 +1,281 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Incremental glTF exports. The glTF exporter always evaluates and writes the
+# whole scene. When only a few objects changed since the last export, the
+# exporter's output of that export (the "base", kept on disk) is updated
+# instead:
+#   - objects that were only moved, rotated or scaled get the transform of
+#     their glTF node replaced,
+#   - objects whose geometry changed are exported on their own and their
+#     meshes are spliced into the base, replacing the old ones.
+# Which objects changed is tracked by a depsgraph update handler (see
+# ChangeTracker in __init__.py). Anything the splicing cannot handle (new or
+# changed materials, skins, compressed meshes, ambiguous node names) raises
+# NotIncremental and the scene is exported in full.
+#
+# This module must not import bpy.
+
+import os
+import json
+import time
+import shutil
+import hashlib
+
+from . import mesh_optimize
+
+base_file_name = "base.glb"
+state_file_name = "state.json"
+
+# number of scenes whose base is kept
+max_bases = 8
+
+# Extensions storing mesh data outside of accessors
+unsupported_extensions = {"KHR_draco_mesh_compression", "EXT_meshopt_compression"}
+
+
+class NotIncremental(Exception):
+    """The export cannot be done incrementally. The message says why."""
+
+
+def scene_id(*settings):
+    '''Identify the base of a scene by the .blend file, scene name and exporter version.'''
+    return hashlib.sha256(json.dumps(settings, default=str).encode("utf-8")).hexdigest()
+
+
+def node_trs(location, rotation, scale):
+    '''glTF node transform from a Blender (Z up) location, rotation quaternion (w, x, y, z) and scale.
+    Default values are left out like the glTF exporter does.'''
+    trs = {}
+    translation = [location[0], location[2], -location[1]]
+    if any(abs(v) > 1e-9 for v in translation):
+        trs["translation"] = translation
+    quaternion = [rotation[1], rotation[3], -rotation[2], rotation[0]]
+    if any(abs(v - d) > 1e-9 for v, d in zip(quaternion, (0.0, 0.0, 0.0, 1.0))):
+        trs["rotation"] = quaternion
+    gltf_scale = [scale[0], scale[2], scale[1]]
+    if any(abs(v - 1.0) > 1e-9 for v in gltf_scale):
+        trs["scale"] = gltf_scale
+    return trs
+
+
+def _node_index(gltf, name):
+    indices = [i for i, node in enumerate(gltf.get("nodes", [])) if node.get("name") == name]
+    if len(indices) != 1:
+        raise NotIncremental("no unique glTF node for object '" + name + "'")
+    return indices[0]
+
+
+def set_node_transform(gltf, name, trs):
+    '''Replace the transform of the node exported for the object with the given name.'''
+    node = gltf["nodes"][_node_index(gltf, name)]
+    for key in ("matrix", "translation", "rotation", "scale"):
+        node.pop(key, None)
+    node.update(trs)
+
+
+def _check_extensions(gltf):
+    used = unsupported_extensions.intersection(gltf.get("extensionsUsed", []))
+    if used:
+        raise NotIncremental("meshes are stored with " + ", ".join(sorted(used)))
+
+
+def splice_meshes(base, base_bin, part, part_bin, names):
+    '''Replace the meshes of the nodes with the given names in base by their meshes in part (an export of just these
+    objects). Materials are matched by name. Returns the new binary chunk of base.'''
+    _check_extensions(base)
+    _check_extensions(part)
+    base_materials = {}
+    for index, material in enumerate(base.get("materials", [])):
+        base_materials.setdefault(material.get("name"), index)
+    base.setdefault("accessors", [])
+    base.setdefault("bufferViews", [])
+    base_bin = bytearray(base_bin)
+    copied_views = {}
+    copied_accessors = {}
+    replaced_meshes = {}
+
+    def copy_view(index):
+        if index not in copied_views:
+            view = dict(part["bufferViews"][index])
+            offset = view.get("byteOffset", 0)
+            data = part_bin[offset:offset + view["byteLength"]]
+            base_bin.extend(b"\0" * (-len(base_bin) % 4))
+            view.update(buffer=0, byteOffset=len(base_bin))
+            base_bin.extend(data)
+            copied_views[index] = len(base["bufferViews"])
+            base["bufferViews"].append(view)
+        return copied_views[index]
+
+    def copy_accessor(index):
+        if index not in copied_accessors:
+            accessor = json.loads(json.dumps(part["accessors"][index]))
+            if "bufferView" in accessor:
+                accessor["bufferView"] = copy_view(accessor["bufferView"])
+            sparse = accessor.get("sparse")
+            if sparse:
+                sparse["indices"]["bufferView"] = copy_view(sparse["indices"]["bufferView"])
+                sparse["values"]["bufferView"] = copy_view(sparse["values"]["bufferView"])
+            copied_accessors[index] = len(base["accessors"])
+            base["accessors"].append(accessor)
+        return copied_accessors[index]
+
+    for name in names:
+        base_node = base["nodes"][_node_index(base, name)]
+        part_node = part["nodes"][_node_index(part, name)]
+        if "skin" in base_node or "skin" in part_node:
+            raise NotIncremental("object '" + name + "' is skinned")
+        if ("mesh" in base_node) != ("mesh" in part_node):
+            raise NotIncremental("object '" + name + "' gained or lost its mesh")
+        if "mesh" not in part_node:
+            continue
+        base_mesh = base_node["mesh"]
+        if replaced_meshes.get(base_mesh, part_node["mesh"]) != part_node["mesh"]:
+            raise NotIncremental("objects sharing the mesh of '" + name + "' differ")
+        replaced_meshes[base_mesh] = part_node["mesh"]
+
+    for base_mesh, part_mesh in replaced_meshes.items():
+        mesh = json.loads(json.dumps(part["meshes"][part_mesh]))
+        for primitive in mesh.get("primitives", []):
+            if "extensions" in primitive:
+                raise NotIncremental("mesh '" + mesh.get("name", "") + "' uses primitive extensions")
+            if "material" in primitive:
+                material_name = part["materials"][primitive["material"]].get("name")
+                if material_name not in base_materials:
+                    raise NotIncremental("material '" + str(material_name) + "' is new")
+                primitive["material"] = base_materials[material_name]
+            primitive["attributes"] = {key: copy_accessor(index) for key, index in primitive.get("attributes", {}).items()}
+            if "indices" in primitive:
+                primitive["indices"] = copy_accessor(primitive["indices"])
+            if "targets" in primitive:
+                primitive["targets"] = [{key: copy_accessor(index) for key, index in target.items()} for target in primitive["targets"]]
+        base["meshes"][base_mesh] = mesh
+    return compact(base, base_bin)
+
+
+def _used_accessors(gltf):
+    used = set()
+    for mesh in gltf.get("meshes", []):
+        for primitive in mesh.get("primitives", []):
+            used.update(mesh_optimize.primitive_accessors(primitive))
+    for skin in gltf.get("skins", []):
+        if "inverseBindMatrices" in skin:
+            used.add(skin["inverseBindMatrices"])
+    for animation in gltf.get("animations", []):
+        for sampler in animation.get("samplers", []):
+            used.update((sampler["input"], sampler["output"]))
+    for node in gltf.get("nodes", []):
+        instancing = node.get("extensions", {}).get("EXT_mesh_gpu_instancing")
+        if instancing:
+            used.update(instancing.get("attributes", {}).values())
+    return used
+
+
+def compact(gltf, bin_chunk):
+    '''Remove accessors and buffer views nothing refers to anymore. Returns the new binary chunk.'''
+    accessors = gltf.get("accessors", [])
+    used = _used_accessors(gltf)
+    new_index = {}
+    new_accessors = []
+    for index, accessor in enumerate(accessors):
+        if index in used:
+            new_index[index] = len(new_accessors)
+            new_accessors.append(accessor)
+    gltf["accessors"] = new_accessors
+
+    def remap(indices):
+        return {key: new_index[index] for key, index in indices.items()}
+
+    for mesh in gltf.get("meshes", []):
+        for primitive in mesh.get("primitives", []):
+            primitive["attributes"] = remap(primitive.get("attributes", {}))
+            if "indices" in primitive:
+                primitive["indices"] = new_index[primitive["indices"]]
+            if "targets" in primitive:
+                primitive["targets"] = [remap(target) for target in primitive["targets"]]
+    for skin in gltf.get("skins", []):
+        if "inverseBindMatrices" in skin:
+            skin["inverseBindMatrices"] = new_index[skin["inverseBindMatrices"]]
+    for animation in gltf.get("animations", []):
+        for sampler in animation.get("samplers", []):
+            sampler["input"] = new_index[sampler["input"]]
+            sampler["output"] = new_index[sampler["output"]]
+    for node in gltf.get("nodes", []):
+        instancing = node.get("extensions", {}).get("EXT_mesh_gpu_instancing")
+        if instancing:
+            instancing["attributes"] = remap(instancing.get("attributes", {}))
+
+    used_views = set()
+    for accessor in new_accessors:
+        if "bufferView" in accessor:
+            used_views.add(accessor["bufferView"])
+        sparse = accessor.get("sparse")
+        if sparse:
+            used_views.update((sparse["indices"]["bufferView"], sparse["values"]["bufferView"]))
+    for image in gltf.get("images", []):
+        if "bufferView" in image:
+            used_views.add(image["bufferView"])
+    removed_views = set(range(len(gltf.get("bufferViews", [])))) - used_views
+    return mesh_optimize.repack_bin(gltf, bin_chunk, {}, removed_views)
+
+
+class BaseStore:
+    """The last glTF export of each scene as written by the glTF exporter (before texture and mesh
+    optimizations), with the state it was exported in: one directory per scene id."""
+
+    def __init__(self, p_dir):
+        self.p_dir = p_dir
+
+    def lookup(self, scene_id):
+        '''Return (path of the base .glb, state) of the scene or (None, None).'''
+        p_scene_dir = os.path.join(self.p_dir, scene_id)
+        try:
+            with open(os.path.join(p_scene_dir, state_file_name), "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        p_base = os.path.join(p_scene_dir, base_file_name)
+        if not os.path.isfile(p_base):
+            return None, None
+        return p_base, state
+
+    def store(self, scene_id, p_glb, **state):
+        p_scene_dir = os.path.join(self.p_dir, scene_id)
+        os.makedirs(p_scene_dir, exist_ok=True)
+        p_state = os.path.join(p_scene_dir, state_file_name)
+        # The state is written last: without it a half-written base is never used
+        if os.path.exists(p_state):
+            os.remove(p_state)
+        p_base = os.path.join(p_scene_dir, base_file_name)
+        shutil.copyfile(p_glb, p_base + ".tmp")
+        os.replace(p_base + ".tmp", p_base)
+        state["time"] = time.time()
+        with open(p_state + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(p_state + ".tmp", p_state)
+        self.prune(keep=scene_id)
+
+    def prune(self, keep=None):
+        '''Remove the bases of all but the max_bases most recently exported scenes.'''
+        try:
+            scene_ids = [name for name in os.listdir(self.p_dir) if name != keep]
+        except OSError:
+            return
+        def mtime(name):
+            try:
+                return os.path.getmtime(os.path.join(self.p_dir, name, state_file_name))
+            except OSError:
+                return 0.0
+        scene_ids.sort(key=mtime, reverse=True)
+        for name in scene_ids[max_bases - 1:]:
+            shutil.rmtree(os.path.join(self.p_dir, name), ignore_errors=True)
@@ -0,0 +1,245 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Instancing of repeated meshes in the exported model.glb.
+#
+# The glTF exporter writes linked duplicates (objects sharing their mesh data)
+# with a shared glTF mesh, but still as one node each, which Godot turns into
+# one MeshInstance3D and at least one draw call each. Copies of a mesh that
+# are not linked (e.g. made with Shift+D) are even written once per copy.
+#
+# The post-process
+#   1. merges meshes with identical primitives (same materials and vertex and
+#      index data, compared by hash),
+#   2. replaces groups of at least min_instances nodes showing the same mesh
+#      under the same parent by a single node with the EXT_mesh_gpu_instancing
+#      extension, which holds the transform of each instance.
+# Only plain mesh nodes are instanced: nodes with children, skins, morph target
+# weights, cameras, lights, animations or a matrix transform stay as they are.
+#
+# Godot 4.2 does not import EXT_mesh_gpu_instancing. The viewer project has a
+# GLTFDocumentExtension (gltf_gpu_instancing.gd) turning such nodes into a
+# MultiMeshInstance3D: one draw call for all instances.
+#
+# This module must not import bpy.
+
+import json
+import struct
+import hashlib
+
+from . import mesh_optimize
+from . import incremental_gltf
+
+extension_name = "EXT_mesh_gpu_instancing"
+
+# Fewer instances are left as separate nodes: a MultiMeshInstance3D is culled as a whole
+min_instances = 4
+
+float_component = 5126
+
+
+def accessor_data(gltf, bin_chunk, index):
+    '''The elements of an accessor, tightly packed. None for sparse accessors.'''
+    accessor = gltf["accessors"][index]
+    if "sparse" in accessor:
+        return None
+    size = mesh_optimize.accessor_bytes(dict(accessor, count=1))
+    if "bufferView" not in accessor:
+        return b"\0" * size * accessor["count"]
+    view = gltf["bufferViews"][accessor["bufferView"]]
+    offset = view.get("byteOffset", 0) + accessor.get("byteOffset", 0)
+    stride = view.get("byteStride") or size
+    if stride == size:
+        return bytes(bin_chunk[offset:offset + size * accessor["count"]])
+    return b"".join(bytes(bin_chunk[offset + i * stride:offset + i * stride + size]) for i in range(accessor["count"]))
+
+
+def mesh_hash(gltf, bin_chunk, mesh):
+    '''Hash of everything Godot imports of a mesh, or None if the mesh cannot be compared.'''
+    h = hashlib.sha256()
+    h.update(json.dumps(mesh.get("weights")).encode("utf-8"))
+    for primitive in mesh.get("primitives", []):
+        if "extensions" in primitive:
+            return None
+        h.update(json.dumps([primitive.get("mode", mesh_optimize.mode_triangles), primitive.get("material")]).encode("utf-8"))
+        accessors = sorted(primitive.get("attributes", {}).items())
+        if "indices" in primitive:
+            accessors.append(("indices", primitive["indices"]))
+        for target in primitive.get("targets", []):
+            accessors += [("target " + key, index) for key, index in sorted(target.items())]
+        for key, index in accessors:
+            accessor = gltf["accessors"][index]
+            data = accessor_data(gltf, bin_chunk, index)
+            if data is None:
+                return None
+            h.update(json.dumps([key, accessor["componentType"], accessor["type"], accessor["count"], accessor.get("normalized", False)]).encode("utf-8"))
+            h.update(hashlib.sha256(data).digest())
+    return h.hexdigest()
+
+
+def merge_meshes(gltf, bin_chunk):
+    '''Let all nodes use the first of several identical meshes and remove the others.
+    Returns {name of a removed mesh: name of the mesh kept instead}.'''
+    meshes = gltf.get("meshes", [])
+    first = {}
+    replacement = {}
+    for index, mesh in enumerate(meshes):
+        key = mesh_hash(gltf, bin_chunk, mesh)
+        if key is None:
+            continue
+        if key in first:
+            replacement[index] = first[key]
+        else:
+            first[key] = index
+    if not replacement:
+        return {}
+    new_index = {}
+    new_meshes = []
+    for index, mesh in enumerate(meshes):
+        if index not in replacement:
+            new_index[index] = len(new_meshes)
+            new_meshes.append(mesh)
+    for node in gltf.get("nodes", []):
+        if "mesh" in node:
+            node["mesh"] = new_index[replacement.get(node["mesh"], node["mesh"])]
+    gltf["meshes"] = new_meshes
+    return {meshes[index].get("name", str(index)): meshes[kept].get("name", str(kept)) for index, kept in replacement.items()}
+
+
+def _instanceable(node):
+    return "mesh" in node and not any(key in node for key in ("children", "skin", "weights", "matrix", "camera", "extensions"))
+
+
+def remove_nodes(gltf, removed):
+    '''Remove the given node indices and renumber all references to nodes.'''
+    nodes = gltf.get("nodes", [])
+    new_index = {}
+    new_nodes = []
+    for index, node in enumerate(nodes):
+        if index not in removed:
+            new_index[index] = len(new_nodes)
+            new_nodes.append(node)
+    gltf["nodes"] = new_nodes
+    for scene in gltf.get("scenes", []):
+        scene["nodes"] = [new_index[i] for i in scene.get("nodes", []) if i in new_index]
+    for node in new_nodes:
+        if "children" in node:
+            node["children"] = [new_index[i] for i in node["children"] if i in new_index]
+            if not node["children"]:
+                del node["children"]
+    for skin in gltf.get("skins", []):
+        skin["joints"] = [new_index[i] for i in skin["joints"]]
+        if "skeleton" in skin:
+            skin["skeleton"] = new_index[skin["skeleton"]]
+    for animation in gltf.get("animations", []):
+        for channel in animation.get("channels", []):
+            target = channel.get("target", {})
+            if "node" in target:
+                target["node"] = new_index[target["node"]]
+
+
+def _append_accessor(gltf, bin_chunk, values, accessor_type):
+    '''Append float values (a flat list) as a new accessor. Returns its index.'''
+    data = struct.pack("<" + str(len(values)) + "f", *values)
+    bin_chunk.extend(b"\0" * (-len(bin_chunk) % 4))
+    gltf.setdefault("bufferViews", []).append({"buffer": 0, "byteOffset": len(bin_chunk), "byteLength": len(data)})
+    bin_chunk.extend(data)
+    components = mesh_optimize.type_components[accessor_type]
+    gltf.setdefault("accessors", []).append({
+        "bufferView": len(gltf["bufferViews"]) - 1,
+        "componentType": float_component,
+        "type": accessor_type,
+        "count": len(values) // components,
+    })
+    return len(gltf["accessors"]) - 1
+
+
+def instance_nodes(gltf, bin_chunk, min_count=min_instances):
+    '''Replace groups of at least min_count instanceable nodes with the same mesh and parent by one
+    EXT_mesh_gpu_instancing node. Returns (new binary chunk, [{"mesh", "instances"}]).'''
+    nodes = gltf.get("nodes", [])
+    animated = set()
+    for animation in gltf.get("animations", []):
+        for channel in animation.get("channels", []):
+            if "node" in channel.get("target", {}):
+                animated.add(channel["target"]["node"])
+    # the list of child indices each node is in: a parent's children or a scene's nodes
+    siblings_of = {}
+    for scene in gltf.get("scenes", []):
+        for index in scene.get("nodes", []):
+            siblings_of[index] = scene["nodes"]
+    for node in nodes:
+        for index in node.get("children", []):
+            siblings_of[index] = node["children"]
+
+    groups = {}
+    for index, node in enumerate(nodes):
+        if _instanceable(node) and index not in animated and index in siblings_of:
+            groups.setdefault((id(siblings_of[index]), node["mesh"]), []).append(index)
+
+    bin_chunk = bytearray(bin_chunk)
+    removed = set()
+    instanced = []
+    for (siblings_id, mesh), indices in groups.items():
+        if len(indices) < min_count:
+            continue
+        translations = []
+        rotations = []
+        scales = []
+        for index in indices:
+            node = nodes[index]
+            translations += node.get("translation", [0.0, 0.0, 0.0])
+            rotations += node.get("rotation", [0.0, 0.0, 0.0, 1.0])
+            scales += node.get("scale", [1.0, 1.0, 1.0])
+        attributes = {"TRANSLATION": _append_accessor(gltf, bin_chunk, translations, "VEC3")}
+        if any(rotations[i:i + 4] != [0.0, 0.0, 0.0, 1.0] for i in range(0, len(rotations), 4)):
+            attributes["ROTATION"] = _append_accessor(gltf, bin_chunk, rotations, "VEC4")
+        if any(value != 1.0 for value in scales):
+            attributes["SCALE"] = _append_accessor(gltf, bin_chunk, scales, "VEC3")
+        mesh_name = gltf["meshes"][mesh].get("name", "mesh_" + str(mesh))
+        nodes.append({"name": mesh_name + "_instances", "mesh": mesh, "extensions": {extension_name: {"attributes": attributes}}})
+        # the new node takes the place of the first instance
+        siblings = siblings_of[indices[0]]
+        siblings[siblings.index(indices[0])] = len(nodes) - 1
+        removed.update(indices)
+        instanced.append({"mesh": mesh_name, "instances": len(indices)})
+    if removed:
+        remove_nodes(gltf, removed)
+        used = gltf.setdefault("extensionsUsed", [])
+        if extension_name not in used:
+            used.append(extension_name)
+        if gltf.get("buffers"):
+            gltf["buffers"][0]["byteLength"] = len(bin_chunk)
+        else:
+            gltf["buffers"] = [{"byteLength": len(bin_chunk)}]
+    instanced.sort(key=lambda group: group["instances"], reverse=True)
+    return bin_chunk, instanced
+
+
+def instance_glb(p_glb, min_count=min_instances):
+    '''Merge identical meshes and instance repeated ones in the given .glb file (in place).
+    Returns {"merged_meshes": {removed: kept}, "instanced": [{"mesh", "instances"}]}.'''
+    gltf, bin_chunk = mesh_optimize.read_glb(p_glb)
+    merged = merge_meshes(gltf, bin_chunk)
+    bin_chunk, instanced = instance_nodes(gltf, bin_chunk, min_count)
+    if merged or instanced:
+        bin_chunk = incremental_gltf.compact(gltf, bin_chunk)
+        mesh_optimize.write_glb(p_glb, gltf, bin_chunk)
+    return {"merged_meshes": merged, "instanced": instanced}
+
+
+def format_report(report):
+    lines = [str(len(report["merged_meshes"])) + " duplicate meshes merged, " + str(sum(group["instances"] for group in report["instanced"])) + " objects drawn as " + str(len(report["instanced"])) + " instanced meshes"]
+    for group in report["instanced"][:10]:
+        lines.append("  " + group["mesh"] + ": " + str(group["instances"]) + " instances")
+    return "\n".join(lines)
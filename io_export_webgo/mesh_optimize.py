@@ -0,0 +1,344 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Mesh size settings and post-processing of the exported model.glb.
+#
+# The pack does not contain the glb: Godot imports it and stores its own mesh
+# format. glTF level compression (Draco, meshopt) is not supported by Godot's
+# importer and would not shrink the pack anyway. Instead, the settings below
+# go into Godot's import settings of the model (model.glb.import): vertex
+# attribute quantization ("compression": 16 bit positions and UVs, octahedral
+# normals and tangents), tangent generation, LOD generation and shadow meshes.
+#
+# The optional post-process reorders the triangles of each primitive along a
+# Morton (Z-order) curve of their centroids and renumbers the vertices in
+# order of first use. Both improve vertex cache and fetch locality on the
+# client. The contents of the glb do not change, only their order.
+#
+# This module must not import bpy.
+
+import os
+import json
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+glb_magic = 0x46546C67
+chunk_json = 0x4E4F534A
+chunk_bin = 0x004E4942
+
+component_dtypes = {5120: "i1", 5121: "u1", 5122: "<i2", 5123: "<u2", 5125: "<u4", 5126: "<f4"}
+component_sizes = {5120: 1, 5121: 1, 5122: 2, 5123: 2, 5125: 4, 5126: 4}
+type_components = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT2": 4, "MAT3": 9, "MAT4": 16}
+
+mode_triangles = 4
+
+# Bytes per vertex of Godot's (4.2) mesh format for glTF attributes: (uncompressed, compressed).
+# Compressed normals and tangents share 4 bytes.
+imported_attribute_bytes = {
+    "POSITION": (12, 8),
+    "NORMAL": (4, 4),
+    "TANGENT": (4, 0),
+    "TEXCOORD_0": (8, 4),
+    "TEXCOORD_1": (8, 4),
+    "COLOR_0": (4, 4),
+    "JOINTS_0": (8, 8),
+    "WEIGHTS_0": (8, 8),
+}
+
+
+def import_params(settings):
+    '''Godot import settings (model.glb.import [params]) for the given mesh settings.'''
+    return {
+        "meshes/force_disable_compression": not settings["quantize"],
+        "meshes/ensure_tangents": settings["tangents"],
+        "meshes/generate_lods": settings["lods"],
+        "meshes/create_shadow_meshes": settings["shadow_meshes"],
+    }
+
+
+def set_import_params(p_import, params):
+    '''Set values in the [params] section of a Godot .import file, keeping all other lines. Creates a
+    minimal file (completed by Godot on import) if there is none.'''
+    try:
+        with open(p_import, "r", encoding="utf-8") as f:
+            original = f.read()
+    except FileNotFoundError:
+        original = '[remap]\n\nimporter="scene"\nimporter_version=1\ntype="PackedScene"\n\n[params]\n'
+    lines = original.splitlines()
+    values = {key: ("true" if value is True else "false" if value is False else str(value)) for key, value in params.items()}
+    section = None
+    missing = dict(values)
+    params_end = None
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith("[") and stripped.endswith("]"):
+            section = stripped
+            continue
+        if section == "[params]":
+            key = stripped.split("=", 1)[0]
+            if key in values:
+                lines[i] = key + "=" + values[key]
+                missing.pop(key, None)
+            if stripped:
+                params_end = i + 1
+    if missing:
+        if params_end is None:
+            lines += ["", "[params]", ""]
+            params_end = len(lines)
+        lines[params_end:params_end] = [key + "=" + value for key, value in missing.items()]
+    content = "\n".join(lines) + "\n"
+    if os.path.isfile(p_import) and content == original:
+        # unchanged: do not touch it
+        return
+    p_tmp = p_import + ".tmp"
+    with open(p_tmp, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(p_tmp, p_import)
+
+
+def read_glb(p_glb):
+    '''Return (glTF JSON, binary chunk as bytearray) of a .glb file.'''
+    with open(p_glb, "rb") as f:
+        data = f.read()
+    magic, version, length = struct.unpack_from("<III", data, 0)
+    if magic != glb_magic or version != 2:
+        raise ValueError("'" + p_glb + "' is not a glTF 2.0 binary file")
+    gltf = None
+    bin_chunk = bytearray()
+    offset = 12
+    while offset < length:
+        chunk_length, chunk_type = struct.unpack_from("<II", data, offset)
+        chunk = data[offset + 8:offset + 8 + chunk_length]
+        if chunk_type == chunk_json:
+            gltf = json.loads(chunk.decode("utf-8"))
+        elif chunk_type == chunk_bin and not bin_chunk:
+            bin_chunk = bytearray(chunk)
+        offset += 8 + chunk_length
+    if gltf is None:
+        raise ValueError("'" + p_glb + "' has no JSON chunk")
+    return gltf, bin_chunk
+
+
+def write_glb(p_glb, gltf, bin_chunk):
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    bin_chunk = bytes(bin_chunk) + b"\0" * (-len(bin_chunk) % 4)
+    length = 12 + 8 + len(json_chunk) + (8 + len(bin_chunk) if bin_chunk else 0)
+    p_tmp = p_glb + ".tmp"
+    with open(p_tmp, "wb") as f:
+        f.write(struct.pack("<III", glb_magic, 2, length))
+        f.write(struct.pack("<II", len(json_chunk), chunk_json))
+        f.write(json_chunk)
+        if bin_chunk:
+            f.write(struct.pack("<II", len(bin_chunk), chunk_bin))
+            f.write(bin_chunk)
+    os.replace(p_tmp, p_glb)
+
+
+def repack_bin(gltf, bin_chunk, replaced, removed_views=()):
+    '''Rebuild the binary chunk: buffer views in removed_views are dropped, views in replaced {view index: bytes}
+    get new contents. All other views keep their contents. Returns the new binary chunk.'''
+    views = gltf.get("bufferViews", [])
+    new_bin = bytearray()
+    new_index = {}
+    new_views = []
+    for index, view in enumerate(views):
+        if index in removed_views:
+            continue
+        if view.get("buffer", 0) != 0:
+            new_index[index] = len(new_views)
+            new_views.append(view)
+            continue
+        data = replaced.get(index)
+        if data is None:
+            offset = view.get("byteOffset", 0)
+            data = bin_chunk[offset:offset + view["byteLength"]]
+        new_bin += b"\0" * (-len(new_bin) % 4)
+        view = dict(view, byteOffset=len(new_bin), byteLength=len(data))
+        new_bin += data
+        new_index[index] = len(new_views)
+        new_views.append(view)
+    gltf["bufferViews"] = new_views
+    for accessor in gltf.get("accessors", []):
+        if "bufferView" in accessor:
+            accessor["bufferView"] = new_index[accessor["bufferView"]]
+        sparse = accessor.get("sparse")
+        if sparse:
+            sparse["indices"]["bufferView"] = new_index[sparse["indices"]["bufferView"]]
+            sparse["values"]["bufferView"] = new_index[sparse["values"]["bufferView"]]
+    for image in gltf.get("images", []):
+        if "bufferView" in image:
+            image["bufferView"] = new_index[image["bufferView"]]
+    new_bin += b"\0" * (-len(new_bin) % 4)
+    if gltf.get("buffers"):
+        gltf["buffers"][0]["byteLength"] = len(new_bin)
+    return new_bin
+
+
+def accessor_bytes(accessor):
+    return accessor["count"] * type_components[accessor["type"]] * component_sizes[accessor["componentType"]]
+
+
+def primitive_accessors(primitive):
+    '''Indices of all accessors (attributes, indices, morph targets) of a primitive.'''
+    accessors = list(primitive.get("attributes", {}).values())
+    if "indices" in primitive:
+        accessors.append(primitive["indices"])
+    for target in primitive.get("targets", []):
+        accessors += list(target.values())
+    return accessors
+
+
+def mesh_stats(gltf, settings):
+    '''Per mesh: primitive, vertex and triangle counts, the bytes of its data in the glb and an estimate of
+    the bytes of its vertex and index data after Godot's import with the given settings (LODs not included).'''
+    accessors = gltf.get("accessors", [])
+    stats = []
+    for mesh_index, mesh in enumerate(gltf.get("meshes", [])):
+        used = set()
+        vertices = 0
+        triangles = 0
+        imported = 0
+        for primitive in mesh.get("primitives", []):
+            used.update(primitive_accessors(primitive))
+            attributes = primitive.get("attributes", {})
+            if "POSITION" not in attributes:
+                continue
+            count = accessors[attributes["POSITION"]]["count"]
+            indices = accessors[primitive["indices"]]["count"] if "indices" in primitive else count
+            vertices += count
+            if primitive.get("mode", mode_triangles) == mode_triangles:
+                triangles += indices // 3
+            names = set(attributes)
+            if settings["tangents"] and "NORMAL" in names and "TEXCOORD_0" in names:
+                # Godot generates missing tangents
+                names.add("TANGENT")
+            compressed = 1 if settings["quantize"] else 0
+            vertex_bytes = sum(imported_attribute_bytes.get(name, (8, 8))[compressed] for name in names)
+            index_bytes = 2 if count <= 0xFFFF else 4
+            imported += count * vertex_bytes + indices * index_bytes
+            if settings["shadow_meshes"]:
+                imported += count * imported_attribute_bytes["POSITION"][compressed] + indices * index_bytes
+        stats.append({
+            "name": mesh.get("name", "mesh_" + str(mesh_index)),
+            "primitives": len(mesh.get("primitives", [])),
+            "vertices": vertices,
+            "triangles": triangles,
+            "glb_bytes": sum(accessor_bytes(accessors[i]) for i in used),
+            "imported_bytes": imported,
+        })
+    return stats
+
+
+def _accessor_array(gltf, bin_chunk, index):
+    '''(numpy array of shape (count, components), byte offset) of a tightly packed accessor, or None.'''
+    accessor = gltf["accessors"][index]
+    if "bufferView" not in accessor or "sparse" in accessor:
+        return None
+    view = gltf["bufferViews"][accessor["bufferView"]]
+    if view.get("buffer", 0) != 0:
+        return None
+    dtype = numpy.dtype(component_dtypes[accessor["componentType"]])
+    components = type_components[accessor["type"]]
+    if view.get("byteStride", components * dtype.itemsize) != components * dtype.itemsize:
+        # interleaved
+        return None
+    offset = view.get("byteOffset", 0) + accessor.get("byteOffset", 0)
+    array = numpy.frombuffer(bin_chunk, dtype=dtype, count=accessor["count"] * components, offset=offset)
+    return array.reshape(accessor["count"], components), offset
+
+
+def morton_codes(points):
+    '''30 bit Morton codes of 3D points, quantized to 10 bits per axis within their bounding box.'''
+    lo = points.min(axis=0)
+    extent = points.max(axis=0) - lo
+    extent[extent == 0] = 1
+    q = ((points - lo) / extent * 1023).astype(numpy.uint32)
+
+    def spread(v):
+        v = (v | (v << 16)) & 0x030000FF
+        v = (v | (v << 8)) & 0x0300F00F
+        v = (v | (v << 4)) & 0x030C30C3
+        v = (v | (v << 2)) & 0x09249249
+        return v
+
+    return spread(q[:, 0]) | (spread(q[:, 1]) << 1) | (spread(q[:, 2]) << 2)
+
+
+def optimize_order(gltf, bin_chunk):
+    '''Reorder the triangles and vertices of all indexed triangle primitives whose data is not shared with
+    other primitives, in place. Returns the number of reordered primitives.'''
+    if numpy is None:
+        return 0
+    accessors = gltf.get("accessors", [])
+    users = {}
+    for mesh in gltf.get("meshes", []):
+        for primitive in mesh.get("primitives", []):
+            for index in primitive_accessors(primitive):
+                users[index] = users.get(index, 0) + 1
+
+    optimized = 0
+    for mesh in gltf.get("meshes", []):
+        for primitive in mesh.get("primitives", []):
+            if primitive.get("mode", mode_triangles) != mode_triangles or "indices" not in primitive:
+                continue
+            attributes = primitive.get("attributes", {})
+            if "POSITION" not in attributes:
+                continue
+            vertex_accessors = [index for index in primitive_accessors(primitive) if index != primitive["indices"]]
+            if any(users[index] > 1 for index in primitive_accessors(primitive)):
+                continue
+            vertex_count = accessors[attributes["POSITION"]]["count"]
+            if any(accessors[index]["count"] != vertex_count for index in vertex_accessors):
+                continue
+            arrays = [_accessor_array(gltf, bin_chunk, index) for index in vertex_accessors]
+            index_array = _accessor_array(gltf, bin_chunk, primitive["indices"])
+            if index_array is None or any(array is None for array in arrays) or index_array[0].size % 3:
+                continue
+            positions = arrays[vertex_accessors.index(attributes["POSITION"])][0].astype(numpy.float64)
+            triangles = index_array[0].reshape(-1, 3).astype(numpy.int64)
+            if len(triangles) == 0 or triangles.max() >= vertex_count:
+                continue
+
+            # triangles along a space filling curve
+            triangles = triangles[numpy.argsort(morton_codes(positions[triangles].mean(axis=1)), kind="stable")]
+            # vertices in order of first use, unused ones last
+            flat = triangles.ravel()
+            used, first_use = numpy.unique(flat, return_index=True)
+            new_to_old = numpy.concatenate((used[numpy.argsort(first_use, kind="stable")], numpy.setdiff1d(numpy.arange(vertex_count), used)))
+            old_to_new = numpy.empty(vertex_count, dtype=numpy.int64)
+            old_to_new[new_to_old] = numpy.arange(vertex_count)
+
+            for array, offset in arrays:
+                reordered = array[new_to_old]
+                bin_chunk[offset:offset + reordered.nbytes] = reordered.tobytes()
+            indices, offset = index_array
+            reordered = old_to_new[flat].astype(indices.dtype)
+            bin_chunk[offset:offset + reordered.nbytes] = reordered.tobytes()
+            optimized += 1
+    return optimized
+
+
+def optimize_glb(p_glb):
+    '''Reorder the meshes of a .glb file for cache locality (see optimize_order). Returns the number of reordered primitives.'''
+    if numpy is None:
+        return 0
+    gltf, bin_chunk = read_glb(p_glb)
+    optimized = optimize_order(gltf, bin_chunk)
+    if optimized:
+        write_glb(p_glb, gltf, bin_chunk)
+    return optimized
@@ -0,0 +1,234 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Reading and writing Godot 4 packs (index.pck, pack format version 2) without
+# Godot. A pack is
+#   header:    "GDPC", format version, Godot major/minor/patch version, flags,
+#              file base (uint64), 16 reserved uint32
+#   directory: file count, then per file: path length (padded to 4 bytes),
+#              path, offset relative to the file base (uint64), size (uint64),
+#              MD5 of the contents, flags
+#   data:      the file contents, each padded to 16 bytes
+# All numbers are little endian. Encrypted packs cannot be read.
+#
+# Used by the exporter to report what takes up space inside a pack and to
+# patch cached packs (see export_cache.py). Can also be run from the command
+# line to inspect a pack:
+#
+#   python pck.py list index.pck
+#   python pck.py extract index.pck <directory> [res://path ...]
+#   python pck.py replace index.pck <new pck> res://path=<file> [...]
+#
+# This module must not import bpy.
+
+import os
+import sys
+import struct
+import hashlib
+import argparse
+
+pack_magic = b"GDPC"
+pack_format_version = 2
+
+# Godot's PCK_PADDING: alignment of the file base and of each file's contents
+pack_alignment = 16
+
+# Pack flags
+pack_dir_encrypted = 1 << 0
+pack_rel_filebase = 1 << 1
+
+# File flags
+pack_file_encrypted = 1 << 0
+
+copy_chunk_size = 1024 * 1024
+
+
+def _pad(size, alignment):
+    return -size % alignment
+
+
+def res_path(path):
+    '''Return path with the res:// prefix used in packs.'''
+    path = path.replace("\\", "/")
+    return path if path.startswith("res://") else "res://" + path.lstrip("/")
+
+
+class PackEntry:
+    """A file in a pack. Its contents are either data (set by Pack.set_file) or size bytes at offset in the pack file read."""
+
+    def __init__(self, path, size, md5, flags=0, offset=None, data=None):
+        self.path = path
+        self.size = size
+        self.md5 = md5
+        self.flags = flags
+        self.offset = offset
+        self.data = data
+
+
+class Pack:
+    """The directory of a pack. Contents of entries read from a pack file stay in the file until needed."""
+
+    def __init__(self, version=(4, 2, 1), flags=0):
+        self.version = tuple(version)
+        self.flags = flags
+        self.entries = {}
+        self.p_file = None
+
+    @classmethod
+    def read(cls, p_pck):
+        '''Read the directory of the pack file p_pck. Raises ValueError if it is not a readable Godot 4 pack.'''
+        pack = cls()
+        pack.p_file = os.path.abspath(p_pck)
+        with open(p_pck, "rb") as f:
+            header = f.read(32 + 16 * 4 + 4)
+            if len(header) < 100 or header[:4] != pack_magic:
+                raise ValueError("'" + p_pck + "' is not a Godot pack")
+            format_version, major, minor, patch, flags, file_base = struct.unpack_from("<5IQ", header, 4)
+            if format_version != pack_format_version:
+                raise ValueError("Unsupported pack format version " + str(format_version) + " in '" + p_pck + "'")
+            if flags & pack_dir_encrypted:
+                raise ValueError("Cannot read the encrypted pack '" + p_pck + "'")
+            # A pack embedded into an executable has its file base relative to the start of the pack. Standalone packs start at 0.
+            pack.version = (major, minor, patch)
+            pack.flags = flags & ~pack_rel_filebase
+            file_count = struct.unpack_from("<I", header, 96)[0]
+            for i in range(file_count):
+                path_length = struct.unpack("<I", f.read(4))[0]
+                path = f.read(path_length).rstrip(b"\0").decode("utf-8")
+                offset, size = struct.unpack("<QQ", f.read(16))
+                md5 = f.read(16)
+                file_flags = struct.unpack("<I", f.read(4))[0]
+                pack.entries[path] = PackEntry(path, size, md5, file_flags, offset=file_base + offset)
+        return pack
+
+    def paths(self):
+        return list(self.entries)
+
+    def _copy_entry(self, entry, dst):
+        '''Write the contents of entry to the open file dst.'''
+        if entry.data is not None:
+            dst.write(entry.data)
+            return
+        with open(self.p_file, "rb") as src:
+            src.seek(entry.offset)
+            remaining = entry.size
+            while remaining > 0:
+                chunk = src.read(min(copy_chunk_size, remaining))
+                if not chunk:
+                    raise ValueError("Pack '" + self.p_file + "' is truncated")
+                dst.write(chunk)
+                remaining -= len(chunk)
+
+    def read_file(self, path):
+        '''Return the contents of the file with the given path.'''
+        entry = self.entries[res_path(path)]
+        if entry.flags & pack_file_encrypted:
+            raise ValueError("Cannot read the encrypted file '" + entry.path + "'")
+        if entry.data is not None:
+            return entry.data
+        with open(self.p_file, "rb") as f:
+            f.seek(entry.offset)
+            return f.read(entry.size)
+
+    def extract(self, path, p_dst):
+        '''Write the contents of the file with the given path to p_dst.'''
+        os.makedirs(os.path.dirname(os.path.abspath(p_dst)), exist_ok=True)
+        with open(p_dst, "wb") as f:
+            f.write(self.read_file(path))
+
+    def extract_all(self, p_dir, paths=None):
+        '''Extract the given (or all) files below p_dir, keeping their paths relative to res://.'''
+        for path in paths or self.paths():
+            path = res_path(path)
+            self.extract(path, os.path.join(p_dir, *path[len("res://"):].split("/")))
+
+    def set_file(self, path, data):
+        '''Replace the contents of the file with the given path or add a new file.'''
+        path = res_path(path)
+        self.entries[path] = PackEntry(path, len(data), hashlib.md5(data).digest(), data=bytes(data))
+
+    def remove_file(self, path):
+        del self.entries[res_path(path)]
+
+    def write(self, p_pck):
+        '''Write the pack to p_pck, which must not be the pack file read.'''
+        if self.p_file and os.path.exists(p_pck) and os.path.samefile(p_pck, self.p_file):
+            raise ValueError("Cannot write a pack over the pack it was read from")
+        entries = list(self.entries.values())
+        directory = bytearray(struct.pack("<I", len(entries)))
+        offset = 0
+        for entry in entries:
+            path = entry.path.encode("utf-8")
+            path += b"\0" * _pad(len(path), 4)
+            directory += struct.pack("<I", len(path)) + path
+            directory += struct.pack("<QQ", offset, entry.size) + entry.md5 + struct.pack("<I", entry.flags)
+            offset += entry.size + _pad(entry.size, pack_alignment)
+        header_size = 32 + 16 * 4 + len(directory)
+        file_base = header_size + _pad(header_size, pack_alignment)
+        with open(p_pck, "wb") as f:
+            f.write(pack_magic + struct.pack("<5IQ", pack_format_version, *self.version, self.flags, file_base))
+            f.write(b"\0" * (16 * 4))
+            f.write(directory)
+            f.write(b"\0" * _pad(header_size, pack_alignment))
+            for entry in entries:
+                self._copy_entry(entry, f)
+                f.write(b"\0" * _pad(entry.size, pack_alignment))
+
+    def contents(self):
+        '''Return the files of the pack as [{"path", "size"}], largest first.'''
+        return sorted(({"path": entry.path, "size": entry.size} for entry in self.entries.values()), key=lambda item: item["size"], reverse=True)
+
+
+def format_contents(contents, max_lines=10):
+    '''Human readable summary of Pack.contents(): the largest files and their share of the pack.'''
+    total = sum(item["size"] for item in contents) or 1
+    lines = [str(len(contents)) + " files, " + str(total) + " bytes"]
+    for item in contents[:max_lines]:
+        lines.append("  " + format(item["size"], ">10") + " bytes " + format(100.0 * item["size"] / total, "5.1f") + " %  " + item["path"])
+    if len(contents) > max_lines:
+        lines.append("  ... " + str(len(contents) - max_lines) + " more")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and patch Godot 4 packs (.pck).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="list the files of a pack, largest first")
+    list_parser.add_argument("pck")
+    extract_parser = commands.add_parser("extract", help="extract files of a pack into a directory")
+    extract_parser.add_argument("pck")
+    extract_parser.add_argument("dir")
+    extract_parser.add_argument("paths", nargs="*", help="files to extract (default: all)")
+    replace_parser = commands.add_parser("replace", help="write a copy of a pack with files replaced or added")
+    replace_parser.add_argument("pck")
+    replace_parser.add_argument("out")
+    replace_parser.add_argument("files", nargs="+", help="res://path=local file")
+    args = parser.parse_args()
+
+    pack = Pack.read(args.pck)
+    if args.command == "list":
+        print("Godot " + ".".join(str(v) for v in pack.version) + " pack")
+        print(format_contents(pack.contents(), max_lines=len(pack.entries)))
+    elif args.command == "extract":
+        pack.extract_all(args.dir, args.paths)
+    elif args.command == "replace":
+        for file in args.files:
+            path, _, p_file = file.partition("=")
+            with open(p_file, "rb") as f:
+                pack.set_file(path, f.read())
+        pack.write(args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
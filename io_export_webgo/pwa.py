@@ -0,0 +1,217 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Progressive Web App export: a service worker and a web app manifest written
+# next to index.html, so the browser keeps the engine files (above all the
+# ~35 MB index.wasm) in its cache storage across visits and exports.
+#
+# Godot's own PWA export (progressive_web_app/enabled in the export preset)
+# is not used: its service worker is versioned by the time the template was
+# exported and serves the cached index.pck until the template changes, so a
+# new export of the scene would not show up. The service worker written here
+#   - precaches the engine files on install, in a cache named after a hash of
+#     their contents (the "engine version"), and answers them from that cache,
+#   - fetches index.html, index.pck and model.glb from the network first and
+#     falls back to a cached copy when offline.
+# Its contents only change when the engine changes, so re-exports do not
+# install a new worker. With the shared engine runtime (see shared_runtime.py)
+# the engine files are precached from the runtime directory: requests of a
+# controlled page go through the worker even outside of its scope. The engine loader registers it after startup
+# (GODOT_CONFIG.serviceWorker, see html_shell.py).
+#
+# This module must not import bpy.
+
+import os
+import json
+import struct
+import hashlib
+import threading
+
+service_worker_file_name = "index.service.worker.js"
+manifest_file_name = "index.manifest.json"
+pwa_files = [service_worker_file_name, manifest_file_name]
+
+# Precached and answered from the cache. Only the files present in the template are listed.
+engine_files = ["index.js", "index.wasm", "index.worker.js", "index.audio.worklet.js", "index.icon.png", "index.apple-touch-icon.png", "index.png"]
+# Fetched from the network, the cached copy is used offline
+network_first_files = ["index.html", "index.pck", "model.glb"]
+
+# Icons for the manifest, by preference
+icon_files = ["index.apple-touch-icon.png", "index.icon.png"]
+
+# Content hashes of the engine files by path, recomputed only if mtime or size changed
+_hash_cache = {}
+_hash_cache_lock = threading.Lock()
+
+
+def file_hash(path):
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    with _hash_cache_lock:
+        cached = _hash_cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    with _hash_cache_lock:
+        _hash_cache[path] = (key, digest)
+    return digest
+
+
+def present_engine_files(p_web_dir):
+    return [name for name in engine_files if os.path.isfile(os.path.join(p_web_dir, name))]
+
+
+def engine_version(p_web_dir):
+    '''Short hash of the names and contents of the engine files in p_web_dir.'''
+    hasher = hashlib.sha256()
+    for name in present_engine_files(p_web_dir):
+        hasher.update((name + "\0" + file_hash(os.path.join(p_web_dir, name)) + "\0").encode("utf-8"))
+    return hasher.hexdigest()[:16]
+
+
+def service_worker_js(version, precache, network_first):
+    '''precache and network_first are URLs relative to the service worker.'''
+    return """// Service worker of a web export of the Blender add-on "Export to Web (powered by Godot)".
+// Engine files are answered from a cache named after their content version, index.html,
+// the pack and the model are fetched from the network first (the cached copy is used offline).
+"use strict";
+
+const ENGINE_VERSION = %s;
+const PRECACHE = %s;
+const NETWORK_FIRST = %s;
+
+const SCOPE = self.registration.scope;
+const CACHE_PREFIX = "webgo:" + SCOPE + ":";
+const ENGINE_CACHE = CACHE_PREFIX + "engine:" + ENGINE_VERSION;
+const DATA_CACHE = CACHE_PREFIX + "data";
+
+const PRECACHE_URLS = new Set(PRECACHE.map((url) => new URL(url, self.location).href));
+const NETWORK_FIRST_URLS = new Set(NETWORK_FIRST.map((url) => new URL(url, self.location).href));
+
+self.addEventListener("install", (event) => {
+	event.waitUntil(caches.open(ENGINE_CACHE).then((cache) => cache.addAll(PRECACHE)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener("activate", (event) => {
+	// Remove the engine caches of earlier versions of this scope
+	event.waitUntil(caches.keys().then((keys) => Promise.all(keys.filter((key) =>
+		key.startsWith(CACHE_PREFIX + "engine:") && key !== ENGINE_CACHE
+	).map((key) => caches.delete(key)))).then(() => self.clients.claim()));
+});
+
+async function cacheFirst(request) {
+	const cache = await caches.open(ENGINE_CACHE);
+	const cached = await cache.match(request, { ignoreSearch: true, ignoreVary: true });
+	if (cached) {
+		return cached;
+	}
+	const response = await fetch(request);
+	if (response.ok) {
+		await cache.put(request, response.clone());
+	}
+	return response;
+}
+
+async function networkFirst(request, key) {
+	const cache = await caches.open(DATA_CACHE);
+	try {
+		const response = await fetch(request);
+		if (response.ok && response.status === 200) {
+			await cache.put(key, response.clone());
+		}
+		return response;
+	} catch (e) {
+		const cached = await cache.match(key, { ignoreVary: true });
+		if (cached) {
+			return cached;
+		}
+		throw e;
+	}
+}
+
+self.addEventListener("fetch", (event) => {
+	const request = event.request;
+	if (request.method !== "GET" || request.headers.has("range")) {
+		return;
+	}
+	let url = request.url.split(/[?#]/)[0];
+	if (url === SCOPE) {
+		url += "index.html";
+	}
+	if (PRECACHE_URLS.has(url)) {
+		event.respondWith(cacheFirst(request));
+	} else if (NETWORK_FIRST_URLS.has(url)) {
+		event.respondWith(networkFirst(request, url));
+	}
+});
+""" % (json.dumps(version), json.dumps(precache), json.dumps(network_first))
+
+
+def png_size(path):
+    '''(width, height) of a PNG file, None if it is not one.'''
+    try:
+        with open(path, "rb") as f:
+            header = f.read(24)
+    except OSError:
+        return None
+    if len(header) < 24 or header[:8] != b"\x89PNG\r\n\x1a\n" or header[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", header[16:24])
+
+
+def manifest(name, p_web_dir, runtime_url=""):
+    icons = []
+    for icon_name in icon_files:
+        size = png_size(os.path.join(p_web_dir, icon_name))
+        if size:
+            icons.append({"src": runtime_url + icon_name, "sizes": str(size[0]) + "x" + str(size[1]), "type": "image/png"})
+    return {
+        "name": name,
+        "short_name": name[:12],
+        "start_url": "./index.html",
+        "scope": "./",
+        "display": "standalone",
+        "background_color": "#000000",
+        "icons": icons,
+    }
+
+
+def write_files(p_web_dir, p_dir, name, write, runtime_url=""):
+    '''Write the service worker and manifest for the engine files in p_web_dir (the web template)
+    with write(p_file, text) into p_dir. runtime_url is the URL of the engine files relative to p_dir.
+    Returns the engine version.'''
+    version = engine_version(p_web_dir)
+    precache = [runtime_url + file_name for file_name in present_engine_files(p_web_dir)]
+    write(os.path.join(p_dir, service_worker_file_name), service_worker_js(version, precache, network_first_files))
+    write(os.path.join(p_dir, manifest_file_name), json.dumps(manifest(name, p_web_dir, runtime_url), indent=2) + "\n")
+    return version
+
+
+manifest_link = '<link rel="manifest" href="' + manifest_file_name + '" />'
+
+
+def add_manifest_link(html):
+    '''Return index.html contents with a link to the manifest in the head.'''
+    if manifest_link in html:
+        return html
+    idx = html.find("</head>")
+    if idx < 0:
+        raise ValueError("No </head> found in the HTML shell")
+    return html[:idx] + manifest_link + "\n" + html[idx:]
@@ -0,0 +1,221 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Scene statistics of the exported model.glb: the bounding box of all mesh
+# vertices in world space (glTF coordinates, Y up, which are the viewer's),
+# the number of objects, vertices and triangles and a camera distance showing
+# the whole model.
+#
+# The viewer needs the bounding box to scale and center the model. Without
+# these statistics, it walks the node tree on startup and merges the AABBs of
+# all meshes (calc_aabb in turntable.gd), which takes a noticeable time in the
+# browser for scenes with many nodes. The exporter computes them from the final
+# glb (after instancing and mesh optimization), transforming the vertices of
+# each mesh with the world matrices of all nodes and instances showing it, in
+# batches with NumPy. They are passed to the viewer in index.html (viewer_arg,
+# see turntable.gd) and written to the export report.
+#
+# This module must not import bpy.
+
+import json
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import instancing
+from . import mesh_optimize
+
+viewer_arg_prefix = "--webgo-scene-stats="
+
+# Vertical field of view of the viewer's camera (Godot's default, see main.tscn)
+camera_fov_degrees = 75.0
+
+# Vertices times matrices transformed at once
+batch_size = 1 << 20
+
+# Value ranges of normalized integer components (KHR_mesh_quantization)
+normalized_divisors = {5120: 127.0, 5121: 255.0, 5122: 32767.0, 5123: 65535.0}
+
+
+def accessor_array(gltf, bin_chunk, index):
+    '''Float array of shape (count, components) of an accessor, None for sparse accessors.'''
+    accessor = gltf["accessors"][index]
+    data = instancing.accessor_data(gltf, bin_chunk, index)
+    if data is None:
+        return None
+    components = mesh_optimize.type_components[accessor["type"]]
+    array = numpy.frombuffer(data, dtype=mesh_optimize.component_dtypes[accessor["componentType"]]).astype(numpy.float64)
+    if accessor.get("normalized"):
+        array = numpy.maximum(array / normalized_divisors[accessor["componentType"]], -1.0)
+    return array.reshape(accessor["count"], components)
+
+
+def trs_matrices(translations, rotations, scales):
+    '''(count, 4, 4) matrices of count translations, rotation quaternions (x, y, z, w) and scales.'''
+    x, y, z, w = rotations.T
+    count = len(translations)
+    m = numpy.zeros((count, 4, 4))
+    m[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    m[:, 0, 1] = 2 * (x * y - z * w)
+    m[:, 0, 2] = 2 * (x * z + y * w)
+    m[:, 1, 0] = 2 * (x * y + z * w)
+    m[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    m[:, 1, 2] = 2 * (y * z - x * w)
+    m[:, 2, 0] = 2 * (x * z - y * w)
+    m[:, 2, 1] = 2 * (y * z + x * w)
+    m[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    m[:, :3, :3] *= scales[:, None, :]
+    m[:, :3, 3] = translations
+    m[:, 3, 3] = 1.0
+    return m
+
+
+def node_matrix(node):
+    if "matrix" in node:
+        # column major
+        return numpy.array(node["matrix"], dtype=numpy.float64).reshape(4, 4).T
+    return trs_matrices(
+        numpy.array([node.get("translation", [0.0, 0.0, 0.0])], dtype=numpy.float64),
+        numpy.array([node.get("rotation", [0.0, 0.0, 0.0, 1.0])], dtype=numpy.float64),
+        numpy.array([node.get("scale", [1.0, 1.0, 1.0])], dtype=numpy.float64),
+    )[0]
+
+
+def instance_matrices(gltf, bin_chunk, node):
+    '''Local matrices of the instances of an EXT_mesh_gpu_instancing node, None for a plain node.'''
+    extension = node.get("extensions", {}).get(instancing.extension_name)
+    if not extension:
+        return None
+    attributes = extension.get("attributes", {})
+    arrays = {name: accessor_array(gltf, bin_chunk, index) for name, index in attributes.items()}
+    counts = [len(array) for array in arrays.values() if array is not None]
+    if not counts:
+        return None
+    count = counts[0]
+
+    def attribute(name, default):
+        array = arrays.get(name)
+        return array[:, :len(default)] if array is not None else numpy.tile(default, (count, 1))
+
+    return trs_matrices(attribute("TRANSLATION", [0.0, 0.0, 0.0]), attribute("ROTATION", [0.0, 0.0, 0.0, 1.0]), attribute("SCALE", [1.0, 1.0, 1.0]))
+
+
+def mesh_world_matrices(gltf, bin_chunk):
+    '''{mesh index: (count, 4, 4) world matrices of the nodes (and instances) showing it} of the default scene.'''
+    nodes = gltf.get("nodes", [])
+    scenes = gltf.get("scenes", [])
+    if not scenes:
+        return {}
+    matrices = {}
+    stack = [(index, numpy.identity(4)) for index in scenes[gltf.get("scene", 0)].get("nodes", [])]
+    while stack:
+        index, parent = stack.pop()
+        node = nodes[index]
+        world = parent @ node_matrix(node)
+        if "mesh" in node:
+            instances = instance_matrices(gltf, bin_chunk, node)
+            matrices.setdefault(node["mesh"], []).append(world[None] if instances is None else world @ instances)
+        stack += [(child, world) for child in node.get("children", [])]
+    return {mesh: numpy.concatenate(arrays) for mesh, arrays in matrices.items()}
+
+
+def mesh_positions(gltf, bin_chunk, mesh):
+    '''(count, 3) positions of all primitives of a mesh (morph targets not applied).'''
+    positions = []
+    for primitive in mesh.get("primitives", []):
+        index = primitive.get("attributes", {}).get("POSITION")
+        if index is not None:
+            array = accessor_array(gltf, bin_chunk, index)
+            if array is not None:
+                positions.append(array[:, :3])
+    return numpy.concatenate(positions) if positions else numpy.zeros((0, 3))
+
+
+def mesh_triangles(gltf, mesh):
+    accessors = gltf["accessors"]
+    triangles = 0
+    for primitive in mesh.get("primitives", []):
+        if primitive.get("mode", mesh_optimize.mode_triangles) != mesh_optimize.mode_triangles or "POSITION" not in primitive.get("attributes", {}):
+            continue
+        count = accessors[primitive["indices"]]["count"] if "indices" in primitive else accessors[primitive["attributes"]["POSITION"]]["count"]
+        triangles += count // 3
+    return triangles
+
+
+def transformed_bounds(points, matrices):
+    '''(min, max) of points transformed by each of the matrices.'''
+    lo = numpy.full(3, numpy.inf)
+    hi = numpy.full(3, -numpy.inf)
+    step = max(1, batch_size // max(1, len(points)))
+    for start in range(0, len(matrices), step):
+        batch = matrices[start:start + step]
+        # (matrices, points, 3)
+        transformed = numpy.einsum("kij,vj->kvi", batch[:, :3, :3], points) + batch[:, None, :3, 3]
+        lo = numpy.minimum(lo, transformed.min(axis=(0, 1)))
+        hi = numpy.maximum(hi, transformed.max(axis=(0, 1)))
+    return lo, hi
+
+
+def camera_distance(size, fov_degrees=camera_fov_degrees):
+    '''Distance from the center of a box of the given size at which a camera sees all of it from any direction.'''
+    radius = 0.5 * math.sqrt(sum(s * s for s in size))
+    return radius / math.sin(math.radians(fov_degrees) / 2)
+
+
+def compute(gltf, bin_chunk):
+    '''Statistics of a glTF model (see the top of this module). Raises RuntimeError without NumPy.'''
+    if numpy is None:
+        raise RuntimeError("NumPy is not available")
+    meshes = gltf.get("meshes", [])
+    lo = numpy.full(3, numpy.inf)
+    hi = numpy.full(3, -numpy.inf)
+    objects = 0
+    vertices = 0
+    triangles = 0
+    for mesh_index, matrices in mesh_world_matrices(gltf, bin_chunk).items():
+        mesh = meshes[mesh_index]
+        points = mesh_positions(gltf, bin_chunk, mesh)
+        objects += len(matrices)
+        vertices += len(points) * len(matrices)
+        triangles += mesh_triangles(gltf, mesh) * len(matrices)
+        if len(points):
+            mesh_lo, mesh_hi = transformed_bounds(points, matrices)
+            lo = numpy.minimum(lo, mesh_lo)
+            hi = numpy.maximum(hi, mesh_hi)
+    stats = {"objects": objects, "vertices": vertices, "triangles": triangles, "aabb": None, "camera_distance": None}
+    if objects and numpy.all(hi >= lo):
+        size = hi - lo
+        stats["aabb"] = {"position": [round(float(v), 6) for v in lo], "size": [round(float(v), 6) for v in size]}
+        stats["camera_distance"] = round(camera_distance([float(v) for v in size]), 6)
+    return stats
+
+
+def compute_glb(p_glb):
+    gltf, bin_chunk = mesh_optimize.read_glb(p_glb)
+    return compute(gltf, bin_chunk)
+
+
+def viewer_arg(stats):
+    '''The viewer argument passing the bounding box and camera distance to the viewer (see turntable.gd).'''
+    return viewer_arg_prefix + json.dumps({"aabb": stats["aabb"], "camera_distance": stats["camera_distance"]}, separators=(",", ":"))
+
+
+def format_stats(stats):
+    text = "Scene: " + str(stats["objects"]) + " objects, " + str(stats["vertices"]) + " vertices, " + str(stats["triangles"]) + " triangles"
+    if stats["aabb"]:
+        text += ", bounds " + " x ".join(format(v, ".3g") for v in stats["aabb"]["size"]) + " at " + ", ".join(format(v, ".3g") for v in stats["aabb"]["position"])
+        text += ", camera distance " + format(stats["camera_distance"], ".3g")
+    return text
@@ -1,11 +1,22 @@
 #!/usr/bin/env python3
 
-from http.server import HTTPServer, SimpleHTTPRequestHandler, test  # type: ignore
+from http.server import HTTPServer, ThreadingHTTPServer, SimpleHTTPRequestHandler, test  # type: ignore
+from http import HTTPStatus
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+import io
 import os
+import re
 import sys
+import json
+import time
+import queue
 import argparse
+import hashlib
+import posixpath
+import threading
 import subprocess
+import urllib.parse
 
 class ArgumentParserForBlender(argparse.ArgumentParser):
     """
@@ -47,16 +58,502 @@ class ArgumentParserForBlender(argparse.ArgumentParser):
         return super().parse_args(args=self._get_argv_after_doubledash())
 
 
+def parse_byte_range(range_header, size):
+    """
+    Parse a single HTTP Range header ("bytes=start-end", "bytes=start-" or
+    "bytes=-suffix_length") for a file of the given size. Returns the inclusive
+    (start, end) tuple, None if the header should be ignored (malformed or
+    multiple ranges, answered with the whole file), or False if the range
+    cannot be satisfied.
+    """
+    units, _, ranges = range_header.partition("=")
+    if units.strip() != "bytes" or "," in ranges:
+        return None
+    start, sep, end = ranges.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start == "":
+            # suffix range: the last N bytes
+            length = int(end)
+            if length <= 0 or size == 0:
+                return False
+            return (max(0, size - length), size - 1)
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if end < start:
+        return None
+    return (start, min(end, size - 1))
+
+
+# With --cache: the engine files never change between exports and may be cached by the
+# browser without asking. Everything else (most notably index.pck) is always revalidated.
+long_lived_files = {"index.wasm", "index.js", "index.worker.js", "index.audio.worklet.js"}
+long_lived_max_age = 7 * 24 * 60 * 60
+
+# With --immutable: deploy builds (see deploy.py) have the content hash in their file names,
+# e.g. index.3fa9c1d2e4b7.pck, and the shared engine runtime is versioned by its directory
+# (webgo_runtime/<version>/). Such files never change and are cached for a year, as a CDN
+# would serve them. Kept in sync with deploy.py and shared_runtime.py by hand, this script
+# runs without the add-on.
+immutable_pattern = re.compile(r"\.[0-9a-f]{12}\.|/webgo_runtime/[0-9a-f]{16}/")
+immutable_max_age = 365 * 24 * 60 * 60
+
+# Written by PWA exports (see pwa.py). Browsers check the service worker for updates on each
+# visit, so it is always revalidated, and it may control the directory it is served from.
+service_worker_suffix = ".service.worker.js"
+
+# Strong ETags (content hashes) by file path, recomputed only if mtime or size changed
+etag_cache = {}
+etag_cache_lock = threading.Lock()
+
+
+def get_etag(path):
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    with etag_cache_lock:
+        cached = etag_cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    etag = '"' + hasher.hexdigest()[:32] + '"'
+    with etag_cache_lock:
+        etag_cache[path] = (key, etag)
+    return etag
+
+
+# Precompressed siblings written by the exporter, best first
+precompressed_variants = [("br", ".br"), ("gzip", ".gz")]
+
+
+def parse_accept_encoding(accept_encoding):
+    """
+    Return the set of content codings accepted by the client according to the
+    given Accept-Encoding header (codings with q=0 are left out).
+    """
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+# With --live-reload: endpoints of the server and the script injected into served html pages
+live_reload_events_path = "/__webgo/events"
+live_reload_notify_path = "/__webgo/notify"
+# With --load-time-log: viewers started with --webgo-report-load-time post their load time here
+load_time_path = "/__webgo/load-time"
+live_reload_script = b"""<script>
+// Injected by the local web server (--live-reload): reload when the export changed. The engine
+// files stay in the browser cache (--cache), so only index.html and index.pck are fetched again.
+(function () {
+	var source = new EventSource("/__webgo/events");
+	source.addEventListener("reload", function () {
+		source.close();
+		window.location.reload();
+	});
+})();
+</script>
+"""
+
+
+class LiveReload:
+    """
+    Watches the exported files in the served directory and sends a reload
+    event (Server-Sent Events) to all connected viewers when they changed,
+    e.g. because the Blender add-on exported again into the same directory.
+    """
+
+    # model.glb is only part of draft exports (the viewer streams it at runtime)
+    required_files = ["index.pck", "index.html"]
+    watched_files = required_files + ["model.glb"]
+
+    def __init__(self, root, interval=0.5):
+        self.root = root
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.clients = []
+        self.version = self.current_version()
+
+    def current_version(self):
+        version = []
+        for name in self.watched_files:
+            try:
+                st = os.stat(os.path.join(self.root, name))
+                version.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except OSError:
+                version.append(None)
+        return tuple(version)
+
+    def subscribe(self):
+        q = queue.Queue()
+        with self.lock:
+            self.clients.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            if q in self.clients:
+                self.clients.remove(q)
+
+    def client_count(self):
+        with self.lock:
+            return len(self.clients)
+
+    def check(self):
+        """
+        Send a reload event if the watched files changed since the last event
+        and are complete (all present). Returns True if an event was sent.
+        """
+        with self.lock:
+            version = self.current_version()
+            if version == self.version or None in version[:len(self.required_files)]:
+                return False
+            self.version = version
+            event = json.dumps({"time": time.time()})
+            for q in self.clients:
+                q.put(event)
+        print("Export changed, reloading " + str(len(self.clients)) + " viewer(s)")
+        return True
+
+    def watch(self):
+        # Only react to changes that stay the same over one interval, i.e. finished writes
+        while True:
+            time.sleep(self.interval)
+            version = self.current_version()
+            if version == self.version:
+                continue
+            time.sleep(self.interval)
+            if self.current_version() == version:
+                self.check()
+
+    def start(self):
+        threading.Thread(target=self.watch, daemon=True).start()
+
+
+def parse_mount(mount):
+    """
+    Parse a --mount argument "URL_PATH=DIRECTORY" into the URL path prefix
+    (with a leading and without a trailing slash) and the absolute directory.
+    """
+    url_path, sep, directory = mount.partition("=")
+    url_path = "/" + url_path.strip("/")
+    if not sep or url_path == "/" or not directory:
+        raise argparse.ArgumentTypeError("expected URL_PATH=DIRECTORY, got '" + mount + "'")
+    return url_path, os.path.abspath(directory)
+
+
+def mounted_path(root, mounts, url_path):
+    """
+    Return the file system path of a (decoded) URL path, looking it up in the
+    mounted directories first and in root otherwise.
+    """
+    for prefix, directory in mounts:
+        if url_path == prefix or url_path.startswith(prefix + "/"):
+            return os.path.join(directory, url_path[len(prefix):].strip("/"))
+    return os.path.join(root, url_path.strip("/"))
+
+
 class CORSRequestHandler(SimpleHTTPRequestHandler):
+    # Absolute path of the served directory. The server does not chdir into it, so an
+    # exporter can replace the directory while the server keeps running.
+    root_directory = None
+
+    # Set by --mount: (URL path prefix, directory) pairs, longest prefix first. Serves further
+    # directories under sub-paths, e.g. many exports sharing one engine runtime.
+    mounts = []
+
+    # Set by --live-reload
+    live_reload : LiveReload = None
+
+    # Set by --load-time-log: file the posted load times are appended to (one JSON object per line)
+    load_time_log = None
+
+    # Send file contents with os.sendfile (where available) instead of copying them through
+    # Python and answer Range requests. Switched off by --single-threaded.
+    zero_copy = True
+
+    # Validator based caching (ETag, Last-Modified, 304) instead of no-store. Switched on by --cache.
+    caching = False
+
+    # Cache-Control: immutable for content-hashed files. Switched on by --immutable (implies --cache).
+    immutable = False
+
+    byte_range = None
+    etag = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=self.root_directory, **kwargs)
+
+    def do_GET(self):
+        if self.live_reload and urllib.parse.urlsplit(self.path).path == live_reload_events_path:
+            self.send_events()
+            return
+        super().do_GET()
+
+    def do_POST(self):
+        if self.live_reload and urllib.parse.urlsplit(self.path).path == live_reload_notify_path:
+            # The exporter finished writing: check right away instead of waiting for the watcher
+            self.live_reload.check()
+            body = json.dumps({"clients": self.live_reload.client_count()}).encode("utf-8")
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.load_time_log and urllib.parse.urlsplit(self.path).path == load_time_path:
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                entry = json.loads(self.rfile.read(length))
+            except ValueError:
+                self.send_error(HTTPStatus.BAD_REQUEST, "Invalid load time")
+                return
+            entry["time"] = time.time()
+            print("Viewer loaded in " + str(round(entry.get("page_ms", 0))) + " ms (" + str(entry.get("mode")) + ")")
+            with open(self.load_time_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            self.send_response(HTTPStatus.NO_CONTENT)
+            self.end_headers()
+            return
+        self.send_error(HTTPStatus.NOT_IMPLEMENTED, "Unsupported method (POST)")
+
+    def send_events(self):
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        # No Content-Length: the stream ends when the connection closes
+        self.close_connection = True
+        q = self.live_reload.subscribe()
+        try:
+            self.wfile.write(b": connected\n\n")
+            while True:
+                try:
+                    event = q.get(timeout=15)
+                except queue.Empty:
+                    self.wfile.write(b": keep-alive\n\n")
+                    continue
+                self.wfile.write(("event: reload\ndata: " + event + "\n\n").encode("utf-8"))
+        except OSError:
+            pass
+        finally:
+            self.live_reload.unsubscribe(q)
+
+    def send_head_live_reload(self, path):
+        # Serve html pages with the live reload script injected (never precompressed or cached)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+        except OSError:
+            return super().send_head()
+        idx = content.rfind(b"</body>")
+        if idx < 0:
+            idx = len(content)
+        content = content[:idx] + live_reload_script + content[idx:]
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-type", self.guess_type(path))
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        return io.BytesIO(content)
+
+    def translate_path(self, path):
+        url_path = urllib.parse.unquote(urllib.parse.urlsplit(path).path)
+        for prefix, directory in self.mounts:
+            if url_path == prefix or url_path.startswith(prefix + "/"):
+                # resolve the rest of the path like the base class does, but below the mounted directory
+                root_directory = self.directory
+                self.directory = directory
+                try:
+                    return super().translate_path(urllib.parse.quote(url_path[len(prefix):] or "/"))
+                finally:
+                    self.directory = root_directory
+        return super().translate_path(path)
+
     def end_headers(self):
         self.send_header("Cross-Origin-Opener-Policy", "same-origin")
         self.send_header("Cross-Origin-Embedder-Policy", "require-corp")
         self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Cache-Control", "no-cache, no-store, must-revalidate")
-        self.send_header("Pragma", "no-cache")
-        self.send_header("Expires", "0")
+        url_path = urllib.parse.urlsplit(self.path).path
+        name = posixpath.basename(url_path)
+        if name.endswith(service_worker_suffix):
+            self.send_header("Service-Worker-Allowed", posixpath.dirname(url_path).rstrip("/") + "/")
+        if self.caching:
+            if self.immutable and immutable_pattern.search(url_path):
+                self.send_header("Cache-Control", "public, max-age=" + str(immutable_max_age) + ", immutable")
+            elif name in long_lived_files:
+                self.send_header("Cache-Control", "public, max-age=" + str(long_lived_max_age))
+            else:
+                self.send_header("Cache-Control", "no-cache")
+            if self.etag:
+                self.send_header("ETag", self.etag)
+        else:
+            self.send_header("Cache-Control", "no-cache, no-store, must-revalidate")
+            self.send_header("Pragma", "no-cache")
+            self.send_header("Expires", "0")
+        self.send_header("Vary", "Accept-Encoding")
         super().end_headers()
 
+    def send_head(self):
+        self.byte_range = None
+        self.etag = None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and urllib.parse.urlsplit(self.path).path.endswith("/"):
+            # The directory's index page, like the base class, but with live reload, precompression and ETags.
+            # Without a trailing slash, the base class redirects.
+            for index in ("index.html", "index.htm"):
+                if os.path.isfile(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+        if not os.path.isfile(path):
+            return super().send_head()
+        if self.live_reload and path.endswith(".html"):
+            return self.send_head_live_reload(path)
+        range_header = self.headers.get("Range")
+        if self.zero_copy and range_header:
+            if self.caching:
+                self.etag = get_etag(path)
+            return self.send_head_range(path, range_header)
+        encoding, p_variant = self.find_precompressed(path) or (None, path)
+        if self.caching and self.send_not_modified(path, p_variant):
+            return None
+        if encoding:
+            return self.send_head_precompressed(path, encoding, p_variant)
+        return super().send_head()
+
+    def send_not_modified(self, path, p_variant):
+        """
+        Answer with 304 Not Modified if the client's If-None-Match (or, only
+        if absent, If-Modified-Since) validator matches the file to be sent.
+        Sets self.etag in any case. Returns True if the 304 was sent.
+        """
+        try:
+            self.etag = get_etag(p_variant)
+            mtime = int(os.path.getmtime(path))
+        except OSError:
+            return False
+        if_none_match = self.headers.get("If-None-Match")
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            if "*" not in tags and self.etag not in tags:
+                return False
+        elif if_modified_since is not None:
+            try:
+                if mtime > parsedate_to_datetime(if_modified_since).timestamp():
+                    return False
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+        else:
+            return False
+        self.send_response(HTTPStatus.NOT_MODIFIED)
+        self.send_header("Last-Modified", self.date_time_string(mtime))
+        self.end_headers()
+        return True
+
+    def find_precompressed(self, path):
+        """
+        Return (encoding, path) of the best precompressed sibling of path
+        (e.g. index.wasm.br) accepted by the client, or None.
+        """
+        accepted = parse_accept_encoding(self.headers.get("Accept-Encoding", ""))
+        for encoding, extension in precompressed_variants:
+            if encoding not in accepted:
+                continue
+            p_compressed = path + extension
+            try:
+                # a sibling older than its source is outdated
+                if os.path.getmtime(p_compressed) >= os.path.getmtime(path):
+                    return encoding, p_compressed
+            except OSError:
+                continue
+        return None
+
+    def send_head_precompressed(self, path, encoding, p_compressed):
+        try:
+            f = open(p_compressed, "rb")
+        except OSError:
+            return super().send_head()
+        try:
+            fs = os.fstat(f.fileno())
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-type", self.guess_type(path))
+            self.send_header("Content-Encoding", encoding)
+            self.send_header("Content-Length", str(fs.st_size))
+            self.send_header("Last-Modified", self.date_time_string(os.path.getmtime(path)))
+            self.end_headers()
+            return f
+        except:
+            f.close()
+            raise
+
+    def send_head_range(self, path, range_header):
+        # Ranges always refer to the uncompressed file
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return super().send_head()
+        try:
+            fs = os.fstat(f.fileno())
+            byte_range = parse_byte_range(range_header, fs.st_size)
+            if byte_range is None:
+                f.close()
+                return super().send_head()
+            if byte_range is False:
+                f.close()
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", "bytes */" + str(fs.st_size))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            start, end = byte_range
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header("Content-type", self.guess_type(path))
+            self.send_header("Content-Range", "bytes " + str(start) + "-" + str(end) + "/" + str(fs.st_size))
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
+            self.end_headers()
+            self.byte_range = (start, end - start + 1)
+            return f
+        except:
+            f.close()
+            raise
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        if self.zero_copy:
+            self.send_header("Accept-Ranges", "bytes")
+
+    def copyfile(self, source, outputfile):
+        if not self.zero_copy:
+            return super().copyfile(source, outputfile)
+        # socket.sendfile uses os.sendfile for regular files and falls back to
+        # plain send() for anything else (e.g. directory listings) or on Windows.
+        # The response headers have already been flushed by end_headers.
+        offset, count = self.byte_range if self.byte_range else (0, None)
+        self.connection.sendfile(source, offset, count)
+
 
 def shell_open(url):
     if sys.platform == "win32":
@@ -66,15 +563,35 @@ def shell_open(url):
         subprocess.call([opener, url])
 
 
-def serve(root, port, run_browser):
-    os.chdir(root)
+def serve(root, port, run_browser, single_threaded=False, caching=False, live_reload=False, load_time_log=None, open_path="/", mounts=(), immutable=False):
+    root = os.path.abspath(root)
+    CORSRequestHandler.root_directory = root
+    CORSRequestHandler.mounts = sorted(mounts, key=lambda mount: len(mount[0]), reverse=True)
+    CORSRequestHandler.caching = caching or immutable
+    CORSRequestHandler.immutable = immutable
+    CORSRequestHandler.load_time_log = os.path.abspath(load_time_log) if load_time_log else None
+    if live_reload:
+        if single_threaded:
+            # an open event stream would block all other requests
+            print("Live reload is not available with --single-threaded")
+        else:
+            # watch the export shown at the opened path
+            CORSRequestHandler.live_reload = LiveReload(mounted_path(root, CORSRequestHandler.mounts, urllib.parse.unquote(open_path)))
+            CORSRequestHandler.live_reload.start()
 
     if run_browser:
         # Open the served page in the user's default browser.
         print("Opening the served URL in the default browser (use `--no-browser` or `-n` to disable this).")
-        shell_open(f"http://localhost:{port}")
+        shell_open(f"http://localhost:{port}{open_path}")
 
-    test(CORSRequestHandler, HTTPServer, port=port)
+    if single_threaded:
+        # The original behavior: one request at a time, files copied through Python
+        CORSRequestHandler.zero_copy = False
+        test(CORSRequestHandler, HTTPServer, port=port)
+    else:
+        # One thread per connection, so a large download does not block other requests.
+        # HTTP/1.1 keeps connections alive between the requests of a page.
+        test(CORSRequestHandler, ThreadingHTTPServer, protocol="HTTP/1.1", port=port)
 
 
 if __name__ == "__main__":
@@ -89,11 +606,34 @@ if __name__ == "__main__":
     browser_parser.add_argument(
         "-n", "--no-browser", help="don't open default web browser automatically", dest="browser", action="store_false"
     )
+    parser.add_argument(
+        "--single-threaded", help="serve one request at a time without sendfile and Range support (old behavior)", action="store_true"
+    )
+    parser.add_argument(
+        "--cache", help="let browsers cache files, revalidated with ETag/Last-Modified (default: no-store)", dest="cache", action="store_true"
+    )
+    parser.add_argument(
+        "--immutable", help="serve content-hashed files (deploy builds, shared engine runtime) as cached for a year without revalidation, like a CDN (implies --cache)", action="store_true"
+    )
+    parser.add_argument(
+        "--live-reload", help="reload open viewers when the served export changes", dest="live_reload", action="store_true"
+    )
+    parser.add_argument(
+        "--load-time-log", help="append the load times posted by viewers to this file", dest="load_time_log", default=None
+    )
+    parser.add_argument(
+        "--open", help="URL path to open in the browser and to watch with --live-reload, e.g. /my_export/ (default: /)", dest="open_path", default="/"
+    )
+    parser.add_argument(
+        "--mount", help="also serve DIRECTORY under URL_PATH (repeatable)", metavar="URL_PATH=DIRECTORY", dest="mounts", action="append", default=[], type=parse_mount
+    )
     parser.set_defaults(browser=True)
     args = parser.parse_args()
 
-    # Change to the directory where the script is located,
-    # so that the script can be run from any location.
-    os.chdir(Path(__file__).resolve().parent)
+    # Resolve the root relative to the directory where the script is located,
+    # so that the script can be run from any location. Do not chdir there: the
+    # script usually lives inside the served directory, which must stay replaceable.
+    root = Path(__file__).resolve().parent / args.root
 
-    serve(args.root, args.port, args.browser)
+    open_path = "/" + args.open_path.lstrip("/")
+    serve(root, args.port, args.browser, args.single_threaded, args.cache, args.live_reload, args.load_time_log, open_path, args.mounts, args.immutable)
@@ -0,0 +1,99 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# The "shared engine runtime" export layout. Every self-contained bundle holds
+# its own copy of the engine files (index.wasm, index.js, ...), which are the
+# same for all exports with one version of the add-on. In the shared layout,
+# they are written once per engine version next to the bundles
+#
+#   <output dir>/webgo_runtime/<engine version>/index.wasm, index.js, ...
+#   <output dir>/<bundle>/index.html, index.pck
+#
+# and each bundle's index.html loads them from ../webgo_runtime/<version>/:
+# the GODOT_CONFIG executable points there and the pack is named explicitly
+# (mainPack), as it would otherwise be looked up next to the executable. The
+# runtime directory is filled with hard links to the add-on's web template
+# where possible (copies otherwise), so even the single copy takes no disk
+# space on the add-on's file system. Bundles of different engine versions can
+# live side by side, a runtime directory is never removed by an export.
+#
+# The engine version is the content hash of the engine files also used by the
+# service worker of PWA exports (see pwa.py).
+#
+# This module must not import bpy.
+
+import os
+import re
+
+from . import pwa
+from . import bundle_sync
+
+runtime_dir_name = "webgo_runtime"
+
+
+def runtime_version(p_web_dir):
+    return pwa.engine_version(p_web_dir)
+
+
+def runtime_url(version):
+    '''URL of the runtime directory relative to a bundle (with a trailing slash).'''
+    return "../" + runtime_dir_name + "/" + version + "/"
+
+
+def runtime_path(p_bundle_dir, version):
+    return os.path.join(os.path.dirname(os.path.abspath(p_bundle_dir)), runtime_dir_name, version)
+
+
+def bundle_files(p_bundle_dir):
+    '''The engine files (and their compressed siblings) in a bundle directory, e.g. left over from a
+    self-contained export to the same target.'''
+    names = set(pwa.engine_files)
+    try:
+        listing = os.listdir(p_bundle_dir)
+    except OSError:
+        return []
+    return [os.path.join(p_bundle_dir, name) for name in sorted(listing) if name in names or os.path.splitext(name)[0] in names]
+
+
+def install_runtime(p_web_dir, p_runtime_dir, use_precompression, check_cancelled=None):
+    '''Bring the runtime directory up to date with the engine files of the web template p_web_dir.
+    Returns the statistics of bundle_sync.sync_tree.'''
+    exclude = ["*.html", "*.html.*", "*.pck", "*.pck.*"]
+    if not use_precompression:
+        exclude += ["*.gz", "*.br"]
+    # Only files of the same engine version are ever written here: no backups needed
+    return bundle_sync.sync_tree(p_web_dir, p_runtime_dir, exclude=exclude, check_cancelled=check_cancelled)
+
+
+def _reference_pattern(name):
+    return re.compile(r"""((?:src|href)\s*=\s*)(["'])""" + re.escape(name) + r"\2")
+
+
+def rewrite_references(html, url):
+    '''Return index.html contents with the scripts and icons it references taken from the runtime at url.'''
+    for name in pwa.engine_files:
+        html = _reference_pattern(name).sub(lambda m, name=name: m.group(1) + m.group(2) + url + name + m.group(2), html)
+    return html
+
+
+def rewrite_config(config, url, pack_name="index.pck"):
+    '''Return a copy of GODOT_CONFIG loading the engine from the runtime at url and the pack from the bundle.'''
+    config = dict(config)
+    executable = config.get("executable", "index")
+    config["executable"] = url + executable
+    config["mainPack"] = pack_name
+    file_sizes = {}
+    for name, size in config.get("fileSizes", {}).items():
+        file_sizes[name if name == pack_name else url + name] = size
+    config["fileSizes"] = file_sizes
+    return config
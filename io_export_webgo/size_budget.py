@@ -0,0 +1,336 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Size analysis of an export: which Blender objects, meshes, materials, images
+# and animations the bytes of the exported model.glb belong to, and what a
+# browser downloads of the bundle. The export is checked against size budgets
+# set in the add-on preferences.
+#
+# Only the JSON chunk of the glb is read. The sizes of the binary data follow
+# from its buffer views and accessors, so even multi-gigabyte files are
+# analyzed without reading their binary chunk.
+#
+# Objects, materials and animations may share data (a mesh used by several
+# objects, an image used by several materials). Their sizes count shared data
+# in full. The "exclusive" size of an object only counts data no other object
+# uses, so exclusive sizes add up to at most the size of the binary chunk.
+#
+# This module must not import bpy.
+
+import os
+import json
+import struct
+import fnmatch
+
+from . import mesh_optimize
+from . import compression
+
+# Files of a bundle the viewer does not download
+not_downloaded = ["serve_*.py", "export_report.json", "*.webgo-backup", "*.webgo-tmp*", "*.gz", "*.br"]
+
+# Budget names (keys of the budgets passed to check_budgets) and their labels in messages
+budget_labels = {
+    "download": "download",
+    "model": "model",
+    "textures": "texture",
+    "object": "per-object",
+}
+
+
+def read_glb_json(p_glb):
+    '''Return (glTF JSON, length of the binary chunk) of a .glb file. The binary chunk is skipped, not read.'''
+    with open(p_glb, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12:
+            raise ValueError("'" + p_glb + "' is not a glTF 2.0 binary file")
+        magic, version, length = struct.unpack("<III", header)
+        if magic != mesh_optimize.glb_magic or version != 2:
+            raise ValueError("'" + p_glb + "' is not a glTF 2.0 binary file")
+        gltf = None
+        bin_length = 0
+        offset = 12
+        while offset + 8 <= length:
+            f.seek(offset)
+            chunk_length, chunk_type = struct.unpack("<II", f.read(8))
+            if chunk_type == mesh_optimize.chunk_json and gltf is None:
+                gltf = json.loads(f.read(chunk_length).decode("utf-8"))
+            elif chunk_type == mesh_optimize.chunk_bin and not bin_length:
+                bin_length = chunk_length
+            offset += 8 + chunk_length
+    if gltf is None:
+        raise ValueError("'" + p_glb + "' has no JSON chunk")
+    return gltf, bin_length
+
+
+def accessor_size(gltf, index):
+    '''Bytes of the binary data of an accessor, including the stride of interleaved buffer views and sparse data.'''
+    accessor = gltf["accessors"][index]
+    size = 0
+    if "bufferView" in accessor:
+        size = mesh_optimize.accessor_bytes(accessor)
+        stride = gltf["bufferViews"][accessor["bufferView"]].get("byteStride")
+        if stride:
+            size = max(size, stride * accessor["count"])
+    sparse = accessor.get("sparse")
+    if sparse:
+        index_size = mesh_optimize.component_sizes[sparse["indices"]["componentType"]]
+        value_size = mesh_optimize.accessor_bytes(dict(accessor, count=1))
+        size += sparse["count"] * (index_size + value_size)
+    return size
+
+
+def image_size(gltf, index, p_base_dir):
+    '''Bytes of an image: its buffer view, data URI or external file.'''
+    image = gltf["images"][index]
+    if "bufferView" in image:
+        return gltf["bufferViews"][image["bufferView"]]["byteLength"]
+    uri = image.get("uri", "")
+    if uri.startswith("data:"):
+        # base64 encoded
+        return len(uri.partition(",")[2]) * 3 // 4
+    try:
+        return os.path.getsize(os.path.join(p_base_dir, uri))
+    except OSError:
+        return 0
+
+
+def texture_images(texture):
+    '''Indices of the images of a texture (its source and sources of image format extensions).'''
+    images = []
+    if "source" in texture:
+        images.append(texture["source"])
+    for extension in texture.get("extensions", {}).values():
+        if isinstance(extension, dict) and "source" in extension:
+            images.append(extension["source"])
+    return images
+
+
+def material_textures(value):
+    '''Indices of all textures referenced by a material (texture infos in any property or extension).'''
+    textures = []
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if isinstance(item, dict) and key.endswith("Texture") and "index" in item:
+                textures.append(item["index"])
+            textures += material_textures(item)
+    elif isinstance(value, list):
+        for item in value:
+            textures += material_textures(item)
+    return textures
+
+
+def _name(item, kind, index):
+    return item.get("name") or kind + "_" + str(index)
+
+
+def analyze_glb(p_glb):
+    '''Attribute the bytes of a .glb file to its objects (nodes), meshes, materials, images and animations.'''
+    gltf, bin_length = read_glb_json(p_glb)
+    p_base_dir = os.path.dirname(p_glb)
+    images = gltf.get("images", [])
+    textures = gltf.get("textures", [])
+    materials = gltf.get("materials", [])
+    meshes = gltf.get("meshes", [])
+    nodes = gltf.get("nodes", [])
+    animations = gltf.get("animations", [])
+
+    image_bytes = [image_size(gltf, i, p_base_dir) for i in range(len(images))]
+    material_images = []
+    for material in materials:
+        used = set()
+        for texture in material_textures(material):
+            used.update(texture_images(textures[texture]))
+        material_images.append(used)
+
+    # Resources ("accessor", index) or ("image", index) of each mesh and animated node
+    mesh_accessors = []
+    mesh_images = []
+    for mesh in meshes:
+        accessors = set()
+        used_images = set()
+        for primitive in mesh.get("primitives", []):
+            accessors.update(mesh_optimize.primitive_accessors(primitive))
+            if "material" in primitive:
+                used_images |= material_images[primitive["material"]]
+        mesh_accessors.append(accessors)
+        mesh_images.append(used_images)
+    node_animation_accessors = {}
+    animation_accessors = []
+    for animation in animations:
+        accessors = set()
+        samplers = animation.get("samplers", [])
+        for channel in animation.get("channels", []):
+            sampler = samplers[channel["sampler"]]
+            used = {sampler["input"], sampler["output"]}
+            accessors |= used
+            node = channel.get("target", {}).get("node")
+            if node is not None:
+                node_animation_accessors.setdefault(node, set()).update(used)
+        animation_accessors.append(accessors)
+
+    object_resources = []
+    for index, node in enumerate(nodes):
+        resources = {"mesh": set(), "skin": set(), "animation": set(), "textures": set()}
+        if "mesh" in node:
+            resources["mesh"] = {("accessor", i) for i in mesh_accessors[node["mesh"]]}
+            resources["textures"] = {("image", i) for i in mesh_images[node["mesh"]]}
+        instancing = node.get("extensions", {}).get("EXT_mesh_gpu_instancing")
+        if instancing:
+            # instance transforms (see instancing.py)
+            resources["mesh"] |= {("accessor", i) for i in instancing.get("attributes", {}).values()}
+        if "skin" in node:
+            skin = gltf["skins"][node["skin"]]
+            if "inverseBindMatrices" in skin:
+                resources["skin"] = {("accessor", skin["inverseBindMatrices"])}
+        resources["animation"] = {("accessor", i) for i in node_animation_accessors.get(index, ())}
+        object_resources.append(resources)
+
+    def resource_size(resource):
+        kind, index = resource
+        return accessor_size(gltf, index) if kind == "accessor" else image_bytes[index]
+
+    users = {}
+    for resources in object_resources:
+        for resource in set().union(*resources.values()):
+            users[resource] = users.get(resource, 0) + 1
+
+    objects = []
+    for index, resources in enumerate(object_resources):
+        all_resources = set().union(*resources.values())
+        if not all_resources:
+            # empties, cameras and lights
+            continue
+        entry = {"name": _name(nodes[index], "node", index)}
+        for category, category_resources in resources.items():
+            entry[category + "_bytes"] = sum(resource_size(resource) for resource in category_resources)
+        entry["bytes"] = sum(resource_size(resource) for resource in all_resources)
+        entry["exclusive_bytes"] = sum(resource_size(resource) for resource in all_resources if users[resource] == 1)
+        objects.append(entry)
+
+    mesh_users = {}
+    for node in nodes:
+        if "mesh" in node:
+            mesh_users[node["mesh"]] = mesh_users.get(node["mesh"], 0) + 1
+    image_users = {}
+    for used in material_images:
+        for i in used:
+            image_users[i] = image_users.get(i, 0) + 1
+
+    def by_size(entries):
+        return sorted(entries, key=lambda entry: entry["bytes"], reverse=True)
+
+    return {
+        "glb_bytes": os.path.getsize(p_glb),
+        "bin_bytes": bin_length,
+        "texture_bytes": sum(image_bytes),
+        "objects": by_size(objects),
+        "meshes": by_size({
+            "name": _name(mesh, "mesh", i),
+            "bytes": sum(accessor_size(gltf, a) for a in mesh_accessors[i]),
+            "users": mesh_users.get(i, 0),
+        } for i, mesh in enumerate(meshes)),
+        "materials": by_size({
+            "name": _name(material, "material", i),
+            "bytes": sum(image_bytes[image] for image in material_images[i]),
+        } for i, material in enumerate(materials)),
+        "images": by_size({
+            "name": _name(image, "image", i),
+            "bytes": image_bytes[i],
+            "mime": image.get("mimeType"),
+            "users": image_users.get(i, 0),
+        } for i, image in enumerate(images)),
+        "animations": by_size({
+            "name": _name(animation, "animation", i),
+            "bytes": sum(accessor_size(gltf, a) for a in animation_accessors[i]),
+        } for i, animation in enumerate(animations)),
+    }
+
+
+def analyze_bundle(p_bundle_dir):
+    '''Sizes of the files of a bundle the viewer downloads. The download size of a file is the size
+    of its smallest precompressed variant (see compression.py), if any.'''
+    files = []
+    for dirpath, dirnames, filenames in os.walk(p_bundle_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if any(fnmatch.fnmatch(filename, pattern) for pattern in not_downloaded):
+                continue
+            p_file = os.path.join(dirpath, filename)
+            size = os.path.getsize(p_file)
+            download = size
+            for encoding in compression.available_encodings():
+                p_compressed = p_file + compression.encoding_extension(encoding)
+                if compression.is_up_to_date(p_file, p_compressed):
+                    download = min(download, os.path.getsize(p_compressed))
+            files.append({"name": os.path.relpath(p_file, p_bundle_dir).replace(os.sep, "/"), "bytes": size, "download_bytes": download})
+    files.sort(key=lambda entry: entry["download_bytes"], reverse=True)
+    return {
+        "bytes": sum(entry["bytes"] for entry in files),
+        "download_bytes": sum(entry["download_bytes"] for entry in files),
+        "files": files,
+    }
+
+
+def check_budgets(model, bundle, budgets):
+    '''Return a message for each exceeded budget. budgets maps the keys of budget_labels to bytes (0: no limit).
+    model (analyze_glb) may be None if the model was not analyzed.'''
+    measured = {"download": [("Download of the web export", bundle["download_bytes"])]}
+    if model:
+        measured["model"] = [("glTF model", model["glb_bytes"])]
+        measured["textures"] = [("Textures", model["texture_bytes"])]
+        measured["object"] = [("Object '" + entry["name"] + "'", entry["bytes"]) for entry in model["objects"]]
+    messages = []
+    for key, limit in budgets.items():
+        if not limit:
+            continue
+        for name, size in measured.get(key, []):
+            if size > limit:
+                messages.append(name + ": " + format_bytes(size) + " exceeds the " + budget_labels[key] + " budget of " + format_bytes(limit))
+    return messages
+
+
+def format_bytes(size):
+    for unit in ("bytes", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return (str(size) if unit == "bytes" else format(size, ".1f")) + " " + unit
+        size /= 1024.0
+
+
+def format_table(title, entries, columns, max_rows=10):
+    '''Human readable table of the largest entries. columns: (heading, key) pairs of byte counts.'''
+    lines = [title + " (" + str(len(entries)) + ")"]
+    if not entries:
+        return lines[0]
+    width = max(len(entry["name"]) for entry in entries[:max_rows])
+    width = min(max(width, 4), 48)
+    lines.append("  " + "Name".ljust(width) + "".join(heading.rjust(12) for heading, key in columns))
+    for entry in entries[:max_rows]:
+        lines.append("  " + entry["name"][:width].ljust(width) + "".join(format_bytes(entry.get(key, 0)).rjust(12) for heading, key in columns))
+    if len(entries) > max_rows:
+        lines.append("  ... " + str(len(entries) - max_rows) + " more")
+    return "\n".join(lines)
+
+
+def format_analysis(model, bundle, max_rows=10):
+    '''Sorted tables of the largest objects, meshes, materials, images, animations and bundle files.'''
+    tables = []
+    if model:
+        tables += [
+            format_table("Objects", model["objects"], [("Total", "bytes"), ("Exclusive", "exclusive_bytes"), ("Mesh", "mesh_bytes"), ("Textures", "textures_bytes"), ("Animation", "animation_bytes")], max_rows),
+            format_table("Meshes", model["meshes"], [("Size", "bytes")], max_rows),
+            format_table("Materials", model["materials"], [("Textures", "bytes")], max_rows),
+            format_table("Images", model["images"], [("Size", "bytes")], max_rows),
+            format_table("Animations", model["animations"], [("Size", "bytes")], max_rows),
+        ]
+    tables.append(format_table("Bundle files", bundle["files"], [("Size", "bytes"), ("Download", "download_bytes")], max_rows))
+    return "\n".join(tables)
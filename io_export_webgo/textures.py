@@ -0,0 +1,340 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Texture optimization of the exported model.glb. The images embedded in the
+# glb are
+#   - scaled down to the maximum resolution of the chosen profile,
+#   - re-encoded as JPEG (opaque images) or PNG (images with alpha), unless
+#     the result would be larger than the original,
+#   - deduplicated: textures referring to byte-identical or pixel-identical
+#     images are redirected to a single image, the others are dropped.
+# Godot imports textures at the resolution found in the glb, so capping it
+# shrinks the pack quadratically.
+#
+# Images are processed in parallel by a thread pool. Results are cached on
+# disk by the hash of the source image and the profile, so re-exports do not
+# re-encode unchanged images.
+#
+# Decoding and encoding uses Pillow if it is installed into Blender's Python
+# (it releases the GIL, so images are processed truly in parallel) and
+# Blender's imbuf module otherwise. Without either (outside of Blender), only
+# byte-identical images are deduplicated.
+#
+# This module must not import bpy.
+
+import io
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from . import mesh_optimize
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import imbuf
+except ImportError:
+    imbuf = None
+
+# id: (label, maximum width/height or 0 for no limit, JPEG quality or 0 to keep the encoding)
+profiles = {
+    "NONE": ("Original", 0, 0),
+    "HIGH": ("High (2048 px)", 2048, 90),
+    "MEDIUM": ("Medium (1024 px)", 1024, 85),
+    "LOW": ("Low (512 px)", 512, 75),
+}
+
+# Bump to invalidate cached results when the processing changes
+processing_version = 1
+
+# Least recently used cached textures are removed beyond this size
+max_cache_bytes = 1024 * 1024 * 1024
+
+mime_extensions = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp"}
+
+
+def backend():
+    '''Name of the image library used to decode and encode images, None if there is none.'''
+    if Image:
+        return "pillow"
+    if imbuf:
+        return "imbuf"
+    return None
+
+
+def _encode_pillow(data, max_size, quality):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    pixel_hasher = hashlib.sha256((image.mode + str(image.size)).encode("utf-8"))
+    pixel_hasher.update(image.tobytes())
+    resized = bool(max_size) and max(image.size) > max_size
+    if resized:
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    if has_alpha:
+        alpha = image.convert("RGBA").getchannel("A")
+        has_alpha = alpha.getextrema()[0] < 255
+    out = io.BytesIO()
+    if has_alpha:
+        image.save(out, "PNG", optimize=True)
+        mime = "image/png"
+    else:
+        image.convert("RGB").save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+        mime = "image/jpeg"
+    return out.getvalue(), mime, image.size, pixel_hasher.hexdigest(), resized
+
+
+def _encode_imbuf(data, mime, max_size, quality):
+    p_tmp_dir = tempfile.mkdtemp(prefix="webgo-texture-")
+    try:
+        p_src = os.path.join(p_tmp_dir, "src" + mime_extensions.get(mime, ".png"))
+        with open(p_src, "wb") as f:
+            f.write(data)
+        image = imbuf.load(p_src)
+        try:
+            # imbuf has no pixel access: hash the pixels as written by its (deterministic) PNG encoder
+            p_pixels = os.path.join(p_tmp_dir, "pixels.png")
+            image.file_type = 'PNG'
+            imbuf.write(image, filepath=p_pixels)
+            pixel_key = hashlib.sha256(str(tuple(image.size)).encode("utf-8") + open(p_pixels, "rb").read()).hexdigest()
+            width, height = image.size
+            resized = bool(max_size) and max(width, height) > max_size
+            if resized:
+                scale = max_size / max(width, height)
+                image.resize((max(1, round(width * scale)), max(1, round(height * scale))), method='BILINEAR')
+            # 32 planes: the image has an alpha channel
+            if image.planes == 32:
+                image.file_type = 'PNG'
+                mime = "image/png"
+            else:
+                image.file_type = 'JPEG'
+                mime = "image/jpeg"
+            p_out = os.path.join(p_tmp_dir, "out" + mime_extensions[mime])
+            imbuf.write(image, filepath=p_out)
+            size = tuple(image.size)
+        finally:
+            image.free()
+        with open(p_out, "rb") as f:
+            return f.read(), mime, size, pixel_key, resized
+    finally:
+        shutil.rmtree(p_tmp_dir, ignore_errors=True)
+
+
+def process_image(data, mime, profile):
+    '''Scale and re-encode a single image according to the profile. Returns {"data", "mime", "width", "height", "pixel_key"}.
+    pixel_key identifies the decoded pixels of the source (None if they were not decoded).'''
+    label, max_size, quality = profiles[profile]
+    result = {"data": data, "mime": mime, "width": None, "height": None, "pixel_key": None}
+    if not backend() or mime not in mime_extensions:
+        return result
+    if Image:
+        out, out_mime, size, pixel_key, resized = _encode_pillow(data, max_size, quality or 95)
+    else:
+        out, out_mime, size, pixel_key, resized = _encode_imbuf(data, mime, max_size, quality or 95)
+    result["pixel_key"] = pixel_key
+    result["width"], result["height"] = size
+    # Keep the original encoding unless the image was scaled down or re-encoding makes it smaller
+    if quality and (resized or len(out) < len(data)):
+        result["data"] = out
+        result["mime"] = out_mime
+    return result
+
+
+class TextureCache:
+    """Processed images on disk, keyed by the hash of the source image and the processing settings."""
+
+    def __init__(self, p_cache_dir):
+        self.p_cache_dir = p_cache_dir
+
+    def key(self, data, profile):
+        hasher = hashlib.sha256()
+        hasher.update((profile + ":" + str(profiles[profile]) + ":" + str(processing_version) + ":" + str(backend()) + "\0").encode("utf-8"))
+        hasher.update(data)
+        return hasher.hexdigest()
+
+    def lookup(self, key):
+        p_meta = os.path.join(self.p_cache_dir, key + ".json")
+        try:
+            with open(p_meta, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(os.path.join(self.p_cache_dir, key + ".bin"), "rb") as f:
+                meta["data"] = f.read()
+        except (OSError, ValueError):
+            return None
+        # Touch the entry so pruning removes least recently used textures first
+        os.utime(p_meta)
+        return meta
+
+    def store(self, key, result):
+        os.makedirs(self.p_cache_dir, exist_ok=True)
+        suffix = "." + str(os.getpid()) + ".tmp"
+        p_bin = os.path.join(self.p_cache_dir, key + ".bin")
+        with open(p_bin + suffix, "wb") as f:
+            f.write(result["data"])
+        os.replace(p_bin + suffix, p_bin)
+        p_meta = os.path.join(self.p_cache_dir, key + ".json")
+        with open(p_meta + suffix, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in result.items() if k != "data"}, f)
+        os.replace(p_meta + suffix, p_meta)
+
+    def prune(self, max_bytes=max_cache_bytes):
+        if not os.path.isdir(self.p_cache_dir):
+            return
+        entries = []
+        for name in os.listdir(self.p_cache_dir):
+            if name.endswith(".json"):
+                key = name[:-len(".json")]
+                try:
+                    entries.append((os.path.getmtime(os.path.join(self.p_cache_dir, name)), key, os.path.getsize(os.path.join(self.p_cache_dir, key + ".bin"))))
+                except OSError:
+                    continue
+        entries.sort(reverse=True)
+        total = 0
+        for mtime, key, size in entries:
+            total += size
+            if total > max_bytes:
+                for extension in (".json", ".bin"):
+                    try:
+                        os.remove(os.path.join(self.p_cache_dir, key + extension))
+                    except OSError:
+                        pass
+
+
+def _image_data(gltf, bin_chunk, image):
+    if "bufferView" not in image:
+        # external file
+        return None
+    view = gltf["bufferViews"][image["bufferView"]]
+    if view.get("buffer", 0) != 0:
+        return None
+    offset = view.get("byteOffset", 0)
+    return bytes(bin_chunk[offset:offset + view["byteLength"]])
+
+
+def _texture_sources(texture):
+    '''(dict, key) pairs referring to images: the texture's source and sources in image format extensions.'''
+    refs = []
+    if "source" in texture:
+        refs.append((texture, "source"))
+    for extension in texture.get("extensions", {}).values():
+        if isinstance(extension, dict) and "source" in extension:
+            refs.append((extension, "source"))
+    return refs
+
+
+def optimize_glb(p_glb, profile, cache=None, max_workers=None, check_cancelled=None):
+    '''Process, deduplicate and rewrite the images embedded in a .glb file. Returns a list with one entry per
+    source image: name, bytes and size before and after, whether it came from the cache and which image it duplicates.'''
+    gltf, bin_chunk = mesh_optimize.read_glb(p_glb)
+    images = gltf.get("images", [])
+    if not images:
+        return []
+    sources = [_image_data(gltf, bin_chunk, image) for image in images]
+
+    def process(index):
+        data = sources[index]
+        if data is None:
+            return None
+        if check_cancelled:
+            check_cancelled()
+        key = cache.key(data, profile) if cache else None
+        result = cache.lookup(key) if cache else None
+        if result is not None:
+            result["cached"] = True
+            return result
+        try:
+            result = process_image(data, images[index].get("mimeType"), profile)
+        except Exception:
+            traceback.print_exc()
+            print("Cannot process texture '" + images[index].get("name", str(index)) + "'. Keeping it as it is.")
+            return {"data": data, "mime": images[index].get("mimeType"), "width": None, "height": None, "pixel_key": None, "cached": False}
+        if cache:
+            try:
+                cache.store(key, result)
+            except Exception:
+                traceback.print_exc()
+        result["cached"] = False
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(process, range(len(images))))
+    if check_cancelled:
+        check_cancelled()
+
+    # Deduplicate by the processed bytes and by the source pixels
+    canonical = {}
+    by_bytes = {}
+    by_pixels = {}
+    for index, result in enumerate(results):
+        if result is None:
+            continue
+        byte_key = hashlib.sha256(result["data"]).hexdigest()
+        first = by_bytes.get(byte_key)
+        if first is None and result["pixel_key"]:
+            first = by_pixels.get(result["pixel_key"])
+        if first is None:
+            by_bytes[byte_key] = index
+            if result["pixel_key"]:
+                by_pixels[result["pixel_key"]] = index
+            first = index
+        canonical[index] = first
+
+    # Redirect textures to the canonical images and drop the duplicates
+    for texture in gltf.get("textures", []):
+        for ref, key in _texture_sources(texture):
+            ref[key] = canonical.get(ref[key], ref[key])
+    removed = [index for index, first in canonical.items() if first != index]
+    replaced = {}
+    for index, first in canonical.items():
+        if first == index:
+            replaced[images[index]["bufferView"]] = results[index]["data"]
+            images[index]["mimeType"] = results[index]["mime"]
+    removed_views = {images[index]["bufferView"] for index in removed}
+    old_to_new = {}
+    new_images = []
+    for index, image in enumerate(images):
+        if index not in removed:
+            old_to_new[index] = len(new_images)
+            new_images.append(image)
+    gltf["images"] = new_images
+    for texture in gltf.get("textures", []):
+        for ref, key in _texture_sources(texture):
+            ref[key] = old_to_new[ref[key]]
+    new_bin = mesh_optimize.repack_bin(gltf, bin_chunk, replaced, removed_views)
+    mesh_optimize.write_glb(p_glb, gltf, new_bin)
+
+    report = []
+    for index, result in enumerate(results):
+        if result is None:
+            continue
+        entry = {
+            "name": images[index].get("name", "image_" + str(index)),
+            "source_bytes": len(sources[index]),
+            "bytes": len(result["data"]),
+            "width": result["width"],
+            "height": result["height"],
+            "mime": result["mime"],
+            "cached": result["cached"],
+        }
+        if canonical[index] != index:
+            entry["duplicate_of"] = images[canonical[index]].get("name", "image_" + str(canonical[index]))
+            entry["bytes"] = 0
+        report.append(entry)
+    return report
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Downloading, installing and probing the Godot app used for exports.
+#
+# Godot release archives are downloaded in chunks (with progress) into an
+# artifact cache directory laid out like the release downloads on GitHub:
+#
+#   <cache>/<version>/Godot_v<version>_<platform>.zip
+#   <cache>/<version>/SHA512-SUMS.txt
+#
+# An interrupted download is kept as a .part file and resumed with an HTTP
+# Range request. Each archive is verified against the SHA-512 checksums
+# published with the release, on download and when it is taken from the
+# cache. Mirrors with the same layout are tried before GitHub, so a cache
+# directory served by "toolchain.py serve" (or any web server) can stand in
+# for GitHub on a network or a CI runner. The cache may also be a shared
+# network directory.
+#
+# "godot --version" takes a while (Godot starts up), so its output is cached
+# by executable path, size and modification time, in memory and in a JSON
+# file: Godot only runs again when the app is replaced.
+#
+# Used by the add-on (see DownloadGodotOperator in __init__.py). Can also be
+# run from the command line, e.g. on a build machine or in CI:
+#
+#   python3 toolchain.py fetch --cache <dir> [--platform Linux Windows Darwin]
+#   python3 toolchain.py serve --cache <dir> [--port 8071]
+#   python3 toolchain.py install --dest <dir> [--cache <dir>] [--mirror http://<host>:8071/]
+#
+# This module must not import bpy.
+
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler  # type: ignore
+import os
+import re
+import sys
+import json
+import stat
+import shutil
+import hashlib
+import zipfile
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+import urllib.error
+import urllib.request
+
+github_url = "https://github.com/godotengine/godot-builds/releases/download/"
+checksums_file_name = "SHA512-SUMS.txt"
+default_version = "4.2.1-stable"
+
+# platform.system() -> (platform part of the archive name, app path inside the archive)
+platforms = {
+    "Windows": ("win64.exe", "Godot_v{version}_win64.exe"),
+    "Linux": ("linux.x86_64", "Godot_v{version}_linux.x86_64"),
+    "Darwin": ("macos.universal", "Godot.app/Contents/MacOS/Godot"),
+}
+
+chunk_size = 1024 * 1024
+part_suffix = ".part"
+# seconds without data before a download attempt fails
+timeout = 30
+# per source, each resuming the previous one
+download_attempts = 3
+user_agent = "io_export_webgo"
+# seconds for godot --version
+probe_timeout = 60
+
+
+class ToolchainError(Exception):
+    pass
+
+
+class DownloadCancelled(ToolchainError):
+    pass
+
+
+def archive_name(version, system):
+    return "Godot_v" + version + "_" + platforms[system][0] + ".zip"
+
+
+def app_path(version, system):
+    '''Path of the Godot app inside the unpacked archive.'''
+    return platforms[system][1].format(version=version)
+
+
+def artifact_url(base_url, version, file_name):
+    return base_url.rstrip("/") + "/" + version + "/" + file_name
+
+
+def parse_checksums(text):
+    '''{file name: SHA-512 hex digest} of a SHA512-SUMS.txt ("<digest>  <file name>" per line).'''
+    checksums = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and len(parts[0]) == 128:
+            checksums[parts[1].lstrip("*")] = parts[0].lower()
+    return checksums
+
+
+def file_sha512(path, cancel=None):
+    hasher = hashlib.sha512()
+    with open(path, "rb") as f:
+        while True:
+            if cancel and cancel.is_set():
+                raise DownloadCancelled("Cancelled")
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _open(url, headers=None):
+    request = urllib.request.Request(url, headers=dict(headers or {}, **{"User-Agent": user_agent}))
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+def fetch_text(url):
+    with _open(url) as response:
+        return response.read().decode("utf-8")
+
+
+def download(url, p_file, sha512=None, progress=None, cancel=None):
+    '''Download url to p_file in chunks, resuming a partial download left by an earlier attempt
+    (p_file + ".part") with a Range request. progress(done, total) is called after each chunk, total
+    is None if the server does not tell. With sha512, the download is verified before it is moved to
+    p_file (and removed if it does not match). cancel is a threading.Event.'''
+    p_part = p_file + part_suffix
+    offset = os.path.getsize(p_part) if os.path.isfile(p_part) else 0
+    try:
+        try:
+            response = _open(url, {"Range": "bytes=" + str(offset) + "-"} if offset else None)
+        except urllib.error.HTTPError as e:
+            if e.code != 416 or not offset:
+                raise
+            # Range Not Satisfiable: the part is complete already
+            response = None
+        if response:
+            with response:
+                if offset and response.status != 206:
+                    # the server ignores Range requests: start over
+                    offset = 0
+                length = response.headers.get("Content-Length")
+                total = offset + int(length) if length else None
+                done = offset
+                with open(p_part, "ab" if offset else "wb") as f:
+                    while True:
+                        if cancel and cancel.is_set():
+                            raise DownloadCancelled("Cancelled")
+                        chunk = response.read(chunk_size)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        done += len(chunk)
+                        if progress:
+                            progress(done, total)
+            if total is not None and done < total:
+                raise ToolchainError("Connection closed after " + str(done) + " of " + str(total) + " bytes")
+    except (OSError, http.client.HTTPException) as e:
+        # Keep the part for the next attempt
+        raise ToolchainError(str(e)) from e
+    if sha512:
+        digest = file_sha512(p_part, cancel)
+        if digest != sha512:
+            os.remove(p_part)
+            raise ToolchainError("SHA-512 checksum mismatch (expected " + sha512 + ", got " + digest + ")")
+    os.replace(p_part, p_file)
+
+
+def cached_artifact(p_cache_dir, version, file_name, cancel=None):
+    '''Path of the file in the artifact cache if it is there and matches its checksum, else None.'''
+    p_file = os.path.join(p_cache_dir, version, file_name)
+    p_checksums = os.path.join(p_cache_dir, version, checksums_file_name)
+    if not os.path.isfile(p_file) or not os.path.isfile(p_checksums):
+        return None
+    with open(p_checksums, "r", encoding="utf-8") as f:
+        sha512 = parse_checksums(f.read()).get(file_name)
+    if sha512 and file_sha512(p_file, cancel) == sha512:
+        return p_file
+    print("Cached '" + p_file + "' does not match its checksum, downloading it again")
+    os.remove(p_file)
+    return None
+
+
+def fetch_artifact(version, file_name, p_cache_dir, mirrors=(), progress=None, cancel=None):
+    '''Return the path of a release file of Godot version in the artifact cache. If it is not cached
+    yet, download it from the first of the mirrors (base URLs laid out like github_url, tried in this
+    order) and GitHub that has it, verified against the release's SHA-512 checksums.'''
+    p_cached = cached_artifact(p_cache_dir, version, file_name, cancel)
+    if p_cached:
+        print("Using '" + p_cached + "' from the artifact cache")
+        return p_cached
+    p_dir = os.path.join(p_cache_dir, version)
+    os.makedirs(p_dir, exist_ok=True)
+    p_file = os.path.join(p_dir, file_name)
+    errors = []
+    for base_url in list(mirrors) + [github_url]:
+        url = artifact_url(base_url, version, file_name)
+        try:
+            checksums_text = fetch_text(artifact_url(base_url, version, checksums_file_name))
+            sha512 = parse_checksums(checksums_text).get(file_name)
+            if not sha512:
+                raise ToolchainError("No checksum for '" + file_name + "' in " + checksums_file_name)
+            print("Downloading '" + url + "' to '" + p_file + "'")
+            for attempt in range(download_attempts):
+                try:
+                    download(url, p_file, sha512, progress, cancel)
+                    break
+                except DownloadCancelled:
+                    raise
+                except ToolchainError as e:
+                    if attempt == download_attempts - 1:
+                        raise
+                    print("Download of '" + url + "' failed (" + str(e) + "), retrying")
+            p_checksums = os.path.join(p_dir, checksums_file_name)
+            with open(p_checksums + part_suffix, "w", encoding="utf-8") as f:
+                f.write(checksums_text)
+            os.replace(p_checksums + part_suffix, p_checksums)
+            return p_file
+        except DownloadCancelled:
+            raise
+        except (ToolchainError, OSError, http.client.HTTPException) as e:
+            print("Cannot download '" + url + "': " + str(e))
+            errors.append(url + ": " + str(e))
+    raise ToolchainError("Cannot download Godot " + version + ":\n" + "\n".join(errors))
+
+
+def install(p_archive, p_dest_dir, app_rel_path, cancel=None):
+    '''Unpack a Godot release archive into p_dest_dir (replacing files of the same names) and make
+    the app executable. Returns the path of the app.'''
+    os.makedirs(p_dest_dir, exist_ok=True)
+    p_tmp_dir = os.path.join(p_dest_dir, ".unpack" + part_suffix)
+    shutil.rmtree(p_tmp_dir, ignore_errors=True)
+    try:
+        with zipfile.ZipFile(p_archive) as archive:
+            for info in archive.infolist():
+                if cancel and cancel.is_set():
+                    raise DownloadCancelled("Cancelled")
+                p_member = archive.extract(info, p_tmp_dir)
+                mode = info.external_attr >> 16
+                if mode and not info.is_dir():
+                    os.chmod(p_member, stat.S_IMODE(mode))
+        # Move the unpacked entries into place at once, so a cancelled or failed install leaves the previous one
+        for name in os.listdir(p_tmp_dir):
+            p_dst = os.path.join(p_dest_dir, name)
+            if os.path.isdir(p_dst) and not os.path.islink(p_dst):
+                shutil.rmtree(p_dst)
+            os.replace(os.path.join(p_tmp_dir, name), p_dst)
+    finally:
+        shutil.rmtree(p_tmp_dir, ignore_errors=True)
+    p_app = os.path.join(p_dest_dir, app_rel_path)
+    st = os.stat(p_app)
+    os.chmod(p_app, st.st_mode | stat.S_IXGRP | stat.S_IXUSR | stat.S_IXOTH)
+    return p_app
+
+
+# Outputs of godot --version by absolute path: {"size", "mtime_ns", "version"}
+_probes = {}
+_probes_loaded_from = None
+_probes_lock = threading.Lock()
+
+
+def _load_probes(p_cache_file):
+    global _probes_loaded_from
+    if _probes_loaded_from == p_cache_file or not p_cache_file:
+        return
+    _probes_loaded_from = p_cache_file
+    try:
+        with open(p_cache_file, "r", encoding="utf-8") as f:
+            _probes.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+
+
+def probe_version(p_app, p_cache_file=None):
+    '''Return the output of p_app --version, e.g. "4.2.1.stable.official.b09f793f5", None if there is no
+    such app or it fails. Cached by path, size and modification time of the app, in memory and in
+    p_cache_file (a JSON file), so Godot only runs again when the app changed.'''
+    p_app = os.path.abspath(p_app)
+    try:
+        st = os.stat(p_app)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    with _probes_lock:
+        _load_probes(p_cache_file)
+        probe = _probes.get(p_app)
+    if probe and probe["size"] == st.st_size and probe["mtime_ns"] == st.st_mtime_ns:
+        return probe["version"]
+    try:
+        result = subprocess.run([p_app, "--version"], capture_output=True, text=True, timeout=probe_timeout)
+    except Exception as e:
+        print("Cannot run '" + p_app + " --version': " + str(e))
+        return None
+    version = result.stdout.strip()
+    if result.returncode != 0 or not version:
+        # not cached: may be a passing problem
+        return version or None
+    with _probes_lock:
+        _probes[p_app] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "version": version}
+        if p_cache_file:
+            try:
+                with open(p_cache_file + part_suffix, "w", encoding="utf-8") as f:
+                    json.dump(_probes, f, indent=2)
+                os.replace(p_cache_file + part_suffix, p_cache_file)
+            except OSError as e:
+                print("Cannot write '" + p_cache_file + "': " + str(e))
+    return version
+
+
+class MirrorRequestHandler(SimpleHTTPRequestHandler):
+    '''Serves an artifact cache as a download mirror, answering Range requests (download resume).'''
+
+    range_length = None
+
+    def end_headers(self):
+        self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def send_head(self):
+        self.range_length = None
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", "").strip())
+        path = self.translate_path(self.path)
+        if not match or not os.path.isfile(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        if start >= size or end < start:
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */" + str(size))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        f = open(path, "rb")
+        f.seek(start)
+        self.range_length = end - start + 1
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", "bytes " + str(start) + "-" + str(end) + "/" + str(size))
+        self.send_header("Content-Length", str(self.range_length))
+        self.end_headers()
+        return f
+
+    def copyfile(self, source, outputfile):
+        if self.range_length is None:
+            return super().copyfile(source, outputfile)
+        remaining = self.range_length
+        while remaining > 0:
+            chunk = source.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+
+def print_progress(done, total):
+    text = "\r  " + format(done / 1048576, ".1f") + " MB"
+    if total:
+        text += " of " + format(total / 1048576, ".1f") + " MB (" + str(100 * done // total) + " %)"
+    if total and done >= total:
+        text += "\n"
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download, cache and install the Godot app used by the add-on.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fetch_parser = commands.add_parser("fetch", help="download Godot release archives into an artifact cache")
+    fetch_parser.add_argument("--platform", nargs="+", choices=sorted(platforms), default=[platform.system()], help="platforms to download for (default: this one)")
+    serve_parser = commands.add_parser("serve", help="serve an artifact cache as a download mirror")
+    serve_parser.add_argument("--port", type=int, default=8071)
+    serve_parser.add_argument("--bind", default="", help="address to listen on (default: all)")
+    install_parser = commands.add_parser("install", help="download (or take from the cache) and unpack Godot for this platform, print the path of the app")
+    install_parser.add_argument("--dest", required=True, help="directory to unpack Godot to")
+    for command_parser in (fetch_parser, serve_parser, install_parser):
+        command_parser.add_argument("--cache", required=command_parser is not install_parser, help="artifact cache directory")
+        command_parser.add_argument("--version", default=default_version, help="Godot version (default: " + default_version + ")")
+    for command_parser in (fetch_parser, install_parser):
+        command_parser.add_argument("--mirror", action="append", default=[], help="base URL of a mirror to try before GitHub (repeatable)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        p_cache_dir = os.path.abspath(args.cache)
+        handler = lambda *a, **kw: MirrorRequestHandler(*a, directory=p_cache_dir, **kw)
+        httpd = ThreadingHTTPServer((args.bind, args.port), handler)
+        print("Serving artifact cache '" + p_cache_dir + "' as a download mirror on port " + str(args.port))
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\nKeyboard interrupt received, exiting.")
+        finally:
+            httpd.server_close()
+        return 0
+
+    p_cache_dir = os.path.abspath(args.cache or os.path.join(args.dest, "downloads"))
+    systems = args.platform if args.command == "fetch" else [platform.system()]
+    for system in systems:
+        if system not in platforms:
+            print("ERROR: Unknown platform '" + system + "'")
+            return 1
+        try:
+            p_archive = fetch_artifact(args.version, archive_name(args.version, system), p_cache_dir, args.mirror, print_progress)
+            if args.command == "install":
+                print(install(p_archive, os.path.abspath(args.dest), app_path(args.version, system)))
+        except ToolchainError as e:
+            print("ERROR: " + str(e))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
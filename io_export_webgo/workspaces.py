@@ -0,0 +1,218 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Pool of private copies ("workspaces") of the Godot viewer project. Each
+# export job leases a workspace, writes its model.glb into it and lets Godot
+# import it into the workspace's own .godot import cache, so exports running
+# at the same time (several Blender instances, a batch export next to an
+# interactive user) do not overwrite each other's model and import cache.
+#
+# A workspace holds copies of the (small) project files only. The web template
+# in the viewer's export directory is not needed to build a pack and is used
+# from the add-on directly. Leases are OS file locks, which work across
+# processes and are released even if the holding process crashes. Released
+# workspaces are kept and reused, so their import caches stay warm. The least
+# recently used free workspaces are removed when all workspaces together use
+# more than max_disk_bytes.
+#
+# This module must not import bpy.
+
+import os
+import shutil
+import traceback
+from glob import escape as glob_escape
+
+from . import bundle_sync
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# Disk use of all workspaces together
+max_disk_bytes = 4 * 1024 * 1024 * 1024
+
+workspace_prefix = "ws_"
+lock_extension = ".lock"
+
+# Files of the viewer project private to each workspace: the exported model and its import settings
+private_files = ["model/model.glb", "model/model.glb.import"]
+
+
+def _try_lock(f):
+    '''Lock the open file f without blocking. Returns False if another lease holds the lock.'''
+    try:
+        if os.name == "nt":
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def dir_size(p_dir):
+    '''Bytes used by the files below p_dir.'''
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(p_dir):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class Workspace:
+    """A leased workspace. p_dir is the viewer project directory to export with."""
+
+    def __init__(self, pool, index, lock_file):
+        self.pool = pool
+        self.index = index
+        self.p_dir = pool.workspace_dir(index)
+        self.lock_file = lock_file
+
+    def release(self):
+        '''Give the workspace back to the pool. Its import cache is kept for the next lease.'''
+        if self.lock_file is None:
+            return
+        try:
+            # the lock file's modification time tells the least recently used workspace
+            os.utime(self.pool.lock_path(self.index))
+        except OSError:
+            pass
+        self.lock_file.close()
+        self.lock_file = None
+        try:
+            self.pool.prune()
+        except Exception:
+            traceback.print_exc()
+
+
+class WorkspacePool:
+    """Leases workspaces below p_root, each kept up to date with the viewer project in p_viewer_dir."""
+
+    def __init__(self, p_root, p_viewer_dir, max_bytes=max_disk_bytes):
+        self.p_root = p_root
+        self.p_viewer_dir = p_viewer_dir
+        self.max_bytes = max_bytes
+
+    def workspace_dir(self, index):
+        return os.path.join(self.p_root, workspace_prefix + str(index))
+
+    def lock_path(self, index):
+        return self.workspace_dir(index) + lock_extension
+
+    def indices(self):
+        '''Indices of the existing workspaces, most recently used first.'''
+        if not os.path.isdir(self.p_root):
+            return []
+        indices = []
+        for name in os.listdir(self.p_root):
+            if name.startswith(workspace_prefix) and name.endswith(lock_extension):
+                index = name[len(workspace_prefix):-len(lock_extension)]
+                if index.isdigit():
+                    indices.append(int(index))
+        indices.sort(key=lambda index: os.path.getmtime(self.lock_path(index)) if os.path.exists(self.lock_path(index)) else 0, reverse=True)
+        return indices
+
+    def _try_lease(self, index):
+        os.makedirs(self.p_root, exist_ok=True)
+        lock_file = open(self.lock_path(index), "a+b")
+        if not _try_lock(lock_file):
+            lock_file.close()
+            return None
+        return Workspace(self, index, lock_file)
+
+    def acquire(self, preferred=None):
+        '''Lease a free workspace (preferably the one with the given directory, then the most recently used one)
+        or create a new one. The workspace is brought up to date with the viewer project.'''
+        indices = self.indices()
+        candidates = [index for index in indices if preferred and self.workspace_dir(index) == preferred]
+        candidates += [index for index in indices if index not in candidates]
+        workspace = None
+        for index in candidates:
+            workspace = self._try_lease(index)
+            if workspace:
+                break
+        index = 0
+        while workspace is None:
+            if index not in indices:
+                workspace = self._try_lease(index)
+            index += 1
+        try:
+            self.update(workspace)
+        except Exception:
+            workspace.release()
+            raise
+        return workspace
+
+    def update(self, workspace):
+        '''Bring the project files of a (possibly new) workspace up to date with the viewer project.'''
+        p_dir = workspace.p_dir
+        if not os.path.isdir(p_dir):
+            os.makedirs(p_dir)
+            # start with the viewer's import cache (if any), so a new workspace does not import everything
+            p_import_cache = os.path.join(self.p_viewer_dir, ".godot")
+            if os.path.isdir(p_import_cache):
+                shutil.copytree(p_import_cache, os.path.join(p_dir, ".godot"))
+        for p_private in private_files:
+            p_src = os.path.join(self.p_viewer_dir, p_private)
+            p_dst = os.path.join(p_dir, p_private)
+            if os.path.isfile(p_src) and not os.path.exists(p_dst):
+                os.makedirs(os.path.dirname(p_dst), exist_ok=True)
+                shutil.copy2(p_src, p_dst)
+        # Godot may rewrite project files, so they are copied instead of hard-linked
+        exclude = [".godot/*", "export/*"] + private_files
+        bundle_sync.sync_tree(self.p_viewer_dir, p_dir, exclude=exclude, link=False)
+        # Files removed or renamed in the viewer project would otherwise stay in the pack (and its cache key)
+        # for good. Import settings Godot wrote next to the project's own files are kept.
+        keep = list(exclude)
+        for dirpath, dirnames, filenames in os.walk(self.p_viewer_dir):
+            dirnames[:] = [d for d in dirnames if dirpath != self.p_viewer_dir or d not in (".godot", "export")]
+            keep += [glob_escape(os.path.relpath(os.path.join(dirpath, filename), self.p_viewer_dir).replace(os.sep, "/")) + ".import" for filename in filenames]
+        for rel_path in bundle_sync.remove_extra_files(self.p_viewer_dir, p_dir, exclude=keep):
+            print("Removed '" + rel_path + "' from export workspace '" + p_dir + "', it is no longer part of the viewer project")
+
+    def prune(self):
+        '''Remove least recently used free workspaces until all workspaces use at most max_bytes.'''
+        indices = self.indices()
+        sizes = {index: dir_size(self.workspace_dir(index)) for index in indices}
+        total = sum(sizes.values())
+        for index in reversed(indices):
+            if total <= self.max_bytes:
+                break
+            if self._remove(index):
+                print("Removed export workspace '" + self.workspace_dir(index) + "' (" + str(sizes[index]) + " bytes)")
+                total -= sizes[index]
+
+    def clear(self):
+        '''Remove all free workspaces.'''
+        for index in self.indices():
+            self._remove(index)
+
+    def _remove(self, index):
+        '''Remove the workspace with the given index unless it is leased. Returns True if it was removed.'''
+        workspace = self._try_lease(index)
+        if workspace is None:
+            return False
+        shutil.rmtree(workspace.p_dir, ignore_errors=True)
+        # remove the lock file while still holding it, so nobody leases a half-removed workspace
+        try:
+            os.remove(self.lock_path(index))
+        except OSError:
+            pass
+        workspace.lock_file.close()
+        workspace.lock_file = None
+        return True